@@ -1,5 +1,7 @@
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import random
 import time
 from flask import Flask, request, jsonify
 import logging
@@ -17,6 +19,15 @@ HUGGINGFACE_API_KEY = os.environ.get("HUGGINGFACE_API_KEY", "hf_ScnWESBOLHtEXwKn
 PIXABAY_API_KEY = os.environ.get("PIXABAY_API_KEY", "49250214-ddbd8555d4f9b7ad81a28b8b0")
 SEMANTIC_SCHOLAR_BASE_URL = "https://api.semanticscholar.org/graph/v1"
 
+# One pooled keep-alive session for every external API call
+http = requests.Session()
+http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+HTTP_TIMEOUT = (5, 60)  # connect, read
+
+def backoff_delay(attempt, base=1.0, cap=16.0):
+    """Jittered exponential backoff, so retries of concurrent requests do not line up."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
 # Wildlife-related keywords as a Python set for fast lookup.
 wildlife_keywords_set = {
     "wildlife", "biodiversity", "conservation", "bird", "climate", "change", "endangered", "animals",
@@ -32,12 +43,12 @@ wildlife_keywords_set = {
 }
 
 def is_query_relevant(query, keywords_set):
-    """Return True if any keyword (or its singular form) from the set appears in the query."""
-    query_lower = query.lower()
+    """Return True if any keyword (or its singular form) from the set is a word of the query."""
+    words = set(re.findall(r"[a-z]+", query.lower()))
+    words |= {word[:-1] for word in words if word.endswith('s')}
     for keyword in keywords_set:
-        if keyword in query_lower:
-            return True
-        if keyword.endswith('s') and keyword[:-1] in query_lower:
+        keyword = keyword.lower()
+        if keyword in words or (keyword.endswith('s') and keyword[:-1] in words):
             return True
     return False
 
@@ -224,19 +235,6 @@ def get_tokens(text):
     """Convert text to lowercase tokens."""
     return re.findall(r'\w+', text.lower())
 
-def calculate_similarity(text1, text2):
-    """Calculate similarity between two texts using token overlap."""
-    tokens1 = set(get_tokens(text1))
-    tokens2 = set(get_tokens(text2))
-    
-    if not tokens1 or not tokens2:
-        return 0.0
-    
-    intersection = tokens1.intersection(tokens2)
-    union = tokens1.union(tokens2)
-    
-    return len(intersection) / len(union)
-
 def split_message_into_lines(message):
     """Split a message into lines while preserving sender information."""
     text = message['text']
@@ -250,28 +248,24 @@ def extract_relevant_context(query, chat_history, max_lines=10, similarity_thres
     if not chat_history:
         return ""
     
-    # Extract all lines from chat history
-    all_lines = []
-    for msg in chat_history:
-        all_lines.extend(split_message_into_lines(msg))
-    
-    # Calculate similarity scores for each line
+    # Extract all lines from chat history, tokenizing the query once
+    query_tokens = set(get_tokens(query))
     lines_with_scores = []
-    for sender, line in all_lines:
-        score = calculate_similarity(query, line)
-        lines_with_scores.append((score, sender, line))
+    for position, msg in enumerate(chat_history):
+        for sender, line in split_message_into_lines(msg):
+            line_tokens = set(get_tokens(line))
+            if not query_tokens or not line_tokens:
+                continue
+            score = len(query_tokens & line_tokens) / len(query_tokens | line_tokens)
+            lines_with_scores.append((score, position, sender, line))
     
     # Sort by similarity score and filter by threshold
     lines_with_scores = sorted(lines_with_scores, key=lambda x: x[0], reverse=True)
-    relevant_lines = [(sender, line) for score, sender, line in lines_with_scores if score > similarity_threshold][:max_lines]
+    relevant_lines = [x for x in lines_with_scores if x[0] > similarity_threshold][:max_lines]
     
     # Sort the selected lines by their original order
-    relevant_lines.sort(
-        key=lambda x: next(
-            i for i, msg in enumerate(chat_history) 
-            if x[1] in msg['text']
-        )
-    )
+    relevant_lines.sort(key=lambda x: x[1])
+    relevant_lines = [(sender, line) for score, position, sender, line in relevant_lines]
     
     # Format the context string with line breaks between different messages
     context_parts = []
@@ -323,7 +317,7 @@ def chat():
     }
     return jsonify(result)
 
-def query_huggingface(prompt, retries=3, delay=5):
+def query_huggingface(prompt, retries=3, delay=1):
     headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
     payload = {
         "inputs": prompt,
@@ -346,7 +340,12 @@ def query_huggingface(prompt, retries=3, delay=5):
 
     primary_model_url = "https://api-inference.huggingface.co/models/google/flan-ul2"
     for attempt in range(retries):
-        response = requests.post(primary_model_url, headers=headers, json=payload)
+        try:
+            response = http.post(primary_model_url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            logging.warning(f"Primary model request failed: {e}")
+            time.sleep(backoff_delay(attempt, delay))
+            continue
         logging.debug(f"Response from API (attempt {attempt + 1}):\nStatus: {response.status_code}\nHeaders: {dict(response.headers)}")
         
         if response.status_code == 200:
@@ -361,18 +360,19 @@ def query_huggingface(prompt, retries=3, delay=5):
             # If response is empty, log and retry once
             if attempt < retries - 1:
                 logging.warning("Received empty response from API. Retrying...")
-                time.sleep(delay)
+                time.sleep(backoff_delay(attempt, delay))
                 continue
             else:
                 return f"No answer generated for task. Please try rephrasing your question."
                 
         elif response.status_code == 503:
-            logging.warning(f"Primary model (FLAN-UL2) returned 503. Retrying in {delay} seconds...")
-            time.sleep(delay)
+            wait = backoff_delay(attempt, delay)
+            logging.warning(f"Primary model (FLAN-UL2) returned 503. Retrying in {wait:.1f} seconds...")
+            time.sleep(wait)
         elif response.status_code == 500 and "CUDA out of memory" in response.text:
             logging.warning("CUDA out of memory error encountered. Falling back to FLAN-T5-Large...")
             fallback_model_url = "https://api-inference.huggingface.co/models/google/flan-t5-large"
-            fallback_response = requests.post(fallback_model_url, headers=headers, json=payload)
+            fallback_response = http.post(fallback_model_url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
             
             if fallback_response.status_code == 200:
                 result = fallback_response.json()
@@ -389,7 +389,7 @@ def query_huggingface(prompt, retries=3, delay=5):
             logging.error(f"Fallback model (FLAN-T5-Large) error: {fallback_response.status_code} {fallback_response.text}")
             logging.info("Falling back further to FLAN-T5-Base...")
             second_fallback_model_url = "https://api-inference.huggingface.co/models/google/flan-t5-base"
-            second_fallback_response = requests.post(second_fallback_model_url, headers=headers, json=payload)
+            second_fallback_response = http.post(second_fallback_model_url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
             
             if second_fallback_response.status_code == 200:
                 result = second_fallback_response.json()
@@ -414,7 +414,7 @@ def query_semantic_scholar(query):
         "fields": "title,abstract,url"
     }
     url = f"{SEMANTIC_SCHOLAR_BASE_URL}/paper/search"
-    response = requests.get(url, params=params)
+    response = http.get(url, params=params, timeout=HTTP_TIMEOUT)
     if response.status_code == 200:
         data = response.json()
         if "data" not in data:
@@ -439,7 +439,7 @@ def query_pixabay(query):
         "per_page": 3
     }
     url = "https://pixabay.com/api/"
-    response = requests.get(url, params=params)
+    response = http.get(url, params=params, timeout=HTTP_TIMEOUT)
     try:
         data = response.json()
     except ValueError:
@@ -0,0 +1,179 @@
+"""
+Minimal stand-in for the Ollama HTTP API so the RAG stack can run without a GPU
+box or network. Embeddings are deterministic unit vectors seeded by a hash of the
+text and generation streams a fixed lorem-style answer word by word; every
+endpoint sleeps for a configurable delay to mimic model latency.
+
+    python -m benchmarks.fake_ollama --port 11434 --embed-delay-ms 20 --token-delay-ms 5
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER_WORDS = (
+    "Tiger populations in the surveyed reserves increased where prey density and "
+    "habitat connectivity were maintained, while human wildlife conflict remained "
+    "concentrated along forest edges with livestock grazing."
+).split()
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOllama:
+    def __init__(self, host="127.0.0.1", port=0, dim=1024, embed_delay_ms=0.0, first_token_delay_ms=0.0, token_delay_ms=0.0, num_tokens=40):
+        """
+        dim: embedding size, 1024 like bge-large.
+        embed_delay_ms: delay per embedding request.
+        first_token_delay_ms / token_delay_ms: prompt processing and per token generation delay.
+        num_tokens: words in every generated answer.
+        """
+        self.dim = dim
+        self.embed_delay = embed_delay_ms / 1000
+        self.first_token_delay = first_token_delay_ms / 1000
+        self.token_delay = token_delay_ms / 1000
+        self.num_tokens = num_tokens
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tokens(self):
+        return [
+            ANSWER_WORDS[i % len(ANSWER_WORDS)] + ("" if i == self.num_tokens - 1 else " ")
+            for i in range(self.num_tokens)
+        ]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _json(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    data = json.dumps(chunk).encode() + b"\n"
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                fake.requests += 1
+                if self.path == "/api/tags":
+                    return self._json({"models": []})
+                self._json({"error": f"unknown path {self.path}"}, status=404)
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                fake.requests += 1
+                body = self._body()
+                model = body.get("model", "fake")
+                if self.path == "/api/embed":
+                    texts = body.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    time.sleep(fake.embed_delay)
+                    return self._json({"model": model, "embeddings": [fake_embedding(t, fake.dim) for t in texts]})
+                if self.path == "/api/embeddings":
+                    time.sleep(fake.embed_delay)
+                    return self._json({"embedding": fake_embedding(body.get("prompt", ""), fake.dim)})
+                if self.path == "/api/show":
+                    return self._json({"model_info": {"general.architecture": "gemma3", "gemma3.context_length": 8192}})
+                if self.path in ("/api/chat", "/api/generate"):
+                    return self._generate(model, body, chat=self.path == "/api/chat")
+                self._json({"error": f"unknown path {self.path}"}, status=404)
+
+            def _generate(self, model, body, chat):
+                def chunk(text, done):
+                    payload = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+                    if chat:
+                        payload["message"] = {"role": "assistant", "content": text}
+                    else:
+                        payload["response"] = text
+                    if done:
+                        payload.update(done_reason="stop", prompt_eval_count=0, eval_count=fake.num_tokens)
+                    return payload
+
+                tokens = fake.tokens()
+                time.sleep(fake.first_token_delay)
+                if not body.get("stream", True):
+                    time.sleep(fake.token_delay * len(tokens))
+                    return self._json(chunk("".join(tokens), True))
+
+                def chunks():
+                    for token in tokens:
+                        yield chunk(token, False)
+                        time.sleep(fake.token_delay)
+                    yield chunk("", True)
+
+                self._stream(chunks())
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--embed-delay-ms", type=float, default=0.0)
+    parser.add_argument("--first-token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--num-tokens", type=int, default=40)
+    args = parser.parse_args()
+    server = FakeOllama(args.host, args.port, args.dim, args.embed_delay_ms, args.first_token_delay_ms, args.token_delay_ms, args.num_tokens)
+    print(f"Fake Ollama listening on {server.base_url}")
+    server._server.serve_forever()
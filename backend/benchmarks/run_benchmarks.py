@@ -0,0 +1,298 @@
+"""
+Offline per-stage latency benchmark of WildLifeRAG.
+
+Runs the real RAG stack on one machine without network: Qdrant in qdrant-client's
+local in-memory mode, Ollama replaced by benchmarks.fake_ollama, and a small
+synthetic PDF corpus ingested through `ingestion_pipeline`. The cross-encoder,
+ColBERT and SPLADE models must already be in the Hugging Face cache, the run sets
+HF_HUB_OFFLINE=1.
+
+Every stage is timed on its own over the same queries, its inputs come from the
+previous stage: embed, sparse_encode, hybrid_search, sbert_rerank, colbert_rerank,
+synthesis, and end_to_end (`retrive` on unseen queries, so every cache misses).
+Memory is measured in a separate traced call per stage (tracemalloc peak of
+Python allocations) and as growth of the process max RSS over the stage.
+
+    cd backend
+    python -m benchmarks.run_benchmarks --output benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.fake_ollama import FakeOllama
+
+STAGES = ["embed", "sparse_encode", "hybrid_search", "sbert_rerank", "colbert_rerank", "synthesis", "end_to_end"]
+PERCENTILES = (50, 95, 99)
+
+SPECIES = ["tiger", "leopard", "asian elephant", "snow leopard", "gaur", "dhole", "sloth bear", "one-horned rhinoceros", "great hornbill", "gharial"]
+REGIONS = ["the Western Ghats", "the Terai Arc", "Sundarbans", "central India", "the Eastern Himalaya", "Kaziranga", "the Deccan plateau"]
+THREATS = ["habitat fragmentation", "poaching", "livestock grazing", "road traffic", "retaliatory killing", "forest fires", "mining"]
+MEASURES = ["camera trapping", "occupancy surveys", "radio telemetry", "line transects", "genetic sampling", "community interviews"]
+OUTCOMES = ["increased", "declined", "remained stable", "shifted towards forest edges", "recovered slowly"]
+
+
+def synthetic_paragraph(rng: random.Random, sentences=6) -> str:
+    templates = [
+        "{species} populations in {region} {outcome} between {y1} and {y2} according to {measure}.",
+        "The main threat to {species} in {region} was {threat}, reported in {n} percent of villages.",
+        "Using {measure}, the team estimated {n} individuals of {species} across {k} sampling units.",
+        "Conflict with {species} was linked to {threat} and {threat2}, especially during the dry season.",
+        "Protected corridors reduced {threat} and {species} occupancy {outcome} within {k} years.",
+    ]
+    text = []
+    for _ in range(sentences):
+        y1 = rng.randint(1990, 2015)
+        sentence = rng.choice(templates).format(
+            species=rng.choice(SPECIES), region=rng.choice(REGIONS), outcome=rng.choice(OUTCOMES),
+            measure=rng.choice(MEASURES), threat=rng.choice(THREATS), threat2=rng.choice(THREATS),
+            y1=y1, y2=y1 + rng.randint(2, 10), n=rng.randint(5, 95), k=rng.randint(3, 60),
+        )
+        text.append(sentence[0].upper() + sentence[1:])
+    return " ".join(text)
+
+
+def build_corpus(folder: str, num_docs: int, pages_per_doc: int, seed: int) -> int:
+    """Write `num_docs` titled PDFs of synthetic wildlife survey text, returns the page count."""
+    import pymupdf
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    for d in range(num_docs):
+        pdf = pymupdf.open()
+        pdf.set_metadata({"title": f"Synthetic {rng.choice(SPECIES)} survey {d:03d}"})
+        for _ in range(pages_per_doc):
+            page = pdf.new_page()
+            text = "\n\n".join(synthetic_paragraph(rng) for _ in range(5))
+            page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=9)
+        pdf.save(os.path.join(folder, f"survey_{d:03d}.pdf"))
+        pdf.close()
+    return num_docs * pages_per_doc
+
+
+def synthetic_queries(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    forms = [
+        "How did {species} populations change in {region}?",
+        "What threatens {species} in {region}?",
+        "Which methods were used to survey {species}?",
+        "How does {threat} affect {species}?",
+    ]
+    return [
+        rng.choice(forms).format(species=rng.choice(SPECIES), region=rng.choice(REGIONS), threat=rng.choice(THREATS))
+        + f" ({i})"
+        for i in range(n)
+    ]
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def max_rss_kb() -> int:
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(fn, inputs: list, warmup: int) -> tuple:
+    """Run fn over inputs, timing all but the first `warmup` calls. Returns (stats, outputs)."""
+    rss_before = max_rss_kb()
+    outputs, timings = [], []
+    for i, item in enumerate(inputs):
+        start = time.perf_counter()
+        outputs.append(fn(item))
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    rss_growth = max_rss_kb() - rss_before
+
+    # tracing slows allocations down, so memory gets its own call outside the timings
+    tracemalloc.start()
+    fn(inputs[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = {"n": len(timings), "mean_ms": round(sum(timings) / len(timings), 3)}
+    for p in PERCENTILES:
+        stats[f"p{p}_ms"] = round(percentile(timings, p), 3)
+    stats["tracemalloc_peak_kb"] = round(peak / 1024, 1)
+    stats["max_rss_growth_kb"] = rss_growth
+    return stats, outputs
+
+
+def configure_environment(workdir: str, ollama_url: str) -> None:
+    # read by BaseRAG / WildLifeRAG at import time
+    os.environ["OLLAMA_BASE_URL"] = ollama_url
+    os.environ["QDRANT_LOCATION"] = ":memory:"
+    os.environ["RAG_DATA_DIR"] = os.path.join(workdir, "data")
+    os.environ["WILDLIFE_DOCS_ROOT"] = os.path.join(workdir, "docs")
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+
+def run(args) -> dict:
+    from llama_index.core.schema import NodeWithScore, QueryBundle
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="wildbot-bench-")
+    fake = FakeOllama(
+        embed_delay_ms=args.embed_delay_ms,
+        first_token_delay_ms=args.first_token_delay_ms,
+        token_delay_ms=args.token_delay_ms,
+        num_tokens=args.num_tokens,
+    ).start()
+    try:
+        configure_environment(workdir, fake.base_url)
+        from src.RAGs.WildLifeRAG import WildLifeRAG
+
+        rag = WildLifeRAG()
+        pages = build_corpus(rag.docs_folder_path, args.docs, args.pages, args.seed)
+        # the streaming mode keeps everything in this process, the batch mode spawns workers
+        ingestion = rag.ingestion_pipeline(streaming=True)
+
+        queries = synthetic_queries(args.queries + args.warmup, args.seed)
+        stages = {}
+
+        stages["embed"], embeddings = measure(rag.embed_model.embed_model.get_query_embedding, queries, args.warmup)
+        stages["sparse_encode"], _ = measure(lambda q: rag.sparse_query_encoder.encoder([q]), queries, args.warmup)
+
+        # the retriever's own sparse encoding is a cache hit, so only the search is timed
+        rag.sparse_query_encoder(queries)
+        bundles = [QueryBundle(query_str=q, embedding=e) for q, e in zip(queries, embeddings)]
+        stages["hybrid_search"], retrieved = measure(rag.retriever.retrieve, bundles, args.warmup)
+
+        def copies(nodes):
+            # rerankers overwrite scores in place
+            return [NodeWithScore(node=n.node, score=n.score) for n in nodes]
+
+        pairs = list(zip(retrieved, bundles))
+        stages["sbert_rerank"], sbert_nodes = measure(
+            lambda pair: rag.sbert_reranker.postprocess_nodes(copies(pair[0]), query_bundle=pair[1]), pairs, args.warmup
+        )
+        pairs = list(zip(sbert_nodes, bundles))
+        stages["colbert_rerank"], colbert_nodes = measure(
+            lambda pair: rag.colbert_reranker.postprocess_nodes(copies(pair[0]), query_bundle=pair[1]), pairs, args.warmup
+        )
+        pairs = list(zip(colbert_nodes, bundles))
+        stages["synthesis"], _ = measure(
+            lambda pair: rag.response_synthesizer.synthesize(pair[1], nodes=pair[0]), pairs, args.warmup
+        )
+
+        def end_to_end(query):
+            rag.answer_cache.clear()
+            return rag.retrive(query)
+
+        cold_queries = synthetic_queries(args.queries + args.warmup, args.seed + 1)
+        cold_queries = [f"{q} [cold]" for q in cold_queries]
+        stages["end_to_end"], _ = measure(end_to_end, cold_queries, args.warmup)
+    finally:
+        fake.stop()
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workdir": workdir,
+            "config": {
+                "docs": args.docs,
+                "pages_per_doc": args.pages,
+                "pages": pages,
+                "queries": args.queries,
+                "warmup": args.warmup,
+                "seed": args.seed,
+                "embed_delay_ms": args.embed_delay_ms,
+                "first_token_delay_ms": args.first_token_delay_ms,
+                "token_delay_ms": args.token_delay_ms,
+                "num_tokens": args.num_tokens,
+            },
+        },
+        "ingestion": {k: v for k, v in ingestion.items() if k not in ("new", "changed", "deleted")},
+        "stages": stages,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Latency percentiles that grew by more than `tolerance` (and `min_delta_ms`) over the baseline."""
+    regressions = []
+    for stage, stats in result["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base is None:
+            continue
+        for p in PERCENTILES:
+            key = f"p{p}_ms"
+            current, previous = stats[key], base.get(key)
+            if previous is None:
+                continue
+            if current > previous * (1 + tolerance) and current - previous > min_delta_ms:
+                regressions.append(f"{stage} {key}: {previous:.2f} -> {current:.2f} ({current / previous - 1:+.0%})")
+    return regressions
+
+
+def print_table(result: dict) -> None:
+    header = f"{'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KB':>12}{'rss+ KB':>10}"
+    print(header)
+    print("-" * len(header))
+    for stage in STAGES:
+        s = result["stages"][stage]
+        print(f"{stage:<16}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}"
+              f"{s['tracemalloc_peak_kb']:>12.1f}{s['max_rss_growth_kb']:>10}")
+    ing = result["ingestion"]
+    print(f"\ningestion: {ing['nodes_inserted']} nodes from {ing['documents_parsed']} pages "
+          f"in {ing['seconds']}s ({ing['chunks_per_second']} chunks/sec)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=8, help="synthetic PDFs in the corpus")
+    parser.add_argument("--pages", type=int, default=4, help="pages per PDF")
+    parser.add_argument("--queries", type=int, default=30, help="timed queries per stage")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed calls per stage")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--embed-delay-ms", type=float, default=0.0, help="fake Ollama delay per embedding request")
+    parser.add_argument("--first-token-delay-ms", type=float, default=0.0, help="fake Ollama delay before the first token")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="fake Ollama delay per generated token")
+    parser.add_argument("--num-tokens", type=int, default=40, help="tokens in every fake answer")
+    parser.add_argument("--workdir", help="data and docs directory, a fresh temp dir by default")
+    parser.add_argument("--output", help="write the results as JSON, e.g. a new baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative latency growth")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore growth below this many ms")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print_table(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("config") != result["meta"]["config"]:
+            print("\nWarning: baseline was recorded with a different configuration")
+        regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%} tolerance:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,25 +3,51 @@ from llama_index.core import Settings
 from llama_index.core import VectorStoreIndex
 from llama_index.core import Settings
 from llama_index.vector_stores.qdrant import QdrantVectorStore
+from llama_index.vector_stores.qdrant.utils import default_sparse_encoder, fastembed_sparse_encoder
 from qdrant_client import QdrantClient
-from llama_index.llms.ollama import Ollama
-from llama_index.core.postprocessor import SentenceTransformerRerank
 # from llama_index.embeddings.fastembed import FastEmbedEmbedding
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.postprocessor.colbert_rerank import ColbertRerank
-from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
+from src.utils.semantic_cache import SemanticCache
+from src.utils.persistent_cache import PersistentLRUCache
+from src.utils.embedding_cache import CachedEmbedding, CachedSparseEncoder
+from src.utils.rerankers import CrossEncoderRerank, LateInteractionRerank, RerankCascade
+from src.utils.llm_tokens import instrument_llm_tokens
+from src.utils.model_clients import build_embedding_model, build_llm
+from src.utils.qdrant_collection import (
+    LEGACY_SPARSE_DOC_MODEL,
+    LEGACY_SPARSE_QUERY_MODEL,
+    LEGACY_SPARSE_VECTOR_NAME,
+    AsyncTunedQdrantClient,
+    CollectionProfile,
+    TunedQdrantClient,
+    ensure_collection,
+)
+import os
+import time
 
 ## this need to be updated
 from src.utils.logger import get_logger
 logger = get_logger(__name__)
 
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://host.docker.internal:11434")
+QDRANT_HOST = os.environ.get("QDRANT_HOST", "qdrant")
+QDRANT_PORT = int(os.environ.get("QDRANT_PORT", 6333))
+# ":memory:" or a directory runs qdrant-client in local mode (no server, sync client only)
+QDRANT_LOCATION = os.environ.get("QDRANT_LOCATION")
+RAG_DATA_DIR = os.environ.get("RAG_DATA_DIR", "/app/data")
+
 
 class BaseRAG:
     def __init__(self, docs_folder_path, folder_name) -> None:
         self.docs_folder_path = docs_folder_path
         self.folder_name = folder_name
-        self.doc_pipeline_store_path = "/app/data/pipeline_storage"
+        self.doc_pipeline_store_path = os.path.join(RAG_DATA_DIR, "pipeline_storage")
+        # set to None to keep the query embedding cache in memory only
+        self.embedding_cache_path = os.path.join(RAG_DATA_DIR, "embedding_cache.sqlite")
+        self.sparse_model_name = "prithvida/Splade_PP_en_v1"
+        # (version, mtime of the version file) as last read
+        self._collection_version = (None, None)
 
+        self.embedding_cache = self.get_embedding_cache()
         self.embed_model = self.get_embedding_model()
         self.llm = self.get_llm()
         self.vector_store = self.get_vector_store()
@@ -31,29 +57,41 @@ class BaseRAG:
 
         Settings.embed_model = self.embed_model
         Settings.llm = self.llm
+        # token counts for /metrics come from llama-index events, not from the tracer
+        instrument_llm_tokens()
+
+    def get_embedding_cache(self, max_size=10000):
+        # dense and sparse query vectors share one store, keys include the model name
+        embedding_cache = PersistentLRUCache(
+            max_size=max_size,
+            path=self.embedding_cache_path,
+            table="query_embeddings",
+        )
+        return embedding_cache
 
     def get_embedding_model(self, model_name="BAAI/bge-small-en-v1.5"):
         # embed_model = FastEmbedEmbedding(
         #     model_name=model_name, cache_dir="./data/fastembeded/"
         # )
-        embed_model = OllamaEmbedding(
+        # pooled, retried and circuit-broken client shared by every model of the server
+        embed_model = build_embedding_model(
             model_name="bge-large:latest",
-            base_url="http://host.docker.internal:11434",
+            base_url=OLLAMA_BASE_URL,
             ollama_additional_kwargs={"mirostat": 0},
         )
-        return embed_model
+        return CachedEmbedding(embed_model, cache=self.embedding_cache)
 
     def get_llm(
         self,
         model="gemma3:4b-it-q8_0",
-        request_timeout=3000,
         temperature=0.0,
         stream=False,
     ):
-        llm = Ollama(
-            base_url="http://host.docker.internal:11434",
+        # the request deadline comes from LLM_DEADLINE_SECONDS, OLLAMA_FALLBACK_MODEL takes over when
+        # gemma keeps failing
+        llm = build_llm(
+            base_url=OLLAMA_BASE_URL,
             model=model,
-            request_timeout=request_timeout,
             temperature=temperature,
             additional_kwargs={"seed": 42, "num_ctx": 32768},
             stream=stream,
@@ -65,11 +103,15 @@ class BaseRAG:
         name="cross-encoder/ms-marco-MiniLM-L-2-v2",
         top_n=5,
         keep_retrieval_score=True,
+        backend="torch",
+        file_name=None,
     ):
-        sbert_rerank = SentenceTransformerRerank(
+        sbert_rerank = CrossEncoderRerank(
             model=name,
             top_n=top_n,
             keep_retrieval_score=keep_retrieval_score,
+            backend=backend,
+            file_name=file_name,
         )
         return sbert_rerank
     
@@ -77,12 +119,14 @@ class BaseRAG:
         self,
         top_n=5,
         keep_retrieval_score=True,
+        backend="torch",
     ):
-        colbert_reranker = ColbertRerank(
+        colbert_reranker = LateInteractionRerank(
             top_n=top_n,
             model="colbert-ir/colbertv2.0",
             tokenizer="colbert-ir/colbertv2.0",
             keep_retrieval_score=keep_retrieval_score,
+            backend=backend,
         )
         return colbert_reranker
     
@@ -90,25 +134,126 @@ class BaseRAG:
         self,
         top_n=5,
     ):
+        # FlagEmbedding is a heavy import and only needed when this reranker is used
+        from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
+
         flag_reranker = FlagEmbeddingReranker(model="BAAI/bge-reranker-large", top_n=top_n, use_fp16=True)
 
         return flag_reranker
 
+    def get_reranker_cascade(
+        self,
+        stages,
+        top_n=5,
+        # cross-encoder scores are sigmoid probabilities in [0, 1]
+        early_exit_margin=0.2,
+    ):
+        reranker_cascade = RerankCascade(
+            stages=stages,
+            top_n=top_n,
+            early_exit_margin=early_exit_margin,
+        )
+        return reranker_cascade
+
+    def get_answer_cache(
+        self,
+        max_size=512,
+        ttl_seconds=3600,
+        similarity_threshold=0.95,
+    ):
+        answer_cache = SemanticCache(
+            max_size=max_size,
+            ttl_seconds=ttl_seconds,
+            similarity_threshold=similarity_threshold,
+        )
+        return answer_cache
+
+    @property
+    def collection_version_path(self):
+        return os.path.join(self.doc_pipeline_store_path, f"{self.folder_name}.version")
+
+    def get_collection_version(self):
+        """
+        Version stamp of the collection, changes whenever ingestion modifies it. Kept
+        in memory, the file is only read again when its mtime changed (an ingestion
+        run by another process).
+        """
+        try:
+            mtime = os.stat(self.collection_version_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        version, read_mtime = self._collection_version
+        if mtime != read_mtime:
+            try:
+                with open(self.collection_version_path) as f:
+                    version = f.read().strip()
+            except FileNotFoundError:
+                version = None
+            self._collection_version = (version, mtime)
+        return version
+
+    def bump_collection_version(self):
+        version = str(time.time_ns())
+        os.makedirs(self.doc_pipeline_store_path, exist_ok=True)
+        with open(self.collection_version_path, "w") as f:
+            f.write(version)
+        self._collection_version = (version, os.stat(self.collection_version_path).st_mtime_ns)
+        logger.info(f"Collection {self.folder_name} version bumped to {version}")
+        return version
+
     @abstractmethod
     def ingestion_pipeline(self):
         pass
 
     def get_vector_store(self):
-        client = QdrantClient(host="qdrant", port=6333)
-        # aclient = AsyncQdrantClient(host="qdrant", port=6333)
+        # quantization, on-disk storage, HNSW and search ef, see CollectionProfile for the env vars
+        self.collection_profile = CollectionProfile.from_env()
+        search_params = self.collection_profile.search_params()
+        # the collection is created here rather than by QdrantVectorStore so it gets the profile's settings
+        if QDRANT_LOCATION:
+            # a second local client would open a separate store, so the async path is unavailable
+            # (local mode is brute force, HNSW and quantization do not apply)
+            client, aclient = QdrantClient(location=QDRANT_LOCATION), None
+            dense_vector_name, sparse_vector_name = ensure_collection(client, self.folder_name, self.collection_profile)
+        else:
+            dense_vector_name, sparse_vector_name = ensure_collection(
+                QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT), self.folder_name, self.collection_profile
+            )
+            client = TunedQdrantClient(
+                host=QDRANT_HOST, port=QDRANT_PORT, search_params=search_params, dense_vector_name=dense_vector_name
+            )
+            aclient = AsyncTunedQdrantClient(
+                host=QDRANT_HOST, port=QDRANT_PORT, search_params=search_params, dense_vector_name=dense_vector_name
+            )
+
+        if sparse_vector_name == LEGACY_SPARSE_VECTOR_NAME:
+            # indexed with llama-index's old default encoder, Splade_PP vectors would not match it
+            logger.warning(
+                f"Collection {self.folder_name} has the legacy {sparse_vector_name!r} vector, "
+                f"using {LEGACY_SPARSE_QUERY_MODEL}; re-ingest into a new collection to move to {self.sparse_model_name}"
+            )
+            sparse_doc_fn = default_sparse_encoder(LEGACY_SPARSE_DOC_MODEL)
+            sparse_query_fn = default_sparse_encoder(LEGACY_SPARSE_QUERY_MODEL)
+            sparse_query_model = LEGACY_SPARSE_QUERY_MODEL
+        else:
+            sparse_doc_fn = sparse_query_fn = fastembed_sparse_encoder(model_name=self.sparse_model_name)
+            sparse_query_model = self.sparse_model_name
+        self.sparse_query_encoder = CachedSparseEncoder(
+            sparse_query_fn, cache=self.embedding_cache, model_name=sparse_query_model
+        )
 
         # create our vector store with hybrid indexing enabled
         # batch_size controls how many nodes are encoded with sparse vectors at once
         vector_store = QdrantVectorStore(
             self.folder_name,
             client=client,
+            aclient=aclient,
             enable_hybrid=True,
             batch_size=4,
+            sparse_doc_fn=sparse_doc_fn,
+            sparse_query_fn=self.sparse_query_encoder,
+            dense_vector_name=dense_vector_name,
+            sparse_vector_name=sparse_vector_name,
         )
         return vector_store
 
@@ -7,111 +7,587 @@ from llama_index.core import SimpleDirectoryReader
 from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.storage.docstore import SimpleDocumentStore
-from llama_index.core import Settings
+from llama_index.core.schema import QueryBundle, MetadataMode
+from llama_index.core.response_synthesizers import get_response_synthesizer
+from llama_index.core.base.response.schema import Response
+import logging
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from llama_index.core import PromptTemplate
 # from src.utils.contextual_extractor import ChunkContextualExtractor
 from src.utils.DocumentParser import PDF4LLMReader
+from src.utils.micro_batcher import MicroBatcher
+from src.utils.file_manifest import FileManifest
+from src.utils.streaming_pipeline import StreamingPipeline, Stage
+from src.utils.memory import adaptive_batch_size
+from src.utils.sqlite_docstore import SqliteDocumentStore
+from src.utils.context_packing import ContextPacker
+from src.utils.structured_answer import analyze_query_type, format_sections, section_header, structured_sections
+from src.utils.metrics import (
+    LLM_GENERATION_SECONDS,
+    LLM_TIME_TO_FIRST_TOKEN,
+    RAG_IN_PROGRESS,
+    RAG_QUERIES,
+    STAGE_SECONDS,
+    record_ingestion,
+    timed,
+)
+
+# SPLADE keeps (tokens x vocab) fp32 logits per text: 512 * 30522 * 4 bytes
+SPLADE_BYTES_PER_ITEM = 512 * 30522 * 4
+
+global_template_4 = """You are an expert on the provided documents concerning wildlife conservation, human-wildlife interactions, and ecological research. 
+        Your task is to answer the following question using only the information contained within these documents. 
+        Provide a comprehensive and insightful response, drawing on specific details and explanations from the text. 
+        Do not include any information that is not explicitly mentioned in the provided documents.
+        Use the following context to answer the question:
+        ----------------------
+        {context_str}
+        ----------------------
+
+        Given the context information, answer the query: {query_str}"""
+global_template_3 = """
+        Respond with only the context provided and not prior knowledge. The context might have jumbled information and some of the information might be irrelevant. Judge the context and provide the answer. 
+        ----------------------
+        {context_str}
+        ----------------------
+
+
+        Given the context information, answer the query: {query_str}
+        """
+condense_template = """Given the relevant part of a conversation and a follow-up question, rewrite the follow-up question as a standalone question that keeps every detail needed to search the documents. Return only the question.
+
+        Conversation:
+        {chat_history}
+
+        Follow-up question: {question}
+        Standalone question:"""
+section_template = """You are an AI assistant specializing in Indian wildlife and conservation science. Provide a focused, evidence-based response using only the information in the context below.
+        ----------------------
+        {context_str}
+        ----------------------
+
+        {task_prompt}"""
 
 class WildLifeRAG(BaseRAG):
     def __init__(self) -> None:
         self.folder_name = "wlidlife_research_papers"
-        self.docs_folder_path = os.path.join("/app/src/docs/", self.folder_name) ## this need to be changed 
+        self.docs_folder_path = os.path.join(os.environ.get("WILDLIFE_DOCS_ROOT", "/app/src/docs/"), self.folder_name) ## this need to be changed 
         super().__init__(self.docs_folder_path, self.folder_name)
-        self.sbert_reranker = self.get_sbert_reranker(top_n=8)
+        self.ingest_exts = [".pdf", ".docx"]
+        self.manifest_path = os.path.join(self.doc_pipeline_store_path, f"{self.folder_name}_manifest.json")
+        self.docstore_path = os.path.join(self.doc_pipeline_store_path, f"{self.folder_name}_docstore.sqlite")
+        self.pdf_reader = PDF4LLMReader(pages_per_task=16, file_timeout=600)
+        self.sbert_reranker = self.get_sbert_reranker(top_n=8, backend="onnx", file_name="onnx/model.onnx")
         self.colbert_reranker = self.get_colbert_reranker(top_n=5)
+        # colbert is skipped when the cross-encoder already separates the top 5 clearly
+        self.reranker = self.get_reranker_cascade(
+            [self.sbert_reranker, self.colbert_reranker], top_n=5
+        )
+        # reranking is CPU bound (torch releases the GIL), keep it off the event loop
+        self.rerank_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rerank")
 
-    def ingestion_pipeline(self):
+        # concurrent requests share model calls: query embedding, sparse encoding and
+        # reranking are collected for a few ms and run as one batch
+        self.embed_model.enable_batching(max_batch_size=32, max_wait_ms=5)
+        self.sparse_query_encoder.enable_batching(max_batch_size=32, max_wait_ms=5)
+        self.rerank_batcher = MicroBatcher(
+            self.reranker.postprocess_batch,
+            max_batch_size=8,
+            max_wait_ms=10,
+            executor=self.rerank_executor,
+            max_concurrent_batches=2,
+            name="rerank",
+        )
+
+        # built once: the retriever only does embedding + hybrid search, reranking and
+        # synthesis are driven explicitly in retrive so each stage runs a single time
+        self.retriever = self.index.as_retriever(
+            similarity_top_k=20,
+            sparse_top_k=20,
+            hybrid_top_k=10,
+            vector_store_query_mode="hybrid",
+        )
+        # adjacent chunks share 100 tokens of overlap, merge them and cap the prompt context
+        self.context_packer = ContextPacker(token_budget=1536, compress=False, embed_model=self.embed_model)
+        self.text_qa_template = PromptTemplate(global_template_4)
+        self.condense_template = PromptTemplate(condense_template)
+        self.section_template = PromptTemplate(section_template)
+        self.response_synthesizer = get_response_synthesizer(
+            llm=self.llm,
+            text_qa_template=self.text_qa_template,
+        )
+        self.answer_cache = self.get_answer_cache()
+
+    def ingestion_pipeline(
+        self,
+        streaming=False,
+        embed_batch_size=64,
+        embed_inflight=4,
+        upsert_workers=2,
+        docstore_backend="sqlite",
+    ):
+        """
+        Incrementally sync the docs folder into the collection. Only new or changed
+        files (per the file manifest) are parsed, split and embedded; points of
+        changed and deleted files are purged first. With `streaming`, parsing,
+        splitting, embedding and upserts overlap through bounded queues instead of
+        loading every document first, with `embed_inflight` concurrent dense
+        embedding requests and `upsert_workers` concurrent upserts.
+        `docstore_backend` "sqlite" keeps the dedup state in a disk-backed docstore
+        with per-document reads and writes, "simple" uses the JSON
+        SimpleDocumentStore that is loaded and persisted as a whole. Returns a run
+        summary.
+        """
         logger.info(
             f"self.vector_store.collection_name {self.vector_store.collection_name}"
         )
-        reader = SimpleDirectoryReader(
-            input_dir=self.docs_folder_path, required_exts=[".pdf", ".docx"], file_extractor={".pdf": PDF4LLMReader(), }
+        manifest = FileManifest(self.manifest_path)
+        diff = manifest.scan(self.docs_folder_path, self.ingest_exts)
+        logger.info(
+            f"Manifest scan of {self.docs_folder_path}: {len(diff.new)} new, {len(diff.changed)} changed, "
+            f"{len(diff.unchanged)} unchanged, {len(diff.deleted)} deleted"
         )
-        logger.info(f"Loading data from {self.docs_folder_path}")
-        docs = reader.load_data()
 
+        text_splitter = SentenceSplitter(chunk_size=350, chunk_overlap=100)
+        use_sqlite = docstore_backend == "sqlite"
         pipeline = IngestionPipeline(
             name = f"{self.folder_name}_ingestion_pipeline",
             project_name="WILDLIFE_RESEARCH",
             transformations=[
-                SentenceSplitter(chunk_size=350, chunk_overlap=100),
+                text_splitter,
                 # ChunkContextualExtractor(metadata_name="chunk_context"),
                 self.embed_model
             ],
-            docstore=SimpleDocumentStore(),
-            vector_store=self.vector_store
+            docstore=self.get_sqlite_docstore() if use_sqlite else SimpleDocumentStore(),
+            vector_store=self.vector_store,
+            # the docstore already skips unchanged documents, the transformation cache would
+            # only hold every node and embedding in memory
+            disable_cache=use_sqlite,
         )
 
-        if os.path.exists(self.doc_pipeline_store_path):
+        if not use_sqlite and os.path.exists(self.doc_pipeline_store_path):
             logger.info("Loading existing pipeline...")
             pipeline.load(self.doc_pipeline_store_path, docstore_name=self.folder_name)
 
-        _ = pipeline.run(documents=docs, in_place=False, num_workers=2, show_progress=True)
+        purged_doc_ids = self.purge_files(manifest, diff.to_purge, pipeline.docstore)
 
-        pipeline.persist(self.doc_pipeline_store_path, docstore_name=self.folder_name)
+        # dense texts per Ollama request; the vector store sparse-encodes and upserts in
+        # chunks of batch_size, sized to the memory SPLADE's per-token vocab logits need
+        self.embed_model.embed_batch_size = embed_batch_size
+        self.vector_store.batch_size = adaptive_batch_size(
+            SPLADE_BYTES_PER_ITEM, minimum=4, maximum=64
+        )
+        logger.info(
+            f"Ingestion batching: {embed_batch_size} texts per embedding request, "
+            f"sparse/upsert batch size {self.vector_store.batch_size}"
+        )
 
-    def retrive(self, query: str):
-        Settings.embed_model = self.embed_model
-        Settings.llm = self.llm
+        started = time.perf_counter()
+        file_doc_ids = {}
+        file_documents = self.iter_file_documents(diff.to_ingest, file_doc_ids)
+        stage_stats = None
+        if streaming:
+            stage_stats = self.streaming_ingestion(
+                file_documents,
+                text_splitter,
+                pipeline.docstore,
+                nodes_per_batch=embed_batch_size,
+                embed_workers=embed_inflight,
+                upsert_workers=upsert_workers,
+            )
+            documents_parsed = stage_stats["parse"]["units"]
+            nodes_inserted = stage_stats["upsert"]["units"]
+        else:
+            docs = [doc for _, docs in file_documents for doc in docs]
+            nodes = pipeline.run(documents=docs, in_place=False, num_workers=2, show_progress=True) if docs else []
+            documents_parsed, nodes_inserted = len(docs), len(nodes)
+        elapsed = time.perf_counter() - started
+        for path in self.pdf_reader.failed_files:
+            # parsed pages are still ingested, the file is retried on the next run
+            file_doc_ids.pop(path, None)
 
-        rr = self.index.as_retriever(
-            similarity_top_k=20,
-            sparse_top_k=20,
-            hybrid_top_k = 10,
-            vector_store_query_mode="hybrid",
-            node_postprocessors=[self.sbert_reranker, self.colbert_reranker],
-            llm=self.llm,
-        )
+        if not use_sqlite:
+            pipeline.persist(self.doc_pipeline_store_path, docstore_name=self.folder_name)
+        for path, doc_ids in file_doc_ids.items():
+            manifest.record(path, diff.fingerprints[path], doc_ids)
+        for path in diff.deleted:
+            manifest.remove(path)
+        manifest.save()
 
-        text = ""
-        for r in rr.retrieve(query):
-            text += r.text + "\n===========================================\n"
-        logger.debug(f"Retrieved text: {text}")
+        if nodes_inserted or purged_doc_ids:
+            self.bump_collection_version()
+            self.answer_cache.clear()
 
-        query_engine = self.index.as_query_engine(
-            # streaming=True,
-            similarity_top_k=20,
-            sparse_top_k=20,
-            hybrid_top_k = 10,
-            vector_store_query_mode="hybrid",
-            node_postprocessors=[self.sbert_reranker, self.colbert_reranker],
-            llm=self.llm,
+        summary = {
+            "new": diff.new,
+            "changed": diff.changed,
+            "deleted": diff.deleted,
+            "skipped": len(diff.unchanged),
+            "documents_parsed": documents_parsed,
+            "nodes_inserted": nodes_inserted,
+            "doc_ids_purged": len(purged_doc_ids),
+            "seconds": round(elapsed, 2),
+            "chunks_per_second": round(nodes_inserted / elapsed, 2) if elapsed else 0.0,
+            "stages": stage_stats,
+        }
+        record_ingestion(summary)
+        logger.info(
+            f"Ingestion summary: {len(diff.new)} new, {len(diff.changed)} changed, {len(diff.deleted)} deleted, "
+            f"{summary['skipped']} skipped, {documents_parsed} documents parsed, {nodes_inserted} nodes inserted "
+            f"({summary['chunks_per_second']} chunks/sec), {len(purged_doc_ids)} doc ids purged"
         )
-        global_template_4 = """You are an expert on the provided documents concerning wildlife conservation, human-wildlife interactions, and ecological research. 
-        Your task is to answer the following question using only the information contained within these documents. 
-        Provide a comprehensive and insightful response, drawing on specific details and explanations from the text. 
-        Do not include any information that is not explicitly mentioned in the provided documents.
-        Use the following context to answer the question:
-        ----------------------
-        {context_str}
-        ----------------------
+        return summary
 
-        Given the context information, answer the query: {query_str}"""
-        global_template_3 = """
-        Respond with only the context provided and not prior knowledge. The context might have jumbled information and some of the information might be irrelevant. Judge the context and provide the answer. 
-        ----------------------
-        {context_str}
-        ----------------------
+    def get_sqlite_docstore(self):
+        """Disk-backed docstore, seeded once from the JSON docstore of earlier runs."""
+        is_new = not os.path.exists(self.docstore_path)
+        docstore = SqliteDocumentStore(self.docstore_path)
+        json_docstore_path = os.path.join(self.doc_pipeline_store_path, self.folder_name)
+        if is_new and os.path.exists(json_docstore_path):
+            imported = docstore.import_document_hashes(SimpleDocumentStore.from_persist_path(json_docstore_path))
+            logger.info(f"Imported {imported} document hashes from {json_docstore_path}")
+        return docstore
 
+    def iter_file_documents(self, paths, file_doc_ids):
+        """Yield (path, documents) per parsed unit, recording the doc ids of every file."""
+        pdf_paths = [path for path in paths if path.lower().endswith(".pdf")]
+        logger.info(f"Parsing {len(pdf_paths)} pdf files with {self.pdf_reader.num_workers} workers")
+        for path, file_docs in self.pdf_reader.lazy_load_files(pdf_paths):
+            file_doc_ids.setdefault(path, []).extend(doc.doc_id for doc in file_docs)
+            yield path, file_docs
 
-        Given the context information, answer the query: {query_str}
+        for path in paths:
+            if path in pdf_paths:
+                continue
+            logger.info(f"Loading data from {path}")
+            file_docs = SimpleDirectoryReader(input_files=[path]).load_data()
+            file_doc_ids[path] = [doc.doc_id for doc in file_docs]
+            yield path, file_docs
+
+    def streaming_ingestion(
+        self,
+        file_documents,
+        text_splitter,
+        docstore,
+        nodes_per_batch=64,
+        embed_workers=4,
+        upsert_workers=2,
+        queue_size=8,
+    ):
+        """
+        parse -> split -> embed -> upsert as concurrent stages over bounded queues.
+        Batches hold whole documents so a document's hash is only recorded in the
+        docstore once all of its nodes are stored. Duplicated files share doc ids:
+        the single split worker claims each (doc id, hash) once per run, and upsert
+        workers hold a lock per doc id while they replace its points.
         """
+        claimed = {}
+        doc_locks, doc_locks_guard = {}, threading.Lock()
+
+        def split(item):
+            _, docs = item
+            batch_docs, batch_nodes = [], []
+            for doc in docs:
+                # same dedup as the IngestionPipeline upserts strategy, checked and claimed
+                # together, the docstore only learns the hash once the upsert is done
+                known_hash = claimed[doc.id_] if doc.id_ in claimed else docstore.get_document_hash(doc.id_)
+                if known_hash == doc.hash:
+                    continue
+                claimed[doc.id_] = doc.hash
+                batch_docs.append(doc)
+                batch_nodes.extend(text_splitter([doc]))
+                if len(batch_nodes) >= nodes_per_batch:
+                    yield batch_docs, batch_nodes
+                    batch_docs, batch_nodes = [], []
+            if batch_docs:
+                yield batch_docs, batch_nodes
+
+        def embed(batch):
+            docs, nodes = batch
+            yield docs, self.embed_model(nodes)
+
+        def doc_lock(doc_id):
+            with doc_locks_guard:
+                return doc_locks.setdefault(doc_id, threading.Lock())
+
+        def upsert(batch):
+            docs, nodes = batch
+            with ExitStack() as stack:
+                # sorted, so two workers never wait on each other's locks
+                for doc_id in sorted({doc.id_ for doc in docs}):
+                    stack.enter_context(doc_lock(doc_id))
+                for doc in docs:
+                    if docstore.get_document_hash(doc.id_) is not None:
+                        # changed document, drop its old points first
+                        self.vector_store.delete(ref_doc_id=doc.id_)
+                if nodes:
+                    self.vector_store.add(nodes)
+                for doc in docs:
+                    docstore.set_document_hash(doc.id_, doc.hash)
+            return []
+
+        pipeline = StreamingPipeline(
+            [
+                Stage("split", split, units=lambda item: len(item[1])),
+                Stage("embed", embed, workers=embed_workers, units=lambda batch: len(batch[1])),
+                Stage("upsert", upsert, workers=upsert_workers, units=lambda batch: len(batch[1])),
+            ],
+            queue_size=queue_size,
+            source_name="parse",
+            source_units=lambda item: len(item[1]),
+        )
+        return pipeline.run(file_documents)
+
+    def purge_files(self, manifest, paths, docstore):
+        """Delete the points and docstore entries of the given files' documents."""
+        if not paths:
+            return set()
+        # duplicated files share doc ids (they are derived from the pdf title), keep those still in use
+        doc_ids = {doc_id for path in paths for doc_id in manifest.doc_ids(path)}
+        doc_ids -= manifest.doc_ids_in_use(exclude=paths)
+        for doc_id in doc_ids:
+            self.vector_store.delete(ref_doc_id=doc_id)
+            docstore.delete_document(doc_id, raise_error=False)
+        logger.info(f"Purged {len(doc_ids)} doc ids of {len(paths)} changed/deleted files")
+        return doc_ids
+
+    def retrieve_nodes(self, query_bundle: QueryBundle):
+        """Embed, hybrid search, rerank and pack the context once for the query."""
+        with timed(STAGE_SECONDS, stage="hybrid_search"):
+            nodes = self.retriever.retrieve(query_bundle)
+        nodes = self.rerank(nodes, query_bundle)
+        with timed(STAGE_SECONDS, stage="context_packing"):
+            nodes, _ = self.context_packer.pack(nodes, query_bundle)
+        return nodes
+
+    def rerank(self, nodes, query_bundle: QueryBundle):
+        with timed(STAGE_SECONDS, stage="rerank"):
+            nodes = self.reranker.postprocess_nodes(nodes, query_bundle=query_bundle)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Reranked nodes: %s", [(n.node.node_id, n.score) for n in nodes])
+        return nodes
+
+    def condense(self, query: str, chat_context: str = "") -> str:
+        """Rewrite a follow-up into a standalone question using the selected chat history."""
+        if not chat_context:
+            return query
+        with timed(STAGE_SECONDS, stage="condense"):
+            condensed = self.llm.predict(self.condense_template, chat_history=chat_context, question=query).strip()
+        logger.debug("Condensed %r into %r", query, condensed)
+        return condensed or query
+
+    async def acondense(self, query: str, chat_context: str = "") -> str:
+        if not chat_context:
+            return query
+        with timed(STAGE_SECONDS, stage="condense"):
+            condensed = (await self.llm.apredict(self.condense_template, chat_history=chat_context, question=query)).strip()
+        logger.debug("Condensed %r into %r", query, condensed)
+        return condensed or query
+
+    def retrive(self, query: str, chat_context: str = ""):
+        """`chat_context` is the relevant chat history, a follow-up is condensed with it first."""
+        logger.info(f"Query: {query}")
+        with RAG_IN_PROGRESS.labels(mode="sync").track_inprogress():
+            query = self.condense(query, chat_context)
+            # the query embedding is computed once and shared by the answer cache and the retriever
+            query_bundle = QueryBundle(
+                query_str=query, embedding=self.embed_model.get_query_embedding(query)
+            )
+            version = self.get_collection_version()
+            cached = self.answer_cache.lookup(query_bundle.embedding, version=version)
+            RAG_QUERIES.labels(mode="sync", cached=str(cached is not None).lower()).inc()
+            if cached is not None:
+                return Response(response=cached.answer, source_nodes=cached.source_nodes)
+
+            nodes = self.retrieve_nodes(query_bundle)
+            with timed(STAGE_SECONDS, stage="synthesis"), timed(LLM_GENERATION_SECONDS, mode="blocking"):
+                response = self.response_synthesizer.synthesize(query_bundle, nodes=nodes)
+        logger.debug("Query: %s, Response: %s", query, response)
+        self.answer_cache.store(query, query_bundle.embedding, str(response), nodes, version=version)
+
+        return response
 
-        text_qa_template = PromptTemplate(global_template_4)
+    async def aretrieve_nodes(self, query_bundle: QueryBundle):
+        with timed(STAGE_SECONDS, stage="hybrid_search"):
+            nodes = await self.retriever.aretrieve(query_bundle)
+        # includes the wait for the micro-batch to fill
+        with timed(STAGE_SECONDS, stage="rerank"):
+            nodes = await self.rerank_batcher.submit((nodes, query_bundle))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Reranked nodes: %s", [(n.node.node_id, n.score) for n in nodes])
+        with timed(STAGE_SECONDS, stage="context_packing"):
+            nodes, _ = await self.context_packer.apack(nodes, query_bundle)
+        return nodes
 
-        query_engine.update_prompts(
-            {"response_synthesizer:text_qa_template": text_qa_template}
+    async def aquery_bundle(self, query: str):
+        # the sparse vector lands in the encoder cache, so the hybrid search does not re-encode it
+        embedding, _ = await asyncio.gather(
+            self.embed_model.aget_query_embedding(query),
+            self.sparse_query_encoder.aencode(query),
         )
+        return QueryBundle(query_str=query, embedding=embedding)
+
+    async def aretrive(self, query: str, chat_context: str = ""):
         logger.info(f"Query: {query}")
-        # return query_engine
-        response = query_engine.query(query)
-        logger.debug(f"Query: {query}, Response : {str(response)}")
-        
+        with RAG_IN_PROGRESS.labels(mode="async").track_inprogress():
+            query = await self.acondense(query, chat_context)
+            query_bundle = await self.aquery_bundle(query)
+            version = self.get_collection_version()
+            cached = self.answer_cache.lookup(query_bundle.embedding, version=version)
+            RAG_QUERIES.labels(mode="async", cached=str(cached is not None).lower()).inc()
+            if cached is not None:
+                return Response(response=cached.answer, source_nodes=cached.source_nodes)
+
+            nodes = await self.aretrieve_nodes(query_bundle)
+            with timed(STAGE_SECONDS, stage="synthesis"), timed(LLM_GENERATION_SECONDS, mode="blocking"):
+                response = await self.response_synthesizer.asynthesize(query_bundle, nodes=nodes)
+        logger.debug("Query: %s, Response: %s", query, response)
+        self.answer_cache.store(query, query_bundle.embedding, str(response), nodes, version=version)
+
         return response
+
+    async def warm_up(self, query="What is the status of tigers in India?"):
+        """
+        Load the rerankers and SPLADE and send one query through Ollama embedding and
+        generation so the first user request does not hit cold models. The caches
+        are bypassed so the models are really exercised.
+        """
+        loop = asyncio.get_running_loop()
+        timings = {}
+
+        start = time.perf_counter()
+        embedding = await self.embed_model.embed_model.aget_query_embedding(query)
+        timings["embed"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await loop.run_in_executor(None, self.sparse_query_encoder.encoder, [query])
+        timings["sparse_encode"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        nodes = await self.retriever.aretrieve(QueryBundle(query_str=query, embedding=embedding))
+        timings["hybrid_search"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await loop.run_in_executor(self.rerank_executor, self.sbert_reranker.load)
+        await loop.run_in_executor(self.rerank_executor, self.colbert_reranker.load)
+        if nodes:
+            await loop.run_in_executor(
+                self.rerank_executor, self.rerank, nodes, QueryBundle(query_str=query)
+            )
+        timings["rerank"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await self.llm.acomplete("Reply with the single word OK.")
+        timings["generate"] = time.perf_counter() - start
+
+        logger.info(f"Warm-up timings: { {stage: round(t, 2) for stage, t in timings.items()} }")
+        return timings
+
+    @staticmethod
+    def source_metadata(nodes):
+        return [
+            {
+                "doc_title": n.node.metadata.get("doc_title"),
+                "page_num": n.node.metadata.get("page_num"),
+                "score": n.score,
+            }
+            for n in nodes
+        ]
+
+    async def astream(self, query: str, chat_context: str = ""):
+        """Yield (event, data) pairs: the reranked sources first, then LLM tokens."""
+        logger.info(f"Streaming query: {query}")
+        with RAG_IN_PROGRESS.labels(mode="stream").track_inprogress():
+            query = await self.acondense(query, chat_context)
+            query_bundle = await self.aquery_bundle(query)
+            version = self.get_collection_version()
+            cached = self.answer_cache.lookup(query_bundle.embedding, version=version)
+            RAG_QUERIES.labels(mode="stream", cached=str(cached is not None).lower()).inc()
+            if cached is not None:
+                yield "sources", self.source_metadata(cached.source_nodes)
+                yield "token", cached.answer
+                yield "done", {"answer": cached.answer}
+                return
+
+            nodes = await self.aretrieve_nodes(query_bundle)
+            yield "sources", self.source_metadata(nodes)
+
+            context_str = "\n\n".join(
+                n.node.get_content(metadata_mode=MetadataMode.LLM) for n in nodes
+            )
+            messages = self.text_qa_template.format_messages(
+                llm=self.llm, context_str=context_str, query_str=query
+            )
+            answer = ""
+            start = time.perf_counter()
+            async for chunk in await self.llm.astream_chat(messages):
+                if chunk.delta:
+                    if not answer:
+                        LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - start)
+                    answer += chunk.delta
+                    yield "token", chunk.delta
+            LLM_GENERATION_SECONDS.labels(mode="stream").observe(time.perf_counter() - start)
+            logger.debug("Query: %s, Response: %s", query, answer)
+            self.answer_cache.store(query, query_bundle.embedding, answer, nodes, version=version)
+            yield "done", {"answer": answer}
+
+    async def astructured(self, query: str, chat_context: str = "", max_concurrency: int = 3):
+        """
+        Yield (event, data) pairs for a multi-section answer: the sources, every
+        section as soon as it is generated, then the assembled answer. Retrieval
+        runs once and its context is shared by all sections, which are generated
+        concurrently, at most `max_concurrency` at a time.
+        """
+        logger.info(f"Structured query: {query}")
+        with RAG_IN_PROGRESS.labels(mode="structured").track_inprogress():
+            query = await self.acondense(query, chat_context)
+            RAG_QUERIES.labels(mode="structured", cached="false").inc()
+            query_bundle = await self.aquery_bundle(query)
+            nodes = await self.aretrieve_nodes(query_bundle)
+            yield "sources", self.source_metadata(nodes)
+
+            context_str = "\n\n".join(
+                n.node.get_content(metadata_mode=MetadataMode.LLM) for n in nodes
+            )
+            query_types = analyze_query_type(query)
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def generate(section):
+                async with semaphore:
+                    try:
+                        with timed(LLM_GENERATION_SECONDS, mode="section"):
+                            content = await self.llm.apredict(
+                                self.section_template, context_str=context_str, task_prompt=section["prompt"]
+                            )
+                        return section["task"], content.strip(), None
+                    except Exception as e:
+                        logger.exception(f"Section {section['task']} failed for query: {query}")
+                        return section["task"], "", str(e)
+
+            start = time.perf_counter()
+            pending = [asyncio.ensure_future(generate(section)) for section in structured_sections(query, query_types)]
+            responses = {}
+            try:
+                for next_done in asyncio.as_completed(pending):
+                    task, content, error = await next_done
+                    responses[task] = content
+                    yield "section", {"task": task, "header": section_header(task), "content": content, "error": error}
+            finally:
+                # the client went away: do not keep generating sections nobody reads
+                for future in pending:
+                    future.cancel()
+            STAGE_SECONDS.labels(stage="structured_synthesis").observe(time.perf_counter() - start)
+            answer = format_sections(responses, query_types)
+            logger.debug("Query: %s, Structured response: %s", query, answer)
+            yield "done", {"answer": answer}
     
 
         # Do not provide any extra information strictly other than the answer to the query, Just say Currently this is not part of my knowledge base.
         # Do not answer if what is asked is not in the context, Just say Currently this is not part of my knowledge base.
         # Always answer in polite language of the user's question.
-        # Do not mentioning that you obtained the information from the context, Just Currently this is not part of my knowledge base.
\ No newline at end of file
+        # Do not mentioning that you obtained the information from the context, Just Currently this is not part of my knowledge base.
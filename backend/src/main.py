@@ -1,10 +1,105 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from src.RAGs.WildLifeRAG import WildLifeRAG
-from phoenix.otel import register
-from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from pydantic import BaseModel, ConfigDict, Field, StrictBool
+from starlette.background import BackgroundTask
+from src.utils.logger import get_logger
+from src.utils import model_clients
+from src.utils.admission import AdmissionController, AdmissionRejected
+from src.utils.metrics import HTTP_IN_PROGRESS, HTTP_SECONDS, ModelPoolCollector, RAGStatsCollector
+from src.utils.chat_sessions import ChatSessionStore, SessionExpired
+from src.utils.query_router import OFF_TOPIC, RAG, QueryRouter
+from src.utils.tracing import Tracing
+from opentelemetry.trace import StatusCode
 
-app = FastAPI()
+logger = get_logger(__name__)
+
+# populated by the background warm-up, the RAG stack is never built at import time
+rag_state = {"rag": None, "ready": False, "error": None, "timings": {}}
+REGISTRY.register(RAGStatsCollector(lambda: rag_state["rag"]))
+REGISTRY.register(ModelPoolCollector(model_clients.all_pool_stats))
+# sampled, batched export to phoenix, configured from TRACING_* / TRACE_* env vars
+tracing = Tracing()
+
+wildlife_keywords_set = {
+    "wildlife", "biodiversity", "conservation", "bird", "climate", "change", "endangered", "animals",
+    "trees", "rain", "flora", "fauna", "ecosystem", "habitat", "nature", "forest", "jungle",
+    "savanna", "marine", "ocean", "reptile", "mammal", "amphibian", "earth", "india", "globe",
+    "species", "extinct", "environment", "protection", "sustainability", "ecology", "pollution",
+    "deforestation", "global", "warming", "temperature", "development", "laws",
+    "research", "studies", "analysis", "trends", "challenges", "prospects", "solutions", "NGO",
+    "government", "policy", "institutions", "carbon", "footprint", "impact", "human",
+    "population", "hunting", "poaching", "fishing", "agriculture", "urbanization", "waste",
+    "plastic", "recycling", "renewable", "energy", "services", "air", "soil", "preservation", "restoration",
+    "migration",
+    # species and field terms, so questions about an animal are not left to the embedding check
+    "animal", "wild", "tiger", "leopard", "lion", "elephant", "rhino", "deer", "wolf", "bear", "snake",
+    "crocodile", "turtle", "frog", "fish", "whale", "dolphin", "shark", "insect", "butterfly", "bee",
+    "predator", "prey", "sanctuary", "reserve", "national park", "corridor", "wetland", "mangrove",
+    "grassland", "coral", "conflict", "livestock", "crop raiding", "census", "camera trap", "iucn",
+}
+# answers greetings and off-topic queries before any retrieval work
+query_router = QueryRouter(wildlife_keywords_set)
+ROUTER_EMBEDDING_CHECK = os.environ.get("QUERY_ROUTER_EMBEDDINGS", "true").lower() in ("1", "true", "yes", "on")
+# section generations of one structured answer sent to Ollama at a time
+STRUCTURED_MAX_CONCURRENCY = int(os.environ.get("STRUCTURED_MAX_CONCURRENCY", 3))
+# bounds concurrent generations on the single Ollama, GENERATION_* env vars
+generation_admission = AdmissionController.from_env()
+# server-side conversation history, bounded in sessions and lines per session
+chat_sessions = ChatSessionStore(
+    max_sessions=int(os.environ.get("CHAT_MAX_SESSIONS", 1000)),
+    ttl_seconds=float(os.environ.get("CHAT_SESSION_TTL_SECONDS", 3600)),
+    max_lines=int(os.environ.get("CHAT_MAX_HISTORY_LINES", 500)),
+)
+
+
+def load_rag():
+    start = time.perf_counter()
+    from src.RAGs.WildLifeRAG import WildLifeRAG
+    rag_state["timings"]["import"] = time.perf_counter() - start
+    logger.info(f"Imported RAG stack in {rag_state['timings']['import']:.2f}s")
+
+    start = time.perf_counter()
+    tracing.setup()
+    rag = WildLifeRAG()
+    rag_state["timings"]["construct"] = time.perf_counter() - start
+    logger.info(f"Constructed WildLifeRAG in {rag_state['timings']['construct']:.2f}s")
+    return rag
+
+
+async def warm_up(retry_delay=10):
+    start = time.perf_counter()
+    while not rag_state["ready"]:
+        try:
+            if rag_state["rag"] is None:
+                rag_state["rag"] = await asyncio.to_thread(load_rag)
+            rag_state["timings"]["warm_up"] = await rag_state["rag"].warm_up()
+            rag_state["ready"] = True
+            rag_state["error"] = None
+            logger.info(f"RAG ready after {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # qdrant or ollama may still be starting, keep trying
+            rag_state["error"] = str(e)
+            logger.exception(f"RAG warm-up failed, retrying in {retry_delay}s")
+            await asyncio.sleep(retry_delay)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    tracing.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -13,61 +108,283 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-wildlife_rag = WildLifeRAG()
 
-tracer_provider = register(
-  project_name="WILDLIFE_RESEARCH",
-  endpoint="http://phoenix:6006/v1/traces",
-)
+@app.middleware("http")
+async def http_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    with HTTP_IN_PROGRESS.labels(method=request.method).track_inprogress():
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # the route template keeps the label set bounded, unknown paths share one label
+            route = request.scope.get("route")
+            HTTP_SECONDS.labels(
+                method=request.method,
+                route=route.path if route else "unmatched",
+                status=str(status),
+            ).observe(time.perf_counter() - start)
+
+
+async def route_query(query: str):
+    # the query embedding of the centroid check is cached and reused by retrieval
+    embed = None
+    if ROUTER_EMBEDDING_CHECK and rag_state["ready"]:
+        embed = rag_state["rag"].embed_model.aget_query_embedding
+    return await query_router.aroute(query, embed)
+
+
+def chat_session(data: dict, query: str):
+    """
+    The client's session, a new one is seeded with the chatHistory the client sent.
+    An unknown sessionId is answered with 404 session_expired, the client then
+    retries without it and with its full history. A new session is not stored
+    yet, `chat_sessions.add` keeps it once the request is admitted, so rejected
+    requests do not fill CHAT_MAX_SESSIONS.
+    """
+    history = data.get("chatHistory") or []
+    # the frontend sends the current query as the last history message
+    if history and history[-1].get("sender") == "user" and history[-1].get("text") == query:
+        history = history[:-1]
+    return chat_sessions.get_or_new(data.get("sessionId"), history)
+
+
+def needs_rag(decision, chat_context: str) -> bool:
+    # a follow-up like "what do they eat?" has no keyword of its own, the history decides
+    return decision.route == RAG or (decision.route == OFF_TOPIC and bool(chat_context))
 
 
-LlamaIndexInstrumentor().instrument(tracer_provider=tracer_provider)
+def get_rag():
+    if not rag_state["ready"]:
+        raise HTTPException(status_code=503, detail="RAG is warming up", headers={"Retry-After": "10"})
+    return rag_state["rag"]
+
+
+def request_priority(priority) -> str:
+    """"interactive" (default) or "batch" for evaluation and bulk clients."""
+    priority = priority or "interactive"
+    if priority not in generation_admission.classes:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {sorted(generation_admission.classes)}")
+    return priority
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        {"detail": exc.reason, "retry_after": exc.retry_after},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(SessionExpired)
+async def session_expired(request: Request, exc: SessionExpired):
+    return JSONResponse({"detail": "session_expired", "session_id": exc.session_id}, status_code=404)
+
 
 @app.get("/")
-def root():
+async def root():
     return {"STATUS": "RAG IS WORKING"}
 
-@app.post("/ask_wildlife/")
-def read_item(query: str):
-    response = wildlife_rag.retrive(query)
-    return {"result": str(response)}
+@app.get("/ready")
+async def ready():
+    body = {"ready": rag_state["ready"], "error": rag_state["error"], "timings": rag_state["timings"]}
+    return JSONResponse(body, status_code=200 if rag_state["ready"] else 503)
 
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
 
-wildlife_keywords_set = {
-    "wildlife", "biodiversity", "conservation", "bird", "climate", "change", "endangered", "animals",
-    "trees", "rain", "flora", "fauna", "ecosystem", "habitat", "nature", "forest", "jungle",
-    "savanna", "marine", "ocean", "reptile", "mammal", "amphibian", "earth", "india", "globe",
-    "species", "extinct", "environment", "protection", "sustainability", "ecology", "pollution",
-    "deforestation", "global", "warming", "temperature", "development", "laws",
-    "research", "studies", "analysis", "trends", "challenges", "prospects", "solutions", "NGO",
-    "government", "policy", "institutions", "carbon", "footprint", "impact", "human",
-    "population", "hunting", "poaching", "fishing", "agriculture", "urbanization", "waste",
-    "plastic", "recycling", "renewable", "energy", "services", "air", "soil", "preservation", "restoration",
-    "migration"
-}
+@app.get("/stats")
+async def stats():
+    wildlife_rag = get_rag()
+    return {
+        "answer_cache": wildlife_rag.answer_cache.stats(),
+        "embedding_cache": wildlife_rag.embedding_cache.stats(),
+        "reranker": wildlife_rag.reranker.stats(),
+        "router": query_router.stats(),
+        "chat_sessions": chat_sessions.stats(),
+        "model_clients": model_clients.stats(),
+        "admission": generation_admission.stats(),
+        "batching": {
+            "query_embedding": wildlife_rag.embed_model.batcher.stats() if wildlife_rag.embed_model.batcher else None,
+            "sparse_query_encoding": wildlife_rag.sparse_query_encoder.batcher.stats(),
+            "rerank": wildlife_rag.rerank_batcher.stats(),
+        },
+    }
+
+@app.get("/tracing")
+async def tracing_status():
+    return tracing.stats()
+
+class TracingUpdate(BaseModel):
+    """Fields left out keep their value, anything else is rejected with 422."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    enabled: Optional[StrictBool] = None
+    tail_sample_ratio: Optional[float] = Field(default=None, ge=0, le=1)
+    slow_seconds: Optional[float] = Field(default=None, ge=0)
+
+
+@app.post("/tracing")
+async def update_tracing(update: TracingUpdate):
+    """Switch tracing on/off or change the sampling without a restart."""
+    if update.enabled is not None:
+        tracing.set_enabled(update.enabled)
+    tracing.configure(tail_sample_ratio=update.tail_sample_ratio, slow_seconds=update.slow_seconds)
+    return tracing.stats()
+
+@app.post("/ask_wildlife/")
+async def read_item(query: str, priority: str = "interactive"):
+    priority = request_priority(priority)
+    decision = await route_query(query)
+    if decision.route != RAG:
+        return {"result": decision.answer}
+    wildlife_rag = get_rag()
+    async with generation_admission.admit(priority):
+        with tracing.request_span("ask_wildlife", query=query):
+            response = await wildlife_rag.aretrive(query)
+    return {"result": str(response)}
 
 @app.post('/api/chat')
-def chat(data: dict):
+async def chat(data: dict):
     query = data.get("query", "")
     
 
     if not query:
         return {"error": "No query provided"}, 400
     
-    # Extract relevant context from chat history
-    # context = extract_relevant_context(query, chat_history)
+    priority = request_priority(data.get("priority"))
+    # Extract relevant context from the session's chat history
+    session = chat_session(data, query)
+    chat_context = session.relevant_context(query)
 
-    # Get structured response with the relevant context
-    # hf_answer = get_structured_response(query, context)
-    hf_answer = wildlife_rag.retrive(query)
+    decision = await route_query(query)
+    if needs_rag(decision, chat_context):
+        wildlife_rag = get_rag()
+        async with generation_admission.admit(priority):
+            chat_sessions.add(session)
+            with tracing.request_span("chat", query=query):
+                hf_answer = str(await wildlife_rag.aretrive(query, chat_context))
+    else:
+        chat_sessions.add(session)
+        hf_answer = decision.answer
+    session.add_message("user", query)
+    session.add_message("bot", hf_answer)
     research_results = None
     images = None
     first_image = None
 
     result = {
-        "answer": str(hf_answer),
+        "answer": hf_answer,
         "research": research_results,
         "images": images,
-        "image_url": first_image
+        "image_url": first_image,
+        "session_id": session.session_id,
     }
-    return result
\ No newline at end of file
+    return result
+
+@app.delete('/api/chat/sessions/{session_id}')
+async def delete_chat_session(session_id: str):
+    if not chat_sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"deleted": session_id}
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events, permit=None) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # disable proxy buffering so tokens reach the client as they are produced
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # frees the admission slot also when the client left before the stream started
+        background=BackgroundTask(generation_admission.release, permit) if permit else None,
+    )
+
+
+async def canned_events(session, query: str, answer: str):
+    session.add_message("user", query)
+    session.add_message("bot", answer)
+    yield sse_event("session", {"session_id": session.session_id})
+    yield sse_event("sources", [])
+    yield sse_event("token", answer)
+    yield sse_event("done", {"answer": answer})
+
+
+async def rag_events(session, query: str, span_name: str, events, permit):
+    """
+    SSE frames of a RAG event generator, the answer is added to the session when
+    done. The admission slot is held until the stream ends.
+    """
+    try:
+        yield sse_event("session", {"session_id": session.session_id})
+        with tracing.request_span(span_name, query=query) as span:
+            try:
+                async for event, payload in events:
+                    if event == "done":
+                        session.add_message("user", query)
+                        session.add_message("bot", payload["answer"])
+                    yield sse_event(event, payload)
+            except Exception as e:
+                # headers are already sent, report the failure in-band
+                logger.exception(f"Streaming failed for query: {query}")
+                if span is not None:
+                    # keeps the trace through tail sampling
+                    span.record_exception(e)
+                    span.set_status(StatusCode.ERROR)
+                yield sse_event("error", {"error": str(e)})
+    finally:
+        generation_admission.release(permit)
+
+
+@app.post('/api/chat/stream')
+async def chat_stream(data: dict):
+    query = data.get("query", "")
+
+    if not query:
+        raise HTTPException(status_code=400, detail="No query provided")
+    priority = request_priority(data.get("priority"))
+    session = chat_session(data, query)
+    chat_context = session.relevant_context(query)
+    decision = await route_query(query)
+    if not needs_rag(decision, chat_context):
+        chat_sessions.add(session)
+        return sse_response(canned_events(session, query, decision.answer))
+    wildlife_rag = get_rag()
+    # admitted before the headers are sent, so a full queue still gets a 429
+    permit = await generation_admission.acquire(priority)
+    chat_sessions.add(session)
+    events = wildlife_rag.astream(query, chat_context)
+    return sse_response(rag_events(session, query, "chat_stream", events, permit), permit)
+
+
+@app.post('/api/chat/structured')
+async def chat_structured(data: dict):
+    """
+    Multi-section answer (summary, status, recommendations, ...) as SSE: the
+    sources, a "section" event per section in completion order, then "done".
+    """
+    query = data.get("query", "")
+
+    if not query:
+        raise HTTPException(status_code=400, detail="No query provided")
+    priority = request_priority(data.get("priority"))
+    session = chat_session(data, query)
+    chat_context = session.relevant_context(query)
+    decision = await route_query(query)
+    if not needs_rag(decision, chat_context):
+        chat_sessions.add(session)
+        return sse_response(canned_events(session, query, decision.answer))
+    wildlife_rag = get_rag()
+    # one slot per section generated at once, so the sections count against GENERATION_MAX_CONCURRENCY
+    weight = min(STRUCTURED_MAX_CONCURRENCY, generation_admission.max_concurrency)
+    permit = await generation_admission.acquire(priority, weight=weight)
+    chat_sessions.add(session)
+    events = wildlife_rag.astructured(query, chat_context, max_concurrency=weight)
+    return sse_response(rag_events(session, query, "chat_structured", events, permit), permit)
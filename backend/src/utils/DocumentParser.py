@@ -4,23 +4,147 @@ import pymupdf4llm
 import re
 from src.utils.logger import get_logger
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 logger = get_logger(__name__)
 
+
+def _parse_page_range(file, pages):
+    # runs in a worker process, only plain data crosses the process boundary
+    pages_md_text = pymupdf4llm.to_markdown(file, pages=pages, page_chunks=True)
+    return [
+        {"text": page_md_text['text'],
+         "page": page_md_text['metadata']['page'],
+         "title": page_md_text['metadata']['title']}
+        for page_md_text in pages_md_text
+    ]
+
+
+def _page_count(file):
+    import pymupdf
+    with pymupdf.open(file) as pdf:
+        return pdf.page_count
+
+
+def _kill_workers(executor):
+    """Stop the pool without waiting, killing workers that are still parsing."""
+    kill_workers = getattr(executor, "kill_workers", None)  # Python 3.14+
+    if kill_workers is not None:
+        kill_workers()
+        return
+    # _processes is a CPython internal of ProcessPoolExecutor (pid -> Process), without it the
+    # stuck workers are only left to exit on their own after shutdown
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
 class PDF4LLMReader(BaseReader):
-    def load_data(self, file, extra_info=None):
+    def __init__(self, num_workers=None, pages_per_task=16, file_timeout=600):
+        """
+        num_workers: worker processes for parallel_load_data / lazy_load_files, defaults to the cpu count.
+        pages_per_task: large files are split into page ranges of this size across workers.
+        file_timeout: seconds a file may take before it is abandoned.
+        """
+        self.num_workers = num_workers or os.cpu_count()
+        self.pages_per_task = pages_per_task
+        self.file_timeout = file_timeout
+        self.failed_files = set()
+
+    @staticmethod
+    def _to_documents(pages):
         docs = []
-        logger.debug(f"Parsing file {file}")
-        pages_md_text = pymupdf4llm.to_markdown(file, page_chunks=True)
-        parent_ref_doc_id = re.sub("\s+", "_", str(pages_md_text[0]['metadata']['title']))
-        # load_data returns a list of Document objects
-        for page_md_text in pages_md_text:
+        if not pages:
+            return docs
+        parent_ref_doc_id = re.sub(r"\s+", "_", str(pages[0]['title']))
+        for page in pages:
             # we are making document at page level that is why needed parent doc id for chunk contextual information
-            docs.append(Document(doc_id = re.sub("\s+", "_", parent_ref_doc_id + "_page_"+str(page_md_text['metadata']['page'])),
-                                text=page_md_text['text'], 
+            docs.append(Document(doc_id = re.sub(r"\s+", "_", parent_ref_doc_id + "_page_"+str(page['page'])),
+                                text=page['text'],
                     metadata = {"parent_ref_doc_id": parent_ref_doc_id,
-                                "page_num": page_md_text['metadata']['page'], 
-                                "doc_title": page_md_text['metadata']['title']}, 
+                                "page_num": page['page'],
+                                "doc_title": page['title']},
                                 excluded_embed_metadata_keys=["doc_title", "page_num", "parent_ref_doc_id"],
                                 excluded_llm_metadata_keys=["doc_title", "page_num", "parent_ref_doc_id"]))
-        return docs
\ No newline at end of file
+        return docs
+
+    def load_data(self, file, extra_info=None):
+        logger.debug(f"Parsing file {file}")
+        return self._to_documents(_parse_page_range(str(file), None))
+
+    def lazy_load_files(self, files):
+        """
+        Parse files across a process pool and yield (file, documents) as page ranges
+        finish. Files are split into `pages_per_task` page ranges, at most
+        `num_workers` ranges are in flight, so a range starts roughly when it is
+        submitted and the per-file timeout is measured from there. A file that cannot
+        be opened, times out or fails is logged, skipped and listed in `failed_files`;
+        its already yielded pages stay valid. Workers stuck on a timed out file are
+        killed and the pool is replaced.
+        """
+        failed = self.failed_files = set()
+        tasks = []
+        for file in files:
+            file = str(file)
+            try:
+                page_count = _page_count(file)
+            except Exception:
+                logger.exception(f"Failed to open {file}, skipping it")
+                failed.add(file)
+                continue
+            for start in range(0, page_count, self.pages_per_task):
+                tasks.append((file, list(range(start, min(start + self.pages_per_task, page_count)))))
+        tasks.reverse()
+
+        started = {}
+        pending = {}
+        executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        try:
+            while tasks or pending:
+                while tasks and len(pending) < self.num_workers:
+                    file, pages = tasks.pop()
+                    if file in failed:
+                        continue
+                    started.setdefault(file, time.monotonic())
+                    pending[executor.submit(_parse_page_range, file, pages)] = (file, pages)
+                if not pending:
+                    continue
+
+                done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file, pages = pending.pop(future)
+                    if file in failed:
+                        continue
+                    try:
+                        yield file, self._to_documents(future.result())
+                    except Exception:
+                        logger.exception(f"Failed to parse pages {pages[0]}-{pages[-1]} of {file}")
+                        failed.add(file)
+
+                now = time.monotonic()
+                hung = False
+                for future, (file, pages) in list(pending.items()):
+                    if file not in failed and now - started[file] > self.file_timeout:
+                        logger.error(f"Parsing {file} exceeded {self.file_timeout}s, skipping it")
+                        failed.add(file)
+                    if file in failed:
+                        pending.pop(future)
+                        # cancel() only stops ranges that have not started yet
+                        hung |= not future.cancel() and not future.done()
+                if hung:
+                    # a running worker cannot be interrupted, replace the pool and
+                    # resubmit the unfinished ranges of the other files
+                    for future, task in list(pending.items()):
+                        if not future.done():
+                            pending.pop(future)
+                            tasks.append(task)
+                    _kill_workers(executor)
+                    executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def parallel_load_data(self, files):
+        """Yield page level documents of all files as they are parsed."""
+        for _, docs in self.lazy_load_files(files):
+            yield from docs
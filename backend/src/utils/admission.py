@@ -0,0 +1,193 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, List
+
+from src.utils.logger import get_logger
+from src.utils.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+logger = get_logger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted: 429 when the queue is full, 503 when it waited too long."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class PriorityClass:
+    name: str
+    # lower is served first
+    rank: int
+    max_queue: int
+    max_queue_seconds: float
+    queued: int = 0
+
+
+@dataclass
+class Permit:
+    priority: str
+    acquired_at: float
+    # slots held, a structured answer holds one per concurrently generated section
+    weight: int = 1
+    released: bool = False
+
+
+class AdmissionController:
+    """
+    Lets at most `max_concurrency` generations run at once. Requests over the
+    limit wait in a priority queue, interactive before batch and FIFO within a
+    class. A request is rejected with 429 when its class's queue is full and
+    with 503 when it waited longer than the class allows. Retry-After is
+    estimated from the average time a slot is held.
+
+    A request can take several slots (`weight`) when it runs several
+    generations at once. Waiters are admitted strictly in queue order, a heavy
+    request at the head is not overtaken by lighter ones behind it.
+    """
+
+    def __init__(self, max_concurrency: int, classes: List[PriorityClass]) -> None:
+        self.max_concurrency = max_concurrency
+        self.classes: Dict[str, PriorityClass] = {c.name: c for c in classes}
+        self.active = 0
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        # seconds a slot is held, exponentially weighted
+        self.service_seconds = 10.0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        env = os.environ.get
+        return cls(
+            max_concurrency=int(env("GENERATION_MAX_CONCURRENCY", 2)),
+            classes=[
+                PriorityClass(
+                    "interactive",
+                    rank=0,
+                    max_queue=int(env("GENERATION_MAX_QUEUE", 32)),
+                    max_queue_seconds=float(env("GENERATION_MAX_QUEUE_SECONDS", 30)),
+                ),
+                PriorityClass(
+                    "batch",
+                    rank=1,
+                    max_queue=int(env("GENERATION_BATCH_MAX_QUEUE", 8)),
+                    max_queue_seconds=float(env("GENERATION_BATCH_MAX_QUEUE_SECONDS", 300)),
+                ),
+            ],
+        )
+
+    def retry_after(self) -> int:
+        queued = sum(c.queued for c in self.classes.values())
+        return max(1, math.ceil(self.service_seconds * (queued + 1) / self.max_concurrency))
+
+    def _set_queued(self, priority_class: PriorityClass, delta: int) -> None:
+        priority_class.queued += delta
+        ADMISSION_QUEUE_DEPTH.labels(priority=priority_class.name).set(priority_class.queued)
+
+    def _reject(self, priority_class: PriorityClass, status_code: int, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(priority=priority_class.name, reason=reason).inc()
+        retry_after = self.retry_after()
+        logger.warning(f"Rejected {priority_class.name} request ({reason}), retry after {retry_after}s")
+        return AdmissionRejected(status_code, reason, retry_after)
+
+    def _admit(self, priority_class: PriorityClass, waited: float, weight: int) -> Permit:
+        self.admitted += 1
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_WAIT_SECONDS.labels(priority=priority_class.name).observe(waited)
+        return Permit(priority_class.name, time.monotonic(), weight)
+
+    async def acquire(self, priority: str = "interactive", weight: int = 1) -> Permit:
+        priority_class = self.classes.get(priority)
+        if priority_class is None:
+            raise ValueError(f"Unknown priority {priority!r}, use one of {sorted(self.classes)}")
+        # more than max_concurrency could never be admitted
+        weight = max(1, min(weight, self.max_concurrency))
+        # timed out waiters stay in the heap until a release drops them, count the live ones
+        if self.active + weight <= self.max_concurrency and not any(c.queued for c in self.classes.values()):
+            self.active += weight
+            return self._admit(priority_class, 0.0, weight)
+        if priority_class.queued >= priority_class.max_queue:
+            raise self._reject(priority_class, 429, "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority_class.rank, next(self._sequence), priority_class.name, weight, future))
+        self._set_queued(priority_class, 1)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, priority_class.max_queue_seconds)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # release() handed the slots over (and dequeued us) as the wait timed out, take them
+                return self._admit(priority_class, time.monotonic() - start, weight)
+            self._set_queued(priority_class, -1)
+            # a heavier waiter may have held back lighter ones behind it
+            self._wake()
+            raise self._reject(priority_class, 503, "queue_timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slots were handed over just as the client went away
+                self.release(Permit(priority_class.name, time.monotonic(), weight))
+            else:
+                self._set_queued(priority_class, -1)
+                self._wake()
+            raise
+        # release() counted our slots in `active` when it woke us
+        return self._admit(priority_class, time.monotonic() - start, weight)
+
+    def release(self, permit: Permit) -> None:
+        """Idempotent, the freed slots go to the best waiting requests that fit."""
+        if permit.released:
+            return
+        permit.released = True
+        held = time.monotonic() - permit.acquired_at
+        self.service_seconds = 0.8 * self.service_seconds + 0.2 * held
+        self.active -= permit.weight
+        self._wake()
+
+    def _wake(self) -> None:
+        """Hand free slots to waiters in queue order, as long as the next one fits."""
+        while self._waiters:
+            _, _, priority, weight, future = self._waiters[0]
+            if future.done():
+                # timed out or cancelled, no longer counted as queued
+                heapq.heappop(self._waiters)
+                continue
+            if self.active + weight > self.max_concurrency:
+                break
+            heapq.heappop(self._waiters)
+            self.active += weight
+            self._set_queued(self.classes[priority], -1)
+            future.set_result(None)
+        ADMISSION_ACTIVE.set(self.active)
+
+    @asynccontextmanager
+    async def admit(self, priority: str = "interactive", weight: int = 1):
+        permit = await self.acquire(priority, weight)
+        try:
+            yield permit
+        finally:
+            self.release(permit)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": {name: c.queued for name, c in self.classes.items()},
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "service_seconds": round(self.service_seconds, 2),
+            "retry_after": self.retry_after(),
+        }
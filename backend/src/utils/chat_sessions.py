@@ -0,0 +1,197 @@
+import heapq
+import re
+import time
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from src.utils.logger import get_logger
+from src.utils.metrics import CHAT_SESSIONS, CHAT_SESSIONS_EVICTED
+
+logger = get_logger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+# too common to say anything about relevance, and they would make the postings long
+STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for", "from", "has",
+    "have", "how", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "so", "that", "the",
+    "their", "them", "there", "these", "they", "this", "to", "was", "we", "were", "what", "when",
+    "which", "who", "why", "will", "with", "you", "your",
+})
+
+
+def line_tokens(text: str) -> FrozenSet[str]:
+    return frozenset(t for t in _TOKEN.findall(text.lower()) if t not in STOP_WORDS)
+
+
+@dataclass
+class HistoryLine:
+    sender: str
+    text: str
+    tokens: FrozenSet[str]
+
+
+class ChatSession:
+    """
+    Conversation history of one client. Every message is split into lines that
+    are tokenized once and added to an inverted index (token -> line ids), so
+    selecting the relevant context only touches lines sharing a token with the
+    query. Line ids grow with the conversation and double as its order. The
+    oldest lines are evicted beyond `max_lines`.
+    """
+
+    def __init__(self, session_id: str, max_lines: int = 500) -> None:
+        self.session_id = session_id
+        self.max_lines = max_lines
+        self.lines: "OrderedDict[int, HistoryLine]" = OrderedDict()
+        self.postings: Dict[str, Set[int]] = {}
+        self.messages = 0
+        self.next_line_id = 0
+        self.last_used = time.monotonic()
+
+    def add_message(self, sender: str, text: str) -> None:
+        for raw in (text or "").split("\n"):
+            line = raw.strip()
+            if not line:
+                continue
+            tokens = line_tokens(line)
+            self.lines[self.next_line_id] = HistoryLine(sender, line, tokens)
+            for token in tokens:
+                self.postings.setdefault(token, set()).add(self.next_line_id)
+            self.next_line_id += 1
+        self.messages += 1
+        while len(self.lines) > self.max_lines:
+            self.evict_oldest_line()
+
+    def add_messages(self, messages: Iterable[dict]) -> None:
+        for message in messages:
+            self.add_message(message.get("sender", "user"), message.get("text", ""))
+
+    def evict_oldest_line(self) -> None:
+        line_id, line = self.lines.popitem(last=False)
+        for token in line.tokens:
+            posting = self.postings[token]
+            posting.discard(line_id)
+            if not posting:
+                del self.postings[token]
+
+    def relevant_lines(self, query: str, max_lines: int = 10, similarity_threshold: float = 0.1) -> List[HistoryLine]:
+        """Lines most similar to the query by token overlap (Jaccard), in conversation order."""
+        query_tokens = line_tokens(query)
+        overlap = Counter()
+        for token in query_tokens:
+            overlap.update(self.postings.get(token, ()))
+
+        scored = []
+        for line_id, shared in overlap.items():
+            line = self.lines[line_id]
+            score = shared / (len(query_tokens) + len(line.tokens) - shared)
+            if score > similarity_threshold:
+                scored.append((score, line_id))
+        best = sorted(line_id for _, line_id in heapq.nlargest(max_lines, scored))
+        return [self.lines[line_id] for line_id in best]
+
+    def relevant_context(self, query: str, max_lines: int = 10, similarity_threshold: float = 0.1) -> str:
+        """The relevant lines as "sender: line", with a blank line between speakers."""
+        context_parts = []
+        current_sender = None
+        for line in self.relevant_lines(query, max_lines, similarity_threshold):
+            if line.sender != current_sender:
+                if context_parts:
+                    context_parts.append("")
+                current_sender = line.sender
+            context_parts.append(f"{line.sender}: {line.text}")
+        return "\n".join(context_parts)
+
+
+class SessionExpired(Exception):
+    """The client named a session that was evicted, expired or lost in a restart."""
+
+    def __init__(self, session_id: str) -> None:
+        super().__init__(f"Unknown chat session {session_id}")
+        self.session_id = session_id
+
+
+class ChatSessionStore:
+    """
+    In-memory sessions with LRU eviction beyond `max_sessions` and expiry after
+    `ttl_seconds` without use. A new session can be seeded with the history a
+    client sends, later requests only add their own query and answer.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600, max_lines: int = 500) -> None:
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_lines = max_lines
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.created = 0
+        self.evicted = Counter()
+
+    def expire(self) -> None:
+        # ordered by last use, expired sessions are at the front
+        deadline = time.monotonic() - self.ttl_seconds
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_used > deadline:
+                break
+            self.remove(session.session_id, reason="ttl")
+
+    def remove(self, session_id: str, reason: str = "deleted") -> bool:
+        if self.sessions.pop(session_id, None) is None:
+            return False
+        self.evicted[reason] += 1
+        CHAT_SESSIONS_EVICTED.labels(reason=reason).inc()
+        CHAT_SESSIONS.set(len(self.sessions))
+        return True
+
+    def get(self, session_id: Optional[str]) -> Optional[ChatSession]:
+        self.expire()
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None:
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def get_or_create(self, session_id: Optional[str] = None, history: Optional[List[dict]] = None) -> ChatSession:
+        """
+        The named session, or a new one seeded with `history` when no id is given.
+        An unknown id raises SessionExpired instead of starting an empty session
+        under it, the client has to send its history again.
+        """
+        session = self.get_or_new(session_id, history)
+        self.add(session)
+        return session
+
+    def get_or_new(self, session_id: Optional[str] = None, history: Optional[List[dict]] = None) -> ChatSession:
+        """Like `get_or_create`, but a new session is only stored by `add`."""
+        session = self.get(session_id)
+        if session is not None:
+            return session
+        if session_id:
+            raise SessionExpired(session_id)
+
+        session = ChatSession(uuid.uuid4().hex, max_lines=self.max_lines)
+        if history:
+            session.add_messages(history)
+        return session
+
+    def add(self, session: ChatSession) -> None:
+        """Store a new session, evicting the least recently used beyond `max_sessions`."""
+        if session.session_id in self.sessions:
+            return
+        self.sessions[session.session_id] = session
+        self.created += 1
+        while len(self.sessions) > self.max_sessions:
+            self.remove(next(iter(self.sessions)), reason="lru")
+        CHAT_SESSIONS.set(len(self.sessions))
+        logger.debug("Created chat session %s with %d history messages", session.session_id, session.messages)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "created": self.created,
+            "evicted": dict(self.evicted),
+            "history_lines": sum(len(s.lines) for s in self.sessions.values()),
+        }
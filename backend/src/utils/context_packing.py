@@ -0,0 +1,292 @@
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr, SerializeAsAny
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from llama_index.core.utils import get_tokenizer
+
+from src.utils.embedding_cache import cache_key
+from src.utils.logger import get_logger
+from src.utils.metrics import CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED
+from src.utils.persistent_cache import PersistentLRUCache
+
+logger = get_logger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def overlap_length(left: str, right: str, max_chars=1000, min_chars=32) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    if len(right) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    idx = left.find(probe, max(0, len(left) - max_chars))
+    while idx != -1:
+        if right.startswith(left[idx:]):
+            return len(left) - idx
+        idx = left.find(probe, idx + 1)
+    return 0
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+@dataclass
+class PackReport:
+    nodes_in: int
+    nodes_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    chunks_merged: int = 0
+    sentences_dropped: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+
+@dataclass
+class _Group:
+    nodes: List[NodeWithScore]
+    text: str = ""
+    tokens: int = 0
+
+    @property
+    def score(self) -> float:
+        return max(n.score or 0.0 for n in self.nodes)
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Packs reranked chunks into the prompt context under a token budget.
+
+    Chunks of the same page (parent_ref_doc_id + page_num) are put in reading
+    order and adjacent ones are merged, dropping the text they share through the
+    splitter's chunk overlap (found from the chunks' char offsets, or by string
+    matching when those are missing). Pages are then added best score first
+    until `token_budget` is used up; a page that does not fit is cut at a
+    sentence boundary. With `compress`, an over-budget context is instead reduced
+    to the sentences most similar to the query embedding, kept in their original
+    order. Sentence embeddings are kept in an in-memory LRU, so chunks retrieved
+    again by later queries are not embedded again; the sentences not seen before
+    still cost one batched `embed_model` round trip per query.
+    """
+
+    token_budget: int = Field(default=1536, description="Maximum tokens of packed context.")
+    compress: bool = Field(default=False, description="Select sentences by query similarity when over budget.")
+    embed_model: Optional[SerializeAsAny[BaseEmbedding]] = Field(default=None, description="Sentence embedder for compress.")
+    max_overlap_chars: int = Field(default=1000, description="Longest overlap looked for by string matching.")
+    sentence_cache_size: int = Field(default=4096, description="Sentence embeddings kept for compress.")
+    _tokenizer: Any = PrivateAttr(default=None)
+    _sentence_cache: Optional[PersistentLRUCache] = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def count_tokens(self, text: str) -> int:
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer()
+        return len(self._tokenizer(text))
+
+    @staticmethod
+    def page_key(node: NodeWithScore) -> Tuple:
+        metadata = node.node.metadata
+        if "parent_ref_doc_id" in metadata:
+            return metadata["parent_ref_doc_id"], metadata.get("page_num")
+        return (node.node.ref_doc_id or node.node.node_id,)
+
+    def merge_group(self, nodes: List[NodeWithScore]) -> Tuple[str, int]:
+        """Text of one page's chunks with overlaps removed, and the number of merged chunks."""
+        nodes = sorted(nodes, key=lambda n: n.node.start_char_idx if n.node.start_char_idx is not None else 0)
+        runs, merged = [nodes[0].node.text], 0
+        end = nodes[0].node.end_char_idx
+        for node in nodes[1:]:
+            text, start = node.node.text, node.node.start_char_idx
+            if start is not None and end is not None:
+                overlap = end - start if start <= end else -1
+            else:
+                overlap = overlap_length(runs[-1], text, self.max_overlap_chars) or -1
+            if overlap >= 0:
+                runs[-1] += text[overlap:] if overlap < len(text) else ""
+                merged += 1
+            else:
+                runs.append(text)
+            if node.node.end_char_idx is not None and (end is None or node.node.end_char_idx > end):
+                end = node.node.end_char_idx
+        return "\n...\n".join(runs), merged
+
+    def group(self, nodes: List[NodeWithScore], report: PackReport) -> List[_Group]:
+        pages: "OrderedDict[Tuple, List[NodeWithScore]]" = OrderedDict()
+        seen = set()
+        for node in nodes:
+            report.tokens_in += self.count_tokens(node.node.text)
+            if node.node.hash in seen:
+                # the same chunk from a duplicated file
+                continue
+            seen.add(node.node.hash)
+            pages.setdefault(self.page_key(node), []).append(node)
+
+        groups = []
+        for page_nodes in pages.values():
+            text, merged = self.merge_group(page_nodes)
+            report.chunks_merged += merged
+            groups.append(_Group(page_nodes, text, self.count_tokens(text)))
+        return sorted(groups, key=lambda g: -g.score)
+
+    def fill(self, groups: List[_Group], report: PackReport) -> None:
+        """Keep whole pages while they fit, cut the first page that does not at a sentence boundary."""
+        used = 0
+        for i, group in enumerate(groups):
+            if used + group.tokens <= self.token_budget:
+                used += group.tokens
+                continue
+            kept, sentences = [], split_sentences(group.text)
+            for sentence in sentences:
+                tokens = self.count_tokens(sentence)
+                if used + tokens > self.token_budget:
+                    break
+                kept.append(sentence)
+                used += tokens
+            report.sentences_dropped += len(sentences) - len(kept)
+            group.text = " ".join(kept)
+            for later in groups[i + 1:]:
+                report.sentences_dropped += len(split_sentences(later.text))
+                later.text = ""
+            break
+
+    def sentence_plan(self, groups: List[_Group]) -> List[Tuple[int, str, int]]:
+        return [
+            (i, sentence, self.count_tokens(sentence))
+            for i, group in enumerate(groups)
+            for sentence in split_sentences(group.text)
+        ]
+
+    def select(self, groups: List[_Group], plan, similarities, report: PackReport) -> None:
+        """Keep the most query-similar sentences that fit the budget, in reading order."""
+        keep, used = set(), 0
+        for index in np.argsort(-np.asarray(similarities)):
+            tokens = plan[index][2]
+            if used + tokens <= self.token_budget:
+                keep.add(int(index))
+                used += tokens
+        texts: Dict[int, List[str]] = {}
+        for index, (group_index, sentence, _) in enumerate(plan):
+            if index in keep:
+                texts.setdefault(group_index, []).append(sentence)
+        report.sentences_dropped += len(plan) - len(keep)
+        for i, group in enumerate(groups):
+            group.text = " ".join(texts.get(i, []))
+
+    @staticmethod
+    def similarities(query_embedding, sentence_embeddings) -> np.ndarray:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        matrix = np.asarray(sentence_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        return matrix @ query / np.where(norms == 0, 1.0, norms)
+
+    @property
+    def sentence_cache(self) -> PersistentLRUCache:
+        if self._sentence_cache is None:
+            self._sentence_cache = PersistentLRUCache(max_size=self.sentence_cache_size)
+        return self._sentence_cache
+
+    def cached_embeddings(self, plan: List[Tuple[int, str, int]]) -> Tuple[List[str], List[str], list]:
+        """Sentences of the plan, their cache keys and cached embeddings (None when missing)."""
+        sentences = [sentence for _, sentence, _ in plan]
+        keys = [cache_key(self.embed_model.model_name, sentence) for sentence in sentences]
+        return sentences, keys, [self.sentence_cache.get(key) for key in keys]
+
+    def remember_embeddings(self, keys: List[str], embeddings: list, missing: List[int], computed: list) -> list:
+        for i, embedding in zip(missing, computed):
+            embeddings[i] = embedding
+            self.sentence_cache.put(keys[i], embedding)
+        return embeddings
+
+    def needs_compression(self, groups: List[_Group], query_bundle: Optional[QueryBundle]) -> bool:
+        return (
+            self.compress
+            and self.embed_model is not None
+            and query_bundle is not None
+            and sum(g.tokens for g in groups) > self.token_budget
+        )
+
+    def finish(self, groups: List[_Group], report: PackReport) -> List[NodeWithScore]:
+        packed = []
+        for group in groups:
+            if not group.text.strip():
+                continue
+            first = group.nodes[0]
+            if len(group.nodes) == 1 and group.text == first.node.text:
+                packed.append(first)
+                continue
+            node = TextNode(
+                text=group.text,
+                metadata={**first.node.metadata, "merged_node_ids": [n.node.node_id for n in group.nodes]},
+                excluded_embed_metadata_keys=first.node.excluded_embed_metadata_keys + ["merged_node_ids"],
+                excluded_llm_metadata_keys=first.node.excluded_llm_metadata_keys + ["merged_node_ids"],
+                relationships=first.node.relationships,
+            )
+            packed.append(NodeWithScore(node=node, score=group.score))
+
+        report.nodes_out = len(packed)
+        report.tokens_out = sum(self.count_tokens(n.node.text) for n in packed)
+        CONTEXT_TOKENS.labels(kind="retrieved").inc(report.tokens_in)
+        CONTEXT_TOKENS.labels(kind="packed").inc(report.tokens_out)
+        CONTEXT_TOKENS_SAVED.observe(report.tokens_saved)
+        logger.info(
+            f"Packed context: {report.nodes_in} chunks -> {report.nodes_out}, {report.tokens_in} -> "
+            f"{report.tokens_out} tokens ({report.tokens_saved} saved, {report.chunks_merged} merged, "
+            f"{report.sentences_dropped} sentences dropped)"
+        )
+        return packed
+
+    def pack(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None) -> Tuple[List[NodeWithScore], PackReport]:
+        report = PackReport(nodes_in=len(nodes))
+        if not nodes:
+            return [], report
+        groups = self.group(nodes, report)
+        if self.needs_compression(groups, query_bundle):
+            plan = self.sentence_plan(groups)
+            query_embedding = query_bundle.embedding or self.embed_model.get_query_embedding(query_bundle.query_str)
+            sentences, keys, embeddings = self.cached_embeddings(plan)
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                computed = self.embed_model.get_text_embedding_batch([sentences[i] for i in missing])
+                embeddings = self.remember_embeddings(keys, embeddings, missing, computed)
+            self.select(groups, plan, self.similarities(query_embedding, embeddings), report)
+        else:
+            self.fill(groups, report)
+        return self.finish(groups, report), report
+
+    async def apack(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None) -> Tuple[List[NodeWithScore], PackReport]:
+        """Same as `pack` with the missing sentence embeddings requested asynchronously."""
+        report = PackReport(nodes_in=len(nodes))
+        if not nodes:
+            return [], report
+        groups = self.group(nodes, report)
+        if self.needs_compression(groups, query_bundle):
+            plan = self.sentence_plan(groups)
+            query_embedding = query_bundle.embedding or await self.embed_model.aget_query_embedding(query_bundle.query_str)
+            sentences, keys, embeddings = self.cached_embeddings(plan)
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                computed = await self.embed_model.aget_text_embedding_batch([sentences[i] for i in missing])
+                embeddings = self.remember_embeddings(keys, embeddings, missing, computed)
+            self.select(groups, plan, self.similarities(query_embedding, embeddings), report)
+        else:
+            self.fill(groups, report)
+        return self.finish(groups, report), report
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        return self.pack(nodes, query_bundle)[0]
@@ -1,4 +1,5 @@
-from typing import Any, Callable, Dict, List, Optional, Sequence, cast
+import hashlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, cast
 
 from llama_index.core.async_utils import DEFAULT_NUM_WORKERS, run_jobs
 from llama_index.core.bridge.pydantic import (
@@ -13,19 +14,17 @@ from llama_index.core.schema import BaseNode, TextNode
 from llama_index.core.settings import Settings
 from llama_index.core.types import BasePydanticProgram
 from llama_index.core.llms import ChatMessage
-from llama_index.llms.ollama import Ollama
+from src.utils.model_clients import build_embedding_model, build_llm
+from src.utils.persistent_cache import PersistentLRUCache
 
-llm = Ollama(base_url="http://host.docker.internal:11434", model="gemma3:4b-it-q8_0", 
-             request_timeout=3000.0, 
-             temperature=0.0,
-             additional_kwargs={"seed": 42, "num_ctx": 32768})
+# same pooled client layer as the RAG, the server comes from OLLAMA_BASE_URL
+llm = build_llm(model="gemma3:4b-it-q8_0",
+                temperature=0.0,
+                additional_kwargs={"seed": 42, "num_ctx": 32768})
 Settings.llm = llm
 
-from llama_index.embeddings.ollama import OllamaEmbedding
-
-ollama_embedding = OllamaEmbedding(
+ollama_embedding = build_embedding_model(
     model_name="bge-large:latest",
-    base_url="http://host.docker.internal:11434",
     ollama_additional_kwargs={"mirostat": 0},
 )
 Settings.embed_model = ollama_embedding
@@ -48,6 +47,14 @@ class ChunkContextualExtractor(BaseExtractor):
     Attributes:
         llm (SerializeAsAny[LLM]): The language model to use for generation.
         metadata_name (str): Name of the metadata context. Default is "node_context".
+        window_chars (Optional[int]): Caps the document text sent with each chunk. Windows of this size
+            start on a grid of half their size; a chunk is sent with the window starting at the last grid
+            position at or before it, extended to the chunk's end, so the window always contains the chunk
+            and all chunks starting in a grid cell share the prompt prefix that Ollama's cache reuses.
+            None sends the whole document.
+        cache_path (Optional[str]): SQLite file caching contexts by window and chunk hash.
+    Documents are processed concurrently (num_workers), chunks of one document sequentially so the
+    shared prefix stays warm in the cache.
     Methods:
         __init__(llm: Optional[LLM] = None or Settings.llm, metadata_name: Optional[str] = None, num_workers: int = DEFAULT_NUM_WORKERS, **kwargs: Any) -> None:
             Initializes the ChunkContextualExtractor with the given parameters.
@@ -59,19 +66,26 @@ class ChunkContextualExtractor(BaseExtractor):
             Separates nodes by their parent reference document ID.
         combined_text_by_parent_ref_doc_id(nodes: Sequence[BaseNode]) -> Dict:
             Combines text of nodes by their parent reference document ID.
-        extract_page_level_context(combined_texts: Dict, nodes_by_parent_ref_doc_id: Sequence[BaseNode]) -> List:
-            Asynchronously extracts page-level context for the combined texts and nodes.
-        get_node_level_contexts(combined_text: str, nodes: List[BaseNode]) -> List[str]:
+        document_layout(nodes: Sequence[BaseNode]) -> Tuple[str, Dict]:
+            Rebuilds a document's text from its overlapping chunks and locates each chunk in it.
+        extract_page_level_context(layouts: Dict, nodes_by_parent_ref_doc_id: Sequence[BaseNode]) -> Dict:
+            Asynchronously extracts contexts for the document layouts and nodes, keyed by node id.
+        get_node_level_contexts(combined_text: str, nodes: List[BaseNode], spans: Dict) -> List[str]:
             Asynchronously gets node-level contexts for the given combined text and nodes.
     """
 
     llm: SerializeAsAny[LLM] = Field(description="The LLM to use for generation.")
     metadata_name: str = Field(description="Name of metadata of context", default="node_context")
+    window_chars: Optional[int] = Field(description="Document window sent with each chunk", default=8000)
+    cache_path: Optional[str] = Field(description="SQLite file caching chunk contexts", default=None)
+    _cache: PersistentLRUCache = PrivateAttr()
     def __init__(
         self,
         llm: Optional[LLM] = None or Settings.llm,
         metadata_name: Optional[str] = None,
         num_workers: int = DEFAULT_NUM_WORKERS,
+        window_chars: Optional[int] = 8000,
+        cache_path: Optional[str] = None,
         **kwargs: Any,
     ) -> None:
 
@@ -79,21 +93,24 @@ class ChunkContextualExtractor(BaseExtractor):
         super().__init__(
             llm= llm,
             num_workers=num_workers,
+            window_chars=window_chars,
+            cache_path=cache_path,
             **kwargs,
         )
         self.metadata_name = metadata_name
         self.llm = llm
+        self._cache = PersistentLRUCache(max_size=10000, path=cache_path, table="chunk_contexts")
 
     @classmethod
     def class_name(cls) -> str:
         return "PageLevelContextExtractor"
 
     async def aextract(self, nodes: Sequence[BaseNode]) -> List[Dict]:
-        combined_texts = self.combined_text_by_parent_ref_doc_id(nodes)
         separate_nodes = self.separate_nodes_by_parent_ref_doc_id(nodes)
-        llm_responses = await self.extract_page_level_context(combined_texts, separate_nodes)
-        # add to check if returned response in correct order of the nodes.
-        return [{self.metadata_name: llm_response.message.content} for llm_response in llm_responses]
+        layouts = {key: self.document_layout(doc_nodes) for key, doc_nodes in separate_nodes.items()}
+        contexts = await self.extract_page_level_context(layouts, separate_nodes)
+        # contexts come back grouped by document, map them back to the order of the nodes
+        return [{self.metadata_name: contexts[node.node_id]} for node in nodes]
     
     def separate_nodes_by_parent_ref_doc_id(self, nodes: Sequence[BaseNode]) -> Dict:
         separated_items: Dict[Optional[str], List[BaseNode]] = {}
@@ -107,45 +124,94 @@ class ChunkContextualExtractor(BaseExtractor):
         return separated_items
     
     def combined_text_by_parent_ref_doc_id(self, nodes: Sequence[BaseNode]) -> Dict:
-        combined_texts: Dict[Optional[str], str] = {}
-
+        separated_items = self.separate_nodes_by_parent_ref_doc_id(nodes)
+        return {key: self.document_layout(doc_nodes)[0] for key, doc_nodes in separated_items.items()}
+
+    def document_layout(self, nodes: Sequence[BaseNode]) -> Tuple[str, Dict[str, Tuple[int, int]]]:
+        """
+        The text of a parent document and the (start, end) of each node in it. Chunks
+        overlap, so each page's text is rebuilt from the nodes' start_char_idx and
+        end_char_idx instead of joining the chunks. A node without offsets is appended whole.
+        """
+        parts: List[str] = []
+        spans: Dict[str, Tuple[int, int]] = {}
+        page, page_offset, page_end = None, 0, 0
         for node in nodes:
-            key = node.metadata["parent_ref_doc_id"]
-            if key not in combined_texts:
-                combined_texts[key] = ""
-            combined_texts[key] += node.text                
-
-        return combined_texts
+            start, end = node.start_char_idx, node.end_char_idx
+            if start is None or end is None or end - start != len(node.text):
+                page_offset += page_end
+                spans[node.node_id] = (page_offset, page_offset + len(node.text))
+                parts.append(node.text)
+                page, page_offset, page_end = None, page_offset + len(node.text), 0
+                continue
+            if page is None or node.ref_doc_id != page:
+                page, page_offset, page_end = node.ref_doc_id, page_offset + page_end, 0
+            if start > page_end:
+                # the splitter dropped whitespace between chunks, keep the offsets aligned
+                parts.append(" " * (start - page_end))
+                page_end = start
+            if end > page_end:
+                parts.append(node.text[page_end - start:])
+                page_end = end
+            spans[node.node_id] = (page_offset + start, page_offset + end)
+        return "".join(parts), spans
 # seperate page level node by parent doc id
-    async def extract_page_level_context(self, combined_texts: Dict, nodes_by_parent_ref_doc_id: Sequence[BaseNode]) -> List:
-        llm_responses = []
-        for key, combined_text in combined_texts.items():
-            llm_responses.extend(await self.get_node_level_contexts(combined_text, nodes_by_parent_ref_doc_id[key]))
-        return llm_responses
-
-    async def get_node_level_contexts(self, combined_text: str, nodes: List[BaseNode]) -> List[str]:
-        contextualization_jobs = [
-            self.llm.achat([
-            ChatMessage(role="user", 
-                        content=f"""<document> 
-                        {combined_text} 
-                    </document> """),
-
-            ChatMessage(role="user", 
-                        content=f"""
-                    Here is the chunk we want to situate within the whole document: 
-                    <chunk> 
-                        {node.text} 
-                    </chunk> 
-                    Please give a short succinct context to situate this chunk within 
-                    the overall document for the purposes of improving search retrieval of the chunk. 
-                    Answer only with the succinct context and nothing else.
-                    """),
-            ]
-            )
-            for node in nodes
-        ]
-        return await run_jobs(
-            contextualization_jobs, show_progress=self.show_progress, workers=self.num_workers
-        )
-
+    async def extract_page_level_context(self, layouts: Dict, nodes_by_parent_ref_doc_id: Sequence[BaseNode]) -> Dict:
+        async def document_contexts(key, layout):
+            nodes = nodes_by_parent_ref_doc_id[key]
+            combined_text, spans = layout
+            contexts = await self.get_node_level_contexts(combined_text, nodes, spans)
+            return {node.node_id: context for node, context in zip(nodes, contexts)}
+
+        jobs = [document_contexts(key, layout) for key, layout in layouts.items()]
+        contexts_by_node_id = {}
+        for document_result in await run_jobs(jobs, show_progress=self.show_progress, workers=self.num_workers):
+            contexts_by_node_id.update(document_result)
+        return contexts_by_node_id
+
+    def document_window(self, combined_text: str, start: int, end: int) -> str:
+        if not self.window_chars or len(combined_text) <= self.window_chars:
+            return combined_text
+        step = max(self.window_chars // 2, 1)
+        window_start = (start // step) * step
+        return combined_text[window_start:max(window_start + self.window_chars, end)]
+
+    def cache_key(self, window: str, chunk_text: str) -> str:
+        model = getattr(self.llm, "model", self.llm.class_name())
+        digest = hashlib.sha256()
+        for part in (model, window, chunk_text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    async def get_node_level_contexts(self, combined_text: str, nodes: List[BaseNode], spans: Dict) -> List[str]:
+        contexts = []
+        for node in nodes:
+            window = self.document_window(combined_text, *spans[node.node_id])
+            key = self.cache_key(window, node.text)
+            context = await self._cache.aget(key)
+            if context is None:
+                # sequential on purpose: chunks of a window share the first message, so Ollama
+                # reuses the evaluated prompt prefix of the previous call
+                response = await self.llm.achat([
+                ChatMessage(role="user", 
+                            content=f"""<document> 
+                            {window} 
+                        </document> """),
+
+                ChatMessage(role="user", 
+                            content=f"""
+                        Here is the chunk we want to situate within the whole document: 
+                        <chunk> 
+                            {node.text} 
+                        </chunk> 
+                        Please give a short succinct context to situate this chunk within 
+                        the overall document for the purposes of improving search retrieval of the chunk. 
+                        Answer only with the succinct context and nothing else.
+                        """),
+                ]
+                )
+                context = response.message.content
+                await self._cache.aput(key, context)
+            contexts.append(context)
+        return contexts
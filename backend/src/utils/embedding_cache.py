@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import re
+import unicodedata
+from typing import Any, Callable, List, Optional, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr, SerializeAsAny
+
+from src.utils.metrics import STAGE_SECONDS, timed
+from src.utils.micro_batcher import MicroBatcher
+from src.utils.persistent_cache import PersistentLRUCache
+
+
+def normalize_query(text: str) -> str:
+    """Unicode-normalise, casefold and collapse whitespace (both encoders are uncased)."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model and caches its query embeddings by model name and
+    normalised query text. Text (document) embeddings go straight to the wrapped
+    model, ingestion never benefits from the cache and would only flood it.
+
+    With `enable_batching`, async cache misses from concurrent requests are
+    coalesced into one batched call of the wrapped model. That call goes through
+    the text embedding path, so it is only used when the model has no separate
+    query instruction (true for bge-large served by Ollama).
+    """
+
+    embed_model: SerializeAsAny[BaseEmbedding] = Field(description="The wrapped embedding model.")
+    _cache: PersistentLRUCache = PrivateAttr()
+    _batcher: Optional[MicroBatcher] = PrivateAttr(default=None)
+
+    def __init__(self, embed_model: BaseEmbedding, cache: PersistentLRUCache, **kwargs: Any) -> None:
+        super().__init__(
+            embed_model=embed_model,
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> PersistentLRUCache:
+        return self._cache
+
+    @property
+    def batcher(self) -> Optional[MicroBatcher]:
+        return self._batcher
+
+    def enable_batching(self, max_batch_size=32, max_wait_ms=5.0) -> "CachedEmbedding":
+        if not getattr(self.embed_model, "query_instruction", None):
+            self._batcher = MicroBatcher(
+                self._aembed_batch,
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_wait_ms,
+                name="query-embedding",
+            )
+        return self
+
+    async def _aembed_batch(self, texts: List[str]) -> List[Embedding]:
+        return await self.embed_model._aget_text_embeddings(texts)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        text = normalize_query(query)
+        key = cache_key(self.model_name, text)
+        embedding = self._cache.get(key)
+        if embedding is None:
+            with timed(STAGE_SECONDS, stage="embed"):
+                embedding = self.embed_model._get_query_embedding(text)
+            self._cache.put(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        text = normalize_query(query)
+        key = cache_key(self.model_name, text)
+        embedding = await self._cache.aget(key)
+        if embedding is None:
+            with timed(STAGE_SECONDS, stage="embed"):
+                if self._batcher is not None:
+                    embedding = await self._batcher.submit(text)
+                else:
+                    embedding = await self.embed_model._aget_query_embedding(text)
+            await self._cache.aput(key, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self.embed_model._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self.embed_model._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self.embed_model._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self.embed_model._aget_text_embeddings(texts)
+
+
+SparseEncoder = Callable[[List[str]], Tuple[List[List[int]], List[List[float]]]]
+
+
+class CachedSparseEncoder:
+    """
+    Caches a qdrant sparse encoder (texts -> (indices, values)) per normalised text.
+
+    The vector store calls the encoder synchronously, even from its async query
+    path. `aencode` lets the async request path warm the cache ahead of the
+    search, batched across concurrent requests and run off the event loop, so the
+    store's own call is then a cache hit.
+    """
+
+    def __init__(self, encoder: SparseEncoder, cache: PersistentLRUCache, model_name: str) -> None:
+        self.encoder = encoder
+        self.cache = cache
+        self.model_name = model_name
+        self.batcher: Optional[MicroBatcher] = None
+
+    def enable_batching(self, max_batch_size=32, max_wait_ms=5.0, executor=None) -> "CachedSparseEncoder":
+        self.batcher = MicroBatcher(
+            self._encode_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            executor=executor,
+            name="sparse-query-encoding",
+        )
+        return self
+
+    def _encode_batch(self, texts: List[str]) -> list:
+        indices, values = self(texts)
+        return list(zip(indices, values))
+
+    async def aencode(self, text: str) -> Tuple[List[int], List[float]]:
+        key = cache_key(self.model_name, normalize_query(text))
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            return cached[0], cached[1]
+        if self.batcher is not None:
+            return await self.batcher.submit(text)
+        loop = asyncio.get_running_loop()
+        indices, values = await loop.run_in_executor(None, self, [text])
+        return indices[0], values[0]
+
+    def __call__(self, texts: List[str]) -> Tuple[List[List[int]], List[List[float]]]:
+        normalized = [normalize_query(text) for text in texts]
+        keys = [cache_key(self.model_name, text) for text in normalized]
+        results = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            with timed(STAGE_SECONDS, stage="sparse_encode"):
+                indices, values = self.encoder([normalized[i] for i in missing])
+            for i, idx, vals in zip(missing, indices, values):
+                results[i] = [[int(j) for j in idx], [float(v) for v in vals]]
+                self.cache.put(keys[i], results[i])
+
+        return [r[0] for r in results], [r[1] for r in results]
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def file_sha256(path: str, block_size=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class ManifestDiff:
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    # size/mtime/sha256 of new and changed files, recorded once they are ingested
+    fingerprints: Dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def to_ingest(self) -> List[str]:
+        return self.new + self.changed
+
+    @property
+    def to_purge(self) -> List[str]:
+        return self.changed + self.deleted
+
+
+class FileManifest:
+    """
+    Tracks every ingested file by path, size, mtime and content hash together with
+    the doc ids it produced. A file whose size and mtime are unchanged is skipped
+    without reading it; otherwise its content hash decides whether it changed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.files: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)
+
+    def scan(self, folder: str, required_exts: Sequence[str]) -> ManifestDiff:
+        diff = ManifestDiff()
+        present = set()
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+            if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in required_exts:
+                continue
+            path = entry.path
+            present.add(path)
+            stat = entry.stat()
+            known = self.files.get(path)
+            if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                diff.unchanged.append(path)
+                continue
+
+            fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_sha256(path)}
+            if known is None:
+                diff.new.append(path)
+            elif known["sha256"] == fingerprint["sha256"]:
+                # touched but identical, just refresh the stat info
+                known.update(size=stat.st_size, mtime=stat.st_mtime)
+                diff.unchanged.append(path)
+                continue
+            else:
+                diff.changed.append(path)
+            diff.fingerprints[path] = fingerprint
+
+        diff.deleted = sorted(path for path in self.files if path not in present)
+        return diff
+
+    def doc_ids(self, path: str) -> List[str]:
+        return self.files.get(path, {}).get("doc_ids", [])
+
+    def doc_ids_in_use(self, exclude: Sequence[str] = ()) -> set:
+        excluded = set(exclude)
+        return {
+            doc_id
+            for path, info in self.files.items()
+            if path not in excluded
+            for doc_id in info.get("doc_ids", [])
+        }
+
+    def record(self, path: str, fingerprint: dict, doc_ids: List[str]) -> None:
+        self.files[path] = {**fingerprint, "doc_ids": doc_ids}
+
+    def remove(self, path: str) -> None:
+        self.files.pop(path, None)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.files, f, indent=1)
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Saved manifest of {len(self.files)} files to {self.path}")
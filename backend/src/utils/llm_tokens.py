@@ -0,0 +1,46 @@
+"""
+Token counts of LLM calls from the llama-index instrumentation events, kept
+apart from metrics.py so the metrics can be imported without llama-index.
+"""
+from typing import Any
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+
+from src.utils.metrics import LLM_TOKENS
+
+
+def _raw_field(raw: Any, name: str) -> int:
+    value = raw.get(name) if isinstance(raw, dict) else getattr(raw, name, None)
+    return value or 0
+
+
+class LLMTokenHandler(BaseEventHandler):
+    """
+    Counts prompt and completion tokens of every LLM call from the counts Ollama
+    returns with the final response, for streaming and blocking calls alike.
+    Registered on the llama-index root dispatcher, independent of any tracer.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMTokenHandler"
+
+    def handle(self, event, **kwargs) -> None:
+        if isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)) and event.response is not None:
+            raw = event.response.raw
+            if raw is None:
+                return
+            LLM_TOKENS.labels(kind="prompt").inc(_raw_field(raw, "prompt_eval_count"))
+            LLM_TOKENS.labels(kind="completion").inc(_raw_field(raw, "eval_count"))
+
+_token_handler = None
+
+
+def instrument_llm_tokens() -> None:
+    """Register LLMTokenHandler on the root dispatcher, once per process."""
+    global _token_handler
+    if _token_handler is None:
+        _token_handler = LLMTokenHandler()
+        get_dispatcher().add_event_handler(_token_handler)
@@ -1,27 +1,152 @@
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import threading
 from logging import StreamHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# attributes every LogRecord has, anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_traceback_formatter = logging.Formatter()
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+# reports bad logging settings, through the queue once it is set up
+_log = logging.getLogger(__name__)
+_warned = set()
+
+
+def truncate(value, max_chars: int):
+    if max_chars and isinstance(value, str) and len(value) > max_chars:
+        return f"{value[:max_chars]}... [{len(value) - max_chars} chars truncated]"
+    return value
+
+
+def parse_level(value: str, default: int, setting: str) -> int:
+    """A level name or number, `default` (with a warning, once) when it is neither."""
+    value = value.strip().upper()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value)
+    if isinstance(level, int):
+        return level
+    if (setting, value) not in _warned:
+        _warned.add((setting, value))
+        _log.warning(f"Invalid log level {value!r} in {setting}, using {logging.getLevelName(default)}")
+    return default
+
+
+def parse_levels(spec: str, default: int = logging.INFO) -> dict:
+    """Parse "src.RAGs=DEBUG,src.utils.rerankers=WARNING" into {logger name: level}."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = parse_level(level, default, f"LOG_LEVELS ({item})")
+    return levels
+
+
+def level_for(name: str, levels: dict, default: int) -> int:
+    """Level of the most specific configured prefix of the logger name."""
+    best = None
+    for prefix in levels:
+        if name == prefix or name.startswith(prefix + "."):
+            if best is None or len(prefix) > len(best):
+                best = prefix
+    return levels[best] if best is not None else default
 
-def get_logger(name):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
 
-    rfh = RotatingFileHandler("wildlife_rag.log", maxBytes=5242880, backupCount=5)  # 5 MB
-    rfh.setLevel(logging.DEBUG)
+class TruncatingQueueHandler(QueueHandler):
+    """
+    Formats the message on the calling thread, as QueueHandler does, but cuts the
+    message and string `extra` fields to `max_chars` first so long prompts or
+    retrieved context never reach the queue or the file in full.
+    """
 
-    # create console handler with a higher log level
-    ch = StreamHandler()
-    ch.setLevel(logging.INFO)
+    def __init__(self, log_queue, max_chars: int) -> None:
+        super().__init__(log_queue)
+        self.max_chars = max_chars
 
-    # create formatter and add it to the handlers
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    rfh.setFormatter(formatter)
-    ch.setFormatter(formatter)
+    def prepare(self, record):
+        record = copy.copy(record)
+        message = truncate(record.getMessage(), self.max_chars)
+        if record.exc_info:
+            # tracebacks are kept whole
+            message += "\n" + _traceback_formatter.formatException(record.exc_info)
+        if record.stack_info:
+            message += "\n" + record.stack_info
+        record.message = record.msg = message
+        record.args = record.exc_info = record.exc_text = record.stack_info = None
+        for key, value in list(vars(record).items()):
+            if key not in _RECORD_ATTRS:
+                setattr(record, key, truncate(value, self.max_chars))
+        return record
 
-    # add the handlers to the logger
-    logger.addHandler(rfh)
-    logger.addHandler(ch)
 
-    return logger
\ No newline at end of file
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, `extra` fields are included as keys."""
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        return json.dumps(payload, default=str)
+
+
+def configure_logging():
+    """
+    Set up the file and console handlers once per process. Loggers only enqueue
+    records, a QueueListener thread does the formatting and file I/O.
+
+    LOG_LEVEL (default INFO) and LOG_LEVELS ("module=LEVEL,...") set logger levels,
+    LOG_FILE_LEVEL / LOG_CONSOLE_LEVEL the handler levels, LOG_FORMAT=json writes
+    structured lines and LOG_MAX_CHARS caps message and field length.
+    """
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is not None:
+            return _queue_handler
+
+        if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+        rfh = RotatingFileHandler(os.environ.get("LOG_FILE", "wildlife_rag.log"), maxBytes=5242880, backupCount=5)  # 5 MB
+        # create console handler with a higher log level
+        ch = StreamHandler()
+        rfh.setFormatter(formatter)
+        ch.setFormatter(formatter)
+
+        # unbounded so logging never blocks a request, records are small once truncated
+        log_queue = queue.SimpleQueue()
+        _queue_handler = TruncatingQueueHandler(log_queue, int(os.environ.get("LOG_MAX_CHARS", 2000)))
+        _listener = QueueListener(log_queue, rfh, ch, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        _log.addHandler(_queue_handler)
+        _log.propagate = False
+
+        rfh.setLevel(parse_level(os.environ.get("LOG_FILE_LEVEL", "DEBUG"), logging.DEBUG, "LOG_FILE_LEVEL"))
+        ch.setLevel(parse_level(os.environ.get("LOG_CONSOLE_LEVEL", "INFO"), logging.INFO, "LOG_CONSOLE_LEVEL"))
+        return _queue_handler
+
+
+def get_logger(name):
+    handler = configure_logging()
+    logger = logging.getLogger(name)
+    default = parse_level(os.environ.get("LOG_LEVEL", "INFO"), logging.INFO, "LOG_LEVEL")
+    levels = parse_levels(os.environ.get("LOG_LEVELS", ""), default)
+    logger.setLevel(level_for(name, levels, default))
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+    # our handler is the only one, records must not show up again through the root logger
+    logger.propagate = False
+    return logger
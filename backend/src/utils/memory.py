@@ -0,0 +1,24 @@
+import os
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def available_memory_bytes():
+    """Currently available physical memory, None where the platform does not report it."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def adaptive_batch_size(bytes_per_item, minimum=1, maximum=256, memory_fraction=0.25):
+    """Largest batch whose working set fits in `memory_fraction` of the available memory."""
+    available = available_memory_bytes()
+    if available is None:
+        return minimum
+    batch_size = int(available * memory_fraction // bytes_per_item)
+    batch_size = max(minimum, min(maximum, batch_size))
+    logger.debug(f"Adaptive batch size {batch_size} ({available / 2**30:.1f} GiB available)")
+    return batch_size
@@ -0,0 +1,212 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# model calls range from ~5ms (cached rerank batches) to minutes (long generations on CPU)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "wildbot_stage_seconds",
+    "Latency of a RAG stage: condense, embed, sparse_encode, hybrid_search, rerank, context_packing, synthesis, structured_synthesis.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+RERANK_SECONDS = Histogram(
+    "wildbot_rerank_seconds",
+    "Latency of one reranker call over a batch of requests.",
+    ["reranker"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "wildbot_llm_time_to_first_token_seconds",
+    "Time from sending a streaming generation request to its first token.",
+    buckets=LATENCY_BUCKETS,
+)
+LLM_GENERATION_SECONDS = Histogram(
+    "wildbot_llm_generation_seconds",
+    "Total generation time of an answer (blocking, stream) or of one section of a structured answer.",
+    ["mode"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "wildbot_llm_tokens_total",
+    "Tokens processed by the LLM as reported by Ollama.",
+    ["kind"],
+)
+CONTEXT_TOKENS = Counter(
+    "wildbot_context_tokens_total",
+    "Tokens of the reranked chunks (retrieved) and of the context sent to the LLM (packed).",
+    ["kind"],
+)
+CONTEXT_TOKENS_SAVED = Histogram(
+    "wildbot_context_tokens_saved",
+    "Prompt tokens saved per request by context packing.",
+    buckets=(0, 25, 50, 100, 200, 400, 800, 1600, 3200),
+)
+RAG_QUERIES = Counter(
+    "wildbot_rag_queries_total",
+    "RAG queries by entry point and whether the answer cache served them.",
+    ["mode", "cached"],
+)
+RAG_IN_PROGRESS = Gauge(
+    "wildbot_rag_queries_in_progress",
+    "RAG queries currently being answered.",
+    ["mode"],
+)
+ROUTER_DECISIONS = Counter(
+    "wildbot_router_decisions_total",
+    "Queries by route (rag, greeting, off_topic) and the signal that decided it.",
+    ["route", "reason"],
+)
+ROUTER_SECONDS = Histogram(
+    "wildbot_router_seconds",
+    "Time the query router took to decide, including the optional embedding check.",
+    ["route"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+CHAT_SESSIONS = Gauge("wildbot_chat_sessions", "Chat sessions held in memory.")
+CHAT_SESSIONS_EVICTED = Counter(
+    "wildbot_chat_sessions_evicted_total",
+    "Chat sessions dropped by reason: lru, ttl or deleted.",
+    ["reason"],
+)
+MODEL_CALLS = Counter(
+    "wildbot_model_calls_total",
+    "Ollama calls by endpoint (llm:<model>, embed:<model>) and outcome: ok, error, rejected (circuit open) or fallback.",
+    ["endpoint", "outcome"],
+)
+MODEL_RETRIES = Counter(
+    "wildbot_model_retries_total",
+    "Retried Ollama call attempts by endpoint and error type.",
+    ["endpoint", "reason"],
+)
+CIRCUIT_STATE = Gauge(
+    "wildbot_model_circuit_state",
+    "Circuit breaker of a model endpoint: 0 closed, 1 half open, 2 open.",
+    ["endpoint"],
+)
+ADMISSION_ACTIVE = Gauge("wildbot_admission_active", "Generations holding an admission slot.")
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "wildbot_admission_queue_depth",
+    "Requests waiting for a generation slot by priority class.",
+    ["priority"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "wildbot_admission_wait_seconds",
+    "Time admitted requests waited for a generation slot.",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "wildbot_admission_rejected_total",
+    "Requests turned away by admission control: queue_full (429) or queue_timeout (503).",
+    ["priority", "reason"],
+)
+HTTP_IN_PROGRESS = Gauge(
+    "wildbot_http_requests_in_progress",
+    "HTTP requests currently being handled.",
+    ["method"],
+)
+HTTP_SECONDS = Histogram(
+    "wildbot_http_request_seconds",
+    "Time until the response headers are sent, streaming bodies are not included.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+INGESTED_FILES = Counter(
+    "wildbot_ingestion_files_total",
+    "Files seen by ingestion runs by manifest status.",
+    ["status"],
+)
+INGESTED_DOCUMENTS = Counter("wildbot_ingestion_documents_total", "Documents (pdf pages) parsed by ingestion.")
+INGESTED_NODES = Counter("wildbot_ingestion_nodes_total", "Chunks embedded and upserted by ingestion.")
+INGESTION_SECONDS = Counter("wildbot_ingestion_seconds_total", "Time spent parsing, embedding and upserting.")
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the block, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
+
+
+def record_ingestion(summary: dict) -> None:
+    for status in ("new", "changed", "deleted"):
+        INGESTED_FILES.labels(status=status).inc(len(summary[status]))
+    INGESTED_FILES.labels(status="skipped").inc(summary["skipped"])
+    INGESTED_DOCUMENTS.inc(summary["documents_parsed"])
+    INGESTED_NODES.inc(summary["nodes_inserted"])
+    INGESTION_SECONDS.inc(summary["seconds"])
+
+
+class RAGStatsCollector:
+    """
+    Exposes the counters the RAG components already keep (cache hits, rerank
+    cascade exits, micro-batch sizes) at scrape time, so the hot paths need no
+    extra bookkeeping. `get_rag` returns None until the RAG is built.
+    """
+
+    def __init__(self, get_rag: Callable[[], Any]) -> None:
+        self.get_rag = get_rag
+
+    def collect(self):
+        rag = self.get_rag()
+        if rag is None:
+            return
+
+        lookups = CounterMetricFamily("wildbot_cache_lookups", "Cache lookups by cache and result.", labels=["cache", "result"])
+        hit_ratio = GaugeMetricFamily("wildbot_cache_hit_ratio", "Hit ratio since start.", labels=["cache"])
+        size = GaugeMetricFamily("wildbot_cache_entries", "Entries held in memory.", labels=["cache"])
+        for name, cache in (("answer", rag.answer_cache), ("embedding", rag.embedding_cache)):
+            stats = cache.stats()
+            lookups.add_metric([name, "hit"], stats["hits"])
+            lookups.add_metric([name, "miss"], stats["misses"])
+            hit_ratio.add_metric([name], stats["hit_ratio"])
+            size.add_metric([name], stats["size"])
+        yield lookups
+        yield hit_ratio
+        yield size
+
+        cascade = rag.reranker.stats()
+        yield CounterMetricFamily("wildbot_rerank_queries", "Queries reranked by the cascade.", value=cascade["queries"])
+        yield CounterMetricFamily("wildbot_rerank_early_exits", "Queries that skipped later rerank stages.", value=cascade["early_exits"])
+        stage_runs = CounterMetricFamily("wildbot_rerank_stage_runs", "Queries scored per rerank stage.", labels=["reranker"])
+        for stage, runs in cascade["stage_runs"].items():
+            stage_runs.add_metric([stage], runs)
+        yield stage_runs
+
+        batches = CounterMetricFamily("wildbot_microbatch_batches", "Model calls made by a micro-batcher.", labels=["batcher"])
+        items = CounterMetricFamily("wildbot_microbatch_items", "Requests coalesced by a micro-batcher.", labels=["batcher"])
+        for batcher in (rag.embed_model.batcher, rag.sparse_query_encoder.batcher, rag.rerank_batcher):
+            if batcher is None:
+                continue
+            stats = batcher.stats()
+            batches.add_metric([batcher.name], stats["batches"])
+            items.add_metric([batcher.name], stats["items"])
+        yield batches
+        yield items
+
+
+class ModelPoolCollector:
+    """Connections of the shared Ollama pools at scrape time, `get_stats` is model_clients.all_pool_stats."""
+
+    def __init__(self, get_stats: Callable[[], dict]) -> None:
+        self.get_stats = get_stats
+
+    def collect(self):
+        connections = GaugeMetricFamily(
+            "wildbot_model_pool_connections",
+            "Open connections of the shared Ollama pools by state.",
+            labels=["base_url", "pool", "state"],
+        )
+        for base_url, pools in self.get_stats().items():
+            for pool, counts in pools.items():
+                for state, count in counts.items():
+                    connections.add_metric([base_url, pool, state], count)
+        yield connections
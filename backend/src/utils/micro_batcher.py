@@ -0,0 +1,113 @@
+import asyncio
+import inspect
+from typing import Any, Callable, List, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests for up to `max_wait_ms` (or until
+    `max_batch_size` items are pending), runs `batch_fn` once on the whole batch and
+    hands each caller its own result. `batch_fn` takes a list of items and returns a
+    list of results in the same order; sync functions run in `executor`.
+
+    The queue and the worker task are created lazily on the first submit so the
+    batcher can be built before the event loop exists.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Any],
+        max_batch_size=16,
+        max_wait_ms=5.0,
+        executor=None,
+        max_concurrent_batches=1,
+        name="batcher",
+    ) -> None:
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_concurrent_batches = max_concurrent_batches
+        self.name = name
+        self.batches = 0
+        self.items = 0
+
+        self._is_async = inspect.iscoroutinefunction(batch_fn)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight = set()
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = loop.create_task(self._run(), name=f"{self.name}-worker")
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            await self._slots.acquire()
+            task = self._loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        items = [item for item, _ in batch]
+        try:
+            if self._is_async:
+                results = await self.batch_fn(items)
+            else:
+                results = await self._loop.run_in_executor(self.executor, self.batch_fn, items)
+            results = list(results)
+            if len(results) != len(items):
+                # zip would leave the callers without a result waiting forever
+                raise ValueError(f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items")
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            logger.exception(f"{self.name}: batch of {len(items)} failed")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,249 @@
+"""
+One client layer for every Ollama model call.
+
+All LLM and embedding models of a server share keep-alive connection pools (one
+sync pool, one async pool per event loop). Every call gets a deadline, is
+retried on connection errors, timeouts and 5xx/429 with jittered exponential
+backoff, and goes through a per-model circuit breaker that fails fast while the
+model keeps failing. An LLM can fall back to a smaller model when its retries
+are used up or its circuit is open; embeddings never fall back, vectors of
+another model would not match the collection.
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.ollama import OllamaEmbedding
+from llama_index.llms.ollama import Ollama
+from ollama import AsyncClient, Client
+
+from src.utils.resilience import ModelClientConfig, ResilientCall
+
+class OllamaClients:
+    """Shared pools and call policies of one Ollama server."""
+
+    def __init__(self, config: ModelClientConfig) -> None:
+        self.config = config
+        self.limits = httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        )
+        # clients of different purposes differ in timeouts only and share the transport, i.e. the pool
+        self._transport = httpx.HTTPTransport(limits=self.limits)
+        self._clients: Dict[str, Client] = {}
+        # async connections belong to the event loop that opened them
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = weakref.WeakKeyDictionary()
+        self._calls: Dict[str, ResilientCall] = {}
+        self._lock = threading.Lock()
+
+    def timeout(self, purpose: str) -> httpx.Timeout:
+        read = self.config.llm_deadline if purpose == "llm" else self.config.embed_deadline
+        return httpx.Timeout(read, connect=self.config.connect_timeout)
+
+    def client(self, purpose: str) -> Client:
+        with self._lock:
+            if purpose not in self._clients:
+                self._clients[purpose] = Client(
+                    host=self.config.base_url, timeout=self.timeout(purpose), transport=self._transport
+                )
+            return self._clients[purpose]
+
+    def async_client(self, purpose: str) -> AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async:
+                self._async[loop] = (httpx.AsyncHTTPTransport(limits=self.limits), {})
+            transport, clients = self._async[loop]
+            if purpose not in clients:
+                clients[purpose] = AsyncClient(
+                    host=self.config.base_url, timeout=self.timeout(purpose), transport=transport
+                )
+            return clients[purpose]
+
+    def resilience(self, endpoint: str, deadline: float) -> ResilientCall:
+        with self._lock:
+            if endpoint not in self._calls:
+                self._calls[endpoint] = ResilientCall(endpoint, self.config, deadline)
+            return self._calls[endpoint]
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Active and idle connections per pool, read from the httpcore pool behind the transport."""
+        with self._lock:
+            transports = [("sync", self._transport)] + [("async", t) for t, _ in self._async.values()]
+        stats = {}
+        for kind, transport in transports:
+            connections = getattr(getattr(transport, "_pool", None), "connections", [])
+            idle = sum(1 for c in connections if c.is_idle())
+            pool = stats.setdefault(kind, {"active": 0, "idle": 0})
+            pool["active"] += len(connections) - idle
+            pool["idle"] += idle
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.config.base_url,
+            "pools": self.pool_stats(),
+            "endpoints": {name: call.stats() for name, call in self._calls.items()},
+        }
+
+
+_shared: Dict[str, OllamaClients] = {}
+_shared_lock = threading.Lock()
+
+
+def get_ollama_clients(base_url: Optional[str] = None) -> OllamaClients:
+    config = ModelClientConfig.from_env(base_url)
+    with _shared_lock:
+        if config.base_url not in _shared:
+            _shared[config.base_url] = OllamaClients(config)
+        return _shared[config.base_url]
+
+
+def all_pool_stats() -> Dict[str, Dict[str, Dict[str, int]]]:
+    return {base_url: clients.pool_stats() for base_url, clients in list(_shared.items())}
+
+
+def stats() -> list:
+    return [clients.stats() for clients in list(_shared.values())]
+
+
+def _first_chunk(gen):
+    return gen, next(gen, None)
+
+
+async def _afirst_chunk(stream):
+    gen = await stream
+    return gen, await anext(gen, None)
+
+
+def _chain_first(first, gen):
+    if first is not None:
+        yield first
+    yield from gen
+
+
+async def _achain_first(first, gen):
+    if first is not None:
+        yield first
+    async for chunk in gen:
+        yield chunk
+
+
+class ResilientOllama(Ollama):
+    """
+    Ollama LLM on the shared pools. Streams are retried (and fall back) only
+    until their first chunk arrived, a started answer is never sent twice.
+    """
+
+    _clients: Any = PrivateAttr(default=None)
+    _resilience: Any = PrivateAttr(default=None)
+    _fallback: Any = PrivateAttr(default=None)
+
+    def __init__(self, clients: OllamaClients, fallback: Optional["ResilientOllama"] = None, **kwargs: Any) -> None:
+        super().__init__(base_url=clients.config.base_url, request_timeout=clients.config.llm_deadline, **kwargs)
+        self._clients = clients
+        self._resilience = clients.resilience(f"llm:{self.model}", clients.config.llm_deadline)
+        self._fallback = fallback
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ResilientOllama"
+
+    @property
+    def client(self) -> Client:
+        return self._clients.client("llm")
+
+    @property
+    def async_client(self) -> AsyncClient:
+        return self._clients.async_client("llm")
+
+    def _fallback_call(self, method: str, *args, **kwargs):
+        if self._fallback is None:
+            return None
+        return lambda: getattr(self._fallback, method)(*args, **kwargs)
+
+    def chat(self, messages, **kwargs):
+        return self._resilience.call(
+            lambda: Ollama.chat(self, messages, **kwargs),
+            self._fallback_call("chat", messages, **kwargs),
+        )
+
+    async def achat(self, messages, **kwargs):
+        return await self._resilience.acall(
+            lambda: Ollama.achat(self, messages, **kwargs),
+            self._fallback_call("achat", messages, **kwargs),
+        )
+
+    def stream_chat(self, messages, **kwargs):
+        fallback = None
+        if self._fallback is not None:
+            fallback = lambda: _first_chunk(self._fallback.stream_chat(messages, **kwargs))
+        gen, first = self._resilience.call(lambda: _first_chunk(Ollama.stream_chat(self, messages, **kwargs)), fallback)
+        return _chain_first(first, gen)
+
+    async def astream_chat(self, messages, **kwargs):
+        fallback = None
+        if self._fallback is not None:
+            fallback = lambda: _afirst_chunk(self._fallback.astream_chat(messages, **kwargs))
+        gen, first = await self._resilience.acall(
+            lambda: _afirst_chunk(Ollama.astream_chat(self, messages, **kwargs)), fallback
+        )
+        return _achain_first(first, gen)
+
+
+class ResilientOllamaEmbedding(OllamaEmbedding):
+    """Ollama embeddings on the shared pools with deadline, retries and circuit breaker, no fallback."""
+
+    _clients: Any = PrivateAttr(default=None)
+    _resilience: Any = PrivateAttr(default=None)
+
+    def __init__(self, clients: OllamaClients, **kwargs: Any) -> None:
+        super().__init__(base_url=clients.config.base_url, **kwargs)
+        self._clients = clients
+        self._resilience = clients.resilience(f"embed:{self.model_name}", clients.config.embed_deadline)
+        self._client = clients.client("embed")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ResilientOllamaEmbedding"
+
+    def _bind_async_client(self) -> None:
+        self._async_client = self._clients.async_client("embed")
+
+    def _get_query_embedding(self, query: str):
+        return self._resilience.call(lambda: OllamaEmbedding._get_query_embedding(self, query))
+
+    def _get_text_embedding(self, text: str):
+        return self._resilience.call(lambda: OllamaEmbedding._get_text_embedding(self, text))
+
+    def _get_text_embeddings(self, texts):
+        return self._resilience.call(lambda: OllamaEmbedding._get_text_embeddings(self, texts))
+
+    async def _aget_query_embedding(self, query: str):
+        self._bind_async_client()
+        return await self._resilience.acall(lambda: OllamaEmbedding._aget_query_embedding(self, query))
+
+    async def _aget_text_embedding(self, text: str):
+        self._bind_async_client()
+        return await self._resilience.acall(lambda: OllamaEmbedding._aget_text_embedding(self, text))
+
+    async def _aget_text_embeddings(self, texts):
+        self._bind_async_client()
+        return await self._resilience.acall(lambda: OllamaEmbedding._aget_text_embeddings(self, texts))
+
+
+def build_llm(model: str = "gemma3:4b-it-q8_0", base_url: Optional[str] = None, **kwargs: Any) -> ResilientOllama:
+    """An LLM on the shared client layer, backed by OLLAMA_FALLBACK_MODEL when set."""
+    clients = get_ollama_clients(base_url)
+    fallback = None
+    if clients.config.fallback_model and clients.config.fallback_model != model:
+        fallback = ResilientOllama(clients, model=clients.config.fallback_model, **kwargs)
+    return ResilientOllama(clients, fallback=fallback, model=model, **kwargs)
+
+
+def build_embedding_model(model_name: str = "bge-large:latest", base_url: Optional[str] = None, **kwargs: Any) -> ResilientOllamaEmbedding:
+    return ResilientOllamaEmbedding(get_ollama_clients(base_url), model_name=model_name, **kwargs)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_MISSING = object()
+
+
+class PersistentLRUCache:
+    """
+    Bounded in-memory LRU cache of JSON serialisable values with an optional SQLite
+    backing file. Memory lookups are served first, misses fall back to disk and are
+    promoted into memory, so the cache survives restarts without loading the whole
+    file up front.
+
+    The file is bounded by `max_size` too: every row has an access time and the
+    least recently used rows are deleted once there are more. Memory hits do not
+    write, their access times are kept and flushed before the next trim.
+    `aget` / `aput` serve memory on the event loop and do the SQLite I/O in a thread.
+    """
+
+    def __init__(self, max_size=10000, path: Optional[str] = None, table="cache") -> None:
+        self.max_size = max_size
+        self.path = path
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        # access times of memory hits not yet written to disk
+        self._touched: Dict[str, float] = {}
+        self._disk_lock = threading.Lock()
+        self._disk_rows = 0
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if "accessed" not in columns:
+                # files written before rows had access times, they are trimmed first
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)")
+            self._disk_rows = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            with self._disk_lock:
+                self._trim()
+            logger.info(f"Persistent cache '{table}' backed by {path} ({self._disk_rows} entries)")
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_size:
+            evicted, _ = self._memory.popitem(last=False)
+            self._touched.pop(evicted, None)
+
+    def _get_memory(self, key: str) -> Any:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                if self._conn is not None:
+                    self._touched[key] = time.time()
+                self.hits += 1
+                return self._memory[key]
+            if self._conn is None:
+                self.misses += 1
+                return None
+            return _MISSING
+
+    def _get_disk(self, key: str) -> Optional[Any]:
+        with self._disk_lock:
+            row = self._conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            value = json.loads(row[0])
+            self._remember(key, value)
+            self.hits += 1
+            return value
+
+    def _put_disk(self, key: str, value: Any) -> None:
+        with self._disk_lock:
+            exists = self._conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, accessed) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            if exists is None:
+                self._disk_rows += 1
+            self._trim()
+
+    def _trim(self) -> None:
+        """Delete the least recently used rows beyond `max_size`, holding the disk lock."""
+        excess = self._disk_rows - self.max_size
+        if excess <= 0:
+            return
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            self._conn.executemany(
+                f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in touched.items()],
+            )
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY accessed, rowid LIMIT ?)",
+            (excess,),
+        )
+        self._disk_rows -= excess
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._get_memory(key)
+        if value is _MISSING:
+            return self._get_disk(key)
+        return value
+
+    async def aget(self, key: str) -> Optional[Any]:
+        value = self._get_memory(key)
+        if value is _MISSING:
+            return await asyncio.to_thread(self._get_disk, key)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._remember(key, value)
+        if self._conn is not None:
+            self._put_disk(key, value)
+
+    async def aput(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._remember(key, value)
+        if self._conn is not None:
+            await asyncio.to_thread(self._put_disk, key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        if self._conn is not None:
+            with self._disk_lock:
+                self._conn.execute(f"DELETE FROM {self.table}")
+                self._disk_rows = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._memory),
+            "max_size": self.max_size,
+            "persistent": self._conn is not None,
+            "disk_size": self._disk_rows,
+        }
@@ -0,0 +1,277 @@
+"""
+Explicit creation, tuning and in-place migration of the hybrid Qdrant collection.
+
+    cd backend
+    python -m src.utils.qdrant_collection show wlidlife_research_papers
+    python -m src.utils.qdrant_collection migrate wlidlife_research_papers --quantization binary --hnsw-m 32
+"""
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Optional, Tuple
+
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# the names QdrantVectorStore uses when it creates a hybrid collection itself
+DENSE_VECTOR_NAME = "text-dense"
+SPARSE_VECTOR_NAME = "text-sparse-new"
+# sparse vector of collections from older llama-index versions, encoded with naver's SPLADE
+LEGACY_SPARSE_VECTOR_NAME = "text-sparse"
+LEGACY_SPARSE_DOC_MODEL = "naver/efficient-splade-VI-BT-large-doc"
+LEGACY_SPARSE_QUERY_MODEL = "naver/efficient-splade-VI-BT-large-query"
+
+PAYLOAD_SCHEMA_TYPES = {
+    "keyword": models.PayloadSchemaType.KEYWORD,
+    "integer": models.PayloadSchemaType.INTEGER,
+    "text": models.PayloadSchemaType.TEXT,
+}
+
+
+def _parse_bool(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return _parse_bool(os.environ.get(name, default))
+
+
+@dataclass
+class CollectionProfile:
+    """How the collection is stored and searched, every knob can be set through the environment."""
+
+    dim: int = 1024  # bge-large
+    distance: str = "Cosine"
+    # "scalar" (int8, 4x smaller), "binary" (1 bit, 32x smaller, needs rescoring) or "none"
+    quantization: str = "scalar"
+    # quantized vectors stay in RAM, the fp32 originals only serve rescoring and can live on disk
+    quantized_always_ram: bool = True
+    on_disk: bool = True
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    hnsw_on_disk: bool = False
+    # search time
+    search_ef: int = 128
+    rescore: bool = True
+    oversampling: float = 2.0
+    # metadata keys written by PDF4LLMReader, doc_id is what deletes filter on
+    payload_indexes: Dict[str, str] = field(default_factory=lambda: {
+        "parent_ref_doc_id": "keyword",
+        "page_num": "integer",
+        "doc_title": "keyword",
+        "doc_id": "keyword",
+    })
+
+    @classmethod
+    def from_env(cls) -> "CollectionProfile":
+        return cls(
+            dim=int(os.environ.get("QDRANT_VECTOR_DIM", cls.dim)),
+            quantization=os.environ.get("QDRANT_QUANTIZATION", cls.quantization).lower(),
+            on_disk=_env_bool("QDRANT_ON_DISK", cls.on_disk),
+            hnsw_m=int(os.environ.get("QDRANT_HNSW_M", cls.hnsw_m)),
+            hnsw_ef_construct=int(os.environ.get("QDRANT_HNSW_EF_CONSTRUCT", cls.hnsw_ef_construct)),
+            hnsw_on_disk=_env_bool("QDRANT_HNSW_ON_DISK", cls.hnsw_on_disk),
+            search_ef=int(os.environ.get("QDRANT_SEARCH_EF", cls.search_ef)),
+            rescore=_env_bool("QDRANT_RESCORE", cls.rescore),
+            oversampling=float(os.environ.get("QDRANT_OVERSAMPLING", cls.oversampling)),
+        )
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct, on_disk=self.hnsw_on_disk)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8, quantile=0.99, always_ram=self.quantized_always_ram
+                )
+            )
+        if self.quantization == "binary":
+            return models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=self.quantized_always_ram)
+            )
+        if self.quantization == "none":
+            return None
+        raise ValueError(f"Unknown quantization {self.quantization!r}, use scalar, binary or none")
+
+    def search_params(self) -> models.SearchParams:
+        quantization = None
+        if self.quantization != "none":
+            quantization = models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        return models.SearchParams(hnsw_ef=self.search_ef, quantization=quantization)
+
+
+def vector_names(info) -> Tuple[Optional[str], Optional[str]]:
+    """(dense, sparse) vector names of an existing collection."""
+    vectors = info.config.params.vectors
+    sparse = info.config.params.sparse_vectors or {}
+    dense_name = next(iter(vectors), None) if isinstance(vectors, dict) else None
+    return dense_name, next(iter(sparse), None)
+
+
+def ensure_payload_indexes(client: QdrantClient, collection_name: str, profile: CollectionProfile) -> list:
+    existing = client.get_collection(collection_name).payload_schema or {}
+    created = []
+    for field_name, schema in profile.payload_indexes.items():
+        if field_name in existing:
+            continue
+        client.create_payload_index(collection_name, field_name=field_name, field_schema=PAYLOAD_SCHEMA_TYPES[schema])
+        created.append(field_name)
+    if created:
+        logger.info(f"Created payload indexes on {created} in {collection_name}")
+    return created
+
+
+def ensure_collection(client: QdrantClient, collection_name: str, profile: CollectionProfile) -> Tuple[str, str]:
+    """
+    Create the hybrid collection with the profile's storage, HNSW and quantization
+    settings if it does not exist yet, and make sure its payload indexes exist.
+    Returns the (dense, sparse) vector names to use, an older collection keeps
+    its own names (use `migrate_collection` to retune it).
+    """
+    if client.collection_exists(collection_name):
+        dense_name, sparse_name = vector_names(client.get_collection(collection_name))
+        ensure_payload_indexes(client, collection_name, profile)
+        return dense_name or DENSE_VECTOR_NAME, sparse_name or SPARSE_VECTOR_NAME
+
+    client.create_collection(
+        collection_name,
+        vectors_config={
+            DENSE_VECTOR_NAME: models.VectorParams(
+                size=profile.dim,
+                distance=models.Distance(profile.distance),
+                on_disk=profile.on_disk,
+            )
+        },
+        sparse_vectors_config={
+            SPARSE_VECTOR_NAME: models.SparseVectorParams(index=models.SparseIndexParams(on_disk=False))
+        },
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+    )
+    logger.info(f"Created collection {collection_name}: {asdict(profile)}")
+    ensure_payload_indexes(client, collection_name, profile)
+    return DENSE_VECTOR_NAME, SPARSE_VECTOR_NAME
+
+
+def wait_until_green(client: QdrantClient, collection_name: str, timeout=600, poll_seconds=1.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.get_collection(collection_name).status == models.CollectionStatus.GREEN:
+            return True
+        time.sleep(poll_seconds)
+    return False
+
+
+def migrate_collection(client: QdrantClient, collection_name: str, profile: CollectionProfile, wait=True, timeout=600) -> dict:
+    """
+    Retune an existing collection in place: on-disk storage, HNSW graph and
+    quantization are changed with update_collection and Qdrant rebuilds the
+    segments in the background while the collection keeps serving. The vector
+    size and distance cannot change in place and raise ValueError.
+    """
+    info = client.get_collection(collection_name)
+    dense_name, _ = vector_names(info)
+    if dense_name is None:
+        raise ValueError(f"{collection_name} has no named dense vector")
+    params = info.config.params.vectors[dense_name]
+    if params.size != profile.dim or params.distance != models.Distance(profile.distance):
+        raise ValueError(
+            f"{collection_name} stores {params.size}-dim {params.distance} vectors, the profile wants "
+            f"{profile.dim}-dim {profile.distance}: re-ingest into a new collection instead"
+        )
+
+    client.update_collection(
+        collection_name,
+        vectors_config={dense_name: models.VectorParamsDiff(on_disk=profile.on_disk, hnsw_config=profile.hnsw_config())},
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config() or models.Disabled.DISABLED,
+    )
+    created = ensure_payload_indexes(client, collection_name, profile)
+    logger.info(f"Migrating {collection_name} to {asdict(profile)}")
+
+    green = wait_until_green(client, collection_name, timeout=timeout) if wait else None
+    return {"collection": collection_name, "payload_indexes_created": created, "green": green}
+
+
+class _SearchParamsInjector:
+    """Adds the profile's search params to dense searches that do not set their own."""
+
+    def __init__(self, search_params: models.SearchParams, dense_vector_name: str) -> None:
+        self.search_params = search_params
+        self.dense_vector_name = dense_vector_name
+
+    def query_kwargs(self, kwargs: dict) -> dict:
+        prefetch = kwargs.get("prefetch")
+        if prefetch:
+            for p in prefetch if isinstance(prefetch, list) else [prefetch]:
+                if p.using == self.dense_vector_name and p.params is None:
+                    p.params = self.search_params
+        elif kwargs.get("using") == self.dense_vector_name and kwargs.get("search_params") is None:
+            kwargs["search_params"] = self.search_params
+        return kwargs
+
+    def search_requests(self, requests: list) -> list:
+        for request in requests:
+            vector = getattr(request, "vector", None)
+            if getattr(vector, "name", None) == self.dense_vector_name and request.params is None:
+                request.params = self.search_params
+        return requests
+
+
+class TunedQdrantClient(QdrantClient):
+    """QdrantClient whose dense searches use the collection profile's hnsw_ef and rescoring."""
+
+    def __init__(self, *args, search_params: models.SearchParams, dense_vector_name=DENSE_VECTOR_NAME, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.injector = _SearchParamsInjector(search_params, dense_vector_name)
+
+    def query_points(self, collection_name, **kwargs):
+        return super().query_points(collection_name, **self.injector.query_kwargs(kwargs))
+
+    def search_batch(self, collection_name, requests, **kwargs):
+        return super().search_batch(collection_name, self.injector.search_requests(requests), **kwargs)
+
+
+class AsyncTunedQdrantClient(AsyncQdrantClient):
+    """Async counterpart of TunedQdrantClient."""
+
+    def __init__(self, *args, search_params: models.SearchParams, dense_vector_name=DENSE_VECTOR_NAME, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.injector = _SearchParamsInjector(search_params, dense_vector_name)
+
+    async def query_points(self, collection_name, **kwargs):
+        return await super().query_points(collection_name, **self.injector.query_kwargs(kwargs))
+
+    async def search_batch(self, collection_name, requests, **kwargs):
+        return await super().search_batch(collection_name, self.injector.search_requests(requests), **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["show", "migrate"])
+    parser.add_argument("collection")
+    parser.add_argument("--host", default=os.environ.get("QDRANT_HOST", "qdrant"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("QDRANT_PORT", 6333)))
+    parser.add_argument("--quantization", choices=["scalar", "binary", "none"])
+    parser.add_argument("--on-disk", type=_parse_bool, metavar="true|false")
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--hnsw-ef-construct", type=int)
+    parser.add_argument("--no-wait", action="store_true", help="return before the optimizer finished")
+    parser.add_argument("--timeout", type=int, default=600)
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(host=args.host, port=args.port)
+    if args.command == "show":
+        print(qdrant.get_collection(args.collection).model_dump_json(indent=2))
+    else:
+        profile = CollectionProfile.from_env()
+        for name in ("quantization", "on_disk", "hnsw_m", "hnsw_ef_construct"):
+            if getattr(args, name) is not None:
+                setattr(profile, name, getattr(args, name))
+        print(json.dumps(migrate_collection(qdrant, args.collection, profile, wait=not args.no_wait, timeout=args.timeout), indent=2))
@@ -0,0 +1,194 @@
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.logger import get_logger
+from src.utils.metrics import ROUTER_DECISIONS, ROUTER_SECONDS
+
+logger = get_logger(__name__)
+
+RAG = "rag"
+GREETING = "greeting"
+OFF_TOPIC = "off_topic"
+
+_WORD = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+# a query made only of greeting and filler words, with at least one greeting, is small talk
+GREETING_WORDS = {
+    "hi", "hello", "hey", "hiya", "yo", "sup", "greetings", "morning", "afternoon", "evening", "night",
+    "thanks", "thank", "thx", "cheers", "bye", "goodbye", "ok", "okay", "cool", "great", "nice",
+}
+# never small talk on their own, "how much?" or "so?" is a follow-up question
+FILLER_WORDS = {"good", "how", "are", "you", "doing", "what's", "whats", "up", "there", "bot", "wildbot", "please", "much", "so"}
+GREETING_PHRASES = {("how", "are", "you"), ("what's", "up"), ("whats", "up")}
+THANKS_WORDS = {"thanks", "thank", "thx", "cheers"}
+FAREWELL_WORDS = {"bye", "goodbye", "night"}
+
+GREETING_ANSWER = (
+    "Hello! I can answer questions about wildlife, biodiversity and conservation research, "
+    "for example the status of a species, human-wildlife conflict or habitat protection."
+)
+THANKS_ANSWER = "You're welcome! Ask me anything else about wildlife and conservation."
+FAREWELL_ANSWER = "Goodbye! Come back any time with questions about wildlife and conservation."
+OFF_TOPIC_ANSWER = (
+    "Currently this is not part of my knowledge base. I can help with questions about wildlife, "
+    "biodiversity, ecology and conservation."
+)
+
+# descriptions embedded once as topic centroids for queries without a keyword
+ON_TOPIC_DESCRIPTIONS = [
+    "wildlife conservation and protection of endangered species",
+    "human-wildlife conflict, crop raiding and livestock depredation",
+    "forest ecology, habitats, protected areas and wildlife corridors",
+    "biodiversity surveys, population estimates and ecological research",
+    "climate change and pollution impacts on ecosystems and animals",
+    "wildlife laws, poaching, trade and conservation policy in India",
+]
+OFF_TOPIC_DESCRIPTIONS = [
+    "programming, software bugs and computer code",
+    "cooking recipes and restaurant food",
+    "sports matches, scores and players",
+    "movies, music, celebrities and entertainment",
+    "stock market, cryptocurrency and personal finance",
+    "math homework and arithmetic",
+]
+
+
+def normalize_token(token: str) -> str:
+    """Crude singular form so "tigers" matches "tiger" and "species" matches itself."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "xes", "sses")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def is_small_talk(tokens: List[str]) -> bool:
+    if not tokens or not all(t in GREETING_WORDS or t in FILLER_WORDS for t in tokens):
+        return False
+    if GREETING_WORDS.intersection(tokens):
+        return True
+    return any(tuple(tokens[i: i + len(p)]) == p for p in GREETING_PHRASES for i in range(len(tokens)))
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    reason: str
+    answer: Optional[str] = None
+    matched: Tuple[str, ...] = ()
+    # best (on topic, off topic) centroid similarity when the embedding check ran
+    similarity: Optional[Tuple[float, float]] = None
+    seconds: float = 0.0
+
+
+@dataclass
+class QueryRouter:
+    """
+    Decides before retrieval whether a query needs the RAG pipeline.
+
+    Greetings and thanks are answered from canned text. A query containing a
+    domain keyword or phrase goes to the RAG; keywords are matched as whole
+    (singularised) tokens through set lookups, so "air" no longer matches
+    "chair" and the cost does not grow with the keyword list. A query without
+    keywords is compared with on- and off-topic centroids when an embedding
+    function is given and answered as off topic only when it is clearly closer
+    to an off-topic centroid; in every other case the RAG answers.
+    """
+
+    keywords: Iterable[str]
+    off_topic_margin: float = 0.05
+    on_topic_descriptions: List[str] = field(default_factory=lambda: list(ON_TOPIC_DESCRIPTIONS))
+    off_topic_descriptions: List[str] = field(default_factory=lambda: list(OFF_TOPIC_DESCRIPTIONS))
+
+    def __post_init__(self) -> None:
+        self._words = set()
+        self._phrases = set()
+        for keyword in self.keywords:
+            tokens = tuple(normalize_token(t) for t in tokenize(keyword))
+            if len(tokens) == 1:
+                self._words.add(tokens[0])
+            elif tokens:
+                self._phrases.add(tokens)
+        self._max_phrase = max((len(p) for p in self._phrases), default=1)
+        self._centroids = None
+        self.counts = Counter()
+
+    def match(self, query: str) -> Optional[RouteDecision]:
+        """The keyword stage: a decision, or None when the query has no signal."""
+        tokens = tokenize(query)
+        if is_small_talk(tokens):
+            if THANKS_WORDS.intersection(tokens):
+                return RouteDecision(GREETING, "thanks", THANKS_ANSWER)
+            if FAREWELL_WORDS.intersection(tokens):
+                return RouteDecision(GREETING, "farewell", FAREWELL_ANSWER)
+            return RouteDecision(GREETING, "greeting", GREETING_ANSWER)
+
+        normalized = [normalize_token(t) for t in tokens]
+        matched = [t for t in normalized if t in self._words]
+        for n in range(2, self._max_phrase + 1):
+            for i in range(len(normalized) - n + 1):
+                phrase = tuple(normalized[i: i + n])
+                if phrase in self._phrases:
+                    matched.append(" ".join(phrase))
+        if matched:
+            return RouteDecision(RAG, "keyword", matched=tuple(dict.fromkeys(matched)))
+        return None
+
+    async def centroids(self, embed: Callable[[str], Awaitable[List[float]]]):
+        if self._centroids is None:
+            on = np.asarray([await embed(text) for text in self.on_topic_descriptions], dtype=np.float32)
+            off = np.asarray([await embed(text) for text in self.off_topic_descriptions], dtype=np.float32)
+            self._centroids = (
+                on / np.linalg.norm(on, axis=1, keepdims=True),
+                off / np.linalg.norm(off, axis=1, keepdims=True),
+            )
+        return self._centroids
+
+    async def embedding_decision(self, query: str, embed) -> RouteDecision:
+        on, off = await self.centroids(embed)
+        vector = np.asarray(await embed(query), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        similarity = (float((on @ vector).max()), float((off @ vector).max()))
+        if similarity[1] - similarity[0] >= self.off_topic_margin:
+            return RouteDecision(OFF_TOPIC, "centroid", OFF_TOPIC_ANSWER, similarity=similarity)
+        return RouteDecision(RAG, "centroid", similarity=similarity)
+
+    def record(self, decision: RouteDecision, start: float) -> RouteDecision:
+        decision.seconds = time.perf_counter() - start
+        self.counts[(decision.route, decision.reason)] += 1
+        ROUTER_DECISIONS.labels(route=decision.route, reason=decision.reason).inc()
+        ROUTER_SECONDS.labels(route=decision.route).observe(decision.seconds)
+        logger.debug("Routed query to %s (%s): matched=%s similarity=%s", decision.route, decision.reason, decision.matched, decision.similarity)
+        return decision
+
+    def route(self, query: str) -> RouteDecision:
+        start = time.perf_counter()
+        return self.record(self.match(query) or RouteDecision(RAG, "no_signal"), start)
+
+    async def aroute(self, query: str, embed: Optional[Callable[[str], Awaitable[List[float]]]] = None) -> RouteDecision:
+        """
+        `embed` is an async query embedder; with the RAG's cached embedding model
+        the query embedding is reused by the retrieval that follows.
+        """
+        start = time.perf_counter()
+        decision = self.match(query)
+        if decision is None and embed is not None:
+            try:
+                decision = await self.embedding_decision(query, embed)
+            except Exception:
+                logger.exception("Embedding check of the query router failed, routing to the RAG")
+        return self.record(decision or RouteDecision(RAG, "no_signal"), start)
+
+    def stats(self) -> dict:
+        return {f"{route}/{reason}": count for (route, reason), count in sorted(self.counts.items())}
@@ -0,0 +1,274 @@
+from collections import Counter
+from typing import Any, List, Optional, Tuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr, SerializeAsAny
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from src.utils.logger import get_logger
+from src.utils.metrics import RERANK_SECONDS, timed
+
+logger = get_logger(__name__)
+
+RerankRequest = Tuple[List[NodeWithScore], QueryBundle]
+
+
+def _keep_scores(nodes: List[NodeWithScore], scores, keep_retrieval_score: bool, top_n: int) -> List[NodeWithScore]:
+    for node, score in zip(nodes, scores):
+        if keep_retrieval_score:
+            # keep the retrieval score in metadata
+            node.node.metadata["retrieval_score"] = node.score
+        node.score = float(score)
+    return sorted(nodes, key=lambda x: -x.score if x.score else 0)[:top_n]
+
+
+class CrossEncoderRerank(BaseNodePostprocessor):
+    """
+    Cross-encoder reranker that can run on the PyTorch, ONNX or OpenVINO backend of
+    sentence-transformers. `file_name` picks a specific export inside the model repo,
+    e.g. "onnx/model_qint8_avx512.onnx" for the int8 quantized ONNX graph.
+    The model is loaded on first use. Scores go through the model's default
+    activation, a Sigmoid for single-label (ms-marco) models, so they are
+    probabilities in [0, 1] rather than logits.
+    """
+
+    model: str = Field(description="Cross-encoder model name.")
+    top_n: int = Field(description="Number of nodes to return sorted by score.")
+    backend: str = Field(default="torch", description="torch, onnx or openvino.")
+    file_name: Optional[str] = Field(default=None, description="Model file inside the repo for onnx/openvino.")
+    max_length: int = Field(default=512)
+    device: str = Field(default="cpu")
+    keep_retrieval_score: bool = Field(default=False)
+    _model: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CrossEncoderRerank"
+
+    def load(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            model_kwargs = {"file_name": self.file_name} if self.file_name else None
+            self._model = CrossEncoder(
+                self.model,
+                max_length=self.max_length,
+                device=self.device,
+                backend=self.backend,
+                model_kwargs=model_kwargs,
+            )
+            logger.info(f"Loaded cross-encoder {self.model} ({self.backend}, {self.file_name or 'default file'})")
+        return self._model
+
+    def score_pairs(self, pairs: List[List[str]]) -> List[float]:
+        if not pairs:
+            return []
+        return self.load().predict(pairs, show_progress_bar=False).tolist()
+
+    def postprocess_batch(self, requests: List[RerankRequest]) -> List[List[NodeWithScore]]:
+        """Rerank several (nodes, query) requests with a single model call."""
+        pairs = [
+            [query_bundle.query_str, node.node.get_content(metadata_mode=MetadataMode.EMBED)]
+            for nodes, query_bundle in requests
+            for node in nodes
+        ]
+        scores = self.score_pairs(pairs)
+
+        results, offset = [], 0
+        for nodes, _ in requests:
+            request_scores = scores[offset: offset + len(nodes)]
+            offset += len(nodes)
+            results.append(_keep_scores(nodes, request_scores, self.keep_retrieval_score, self.top_n))
+        return results
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if len(nodes) == 0:
+            return []
+        return self.postprocess_batch([(nodes, query_bundle)])[0]
+
+
+class LateInteractionRerank(BaseNodePostprocessor):
+    """
+    ColBERT style MaxSim reranker. Documents are encoded in one padded batch instead
+    of one forward pass per node. `backend` selects plain PyTorch, dynamically
+    int8-quantized PyTorch ("int8") or an ONNX Runtime export through optimum ("onnx").
+    """
+
+    model: str = Field(description="ColBERT model name.")
+    tokenizer: str = Field(description="Tokenizer name.")
+    top_n: int = Field(description="Number of nodes to return sorted by score.")
+    backend: str = Field(default="torch", description="torch, int8 or onnx.")
+    max_length: int = Field(default=512)
+    keep_retrieval_score: bool = Field(default=False)
+    _model: Any = PrivateAttr(default=None)
+    _tokenizer: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LateInteractionRerank"
+
+    def load(self):
+        if self._model is None:
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer)
+            if self.backend == "onnx":
+                from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+                model = ORTModelForFeatureExtraction.from_pretrained(self.model, export=True)
+            else:
+                model = AutoModel.from_pretrained(self.model).eval()
+                if self.backend == "int8":
+                    model = torch.quantization.quantize_dynamic(
+                        model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+            self._model = model
+            logger.info(f"Loaded late-interaction model {self.model} ({self.backend})")
+        return self._model
+
+    def _encode(self, texts: List[str]):
+        import torch
+
+        model = self.load()
+        encoding = self._tokenizer(
+            texts, return_tensors="pt", padding=True, truncation=True, max_length=self.max_length
+        )
+        with torch.no_grad():
+            hidden = model(**encoding).last_hidden_state
+        hidden = torch.nn.functional.normalize(hidden, dim=-1)
+        return hidden, encoding["attention_mask"]
+
+    def score_batch(self, queries: List[str], documents: List[List[str]]) -> List[List[float]]:
+        """MaxSim scores of each query against its own documents, one forward pass per side."""
+        import torch
+
+        flat_documents = [document for docs in documents for document in docs]
+        if not flat_documents:
+            return [[] for _ in queries]
+        query_embeddings, query_masks = self._encode(queries)
+        doc_embeddings, doc_masks = self._encode(flat_documents)
+
+        scores, offset = [], 0
+        for i, docs in enumerate(documents):
+            doc_embedding = doc_embeddings[offset: offset + len(docs)]
+            doc_mask = doc_masks[offset: offset + len(docs)]
+            offset += len(docs)
+            # (docs, query_tokens, doc_tokens) cosine similarities, padding masked out
+            sim = torch.einsum("qd,ntd->nqt", query_embeddings[i], doc_embedding)
+            sim = sim.masked_fill(doc_mask[:, None, :] == 0, float("-inf"))
+            max_sim = sim.max(dim=2).values
+            query_tokens = query_masks[i].bool()
+            scores.append(max_sim[:, query_tokens].mean(dim=1).tolist())
+        return scores
+
+    def postprocess_batch(self, requests: List[RerankRequest]) -> List[List[NodeWithScore]]:
+        """Rerank several (nodes, query) requests with a single model call per side."""
+        queries = [query_bundle.query_str for _, query_bundle in requests]
+        documents = [
+            [node.node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+            for nodes, _ in requests
+        ]
+        scores = self.score_batch(queries, documents)
+        return [
+            _keep_scores(nodes, request_scores, self.keep_retrieval_score, self.top_n)
+            for (nodes, _), request_scores in zip(requests, scores)
+        ]
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if len(nodes) == 0:
+            return []
+        return self.postprocess_batch([(nodes, query_bundle)])[0]
+
+
+class RerankCascade(BaseNodePostprocessor):
+    """
+    Runs rerankers in sequence, each one narrowing the candidates of the previous.
+    After a stage, when the gap between the last kept score (position `top_n`) and
+    the first dropped one is at least `early_exit_margin`, the stage is trusted
+    to have separated the top nodes clearly and the later stages are skipped. This
+    is a heuristic: a later stage could still have scored a dropped node higher, so
+    an early exit keeps the current stage's top `top_n` (and their order) as the
+    result, trading that chance for the cost of the later stages. The margin is in the
+    first stage's score units, e.g. a fraction of [0, 1] for `CrossEncoderRerank`.
+    Any node postprocessor
+    (e.g. FlagEmbeddingReranker) can be used as a stage; stages that implement
+    `postprocess_batch` score all requests of a batch in one call.
+    """
+
+    stages: List[SerializeAsAny[BaseNodePostprocessor]] = Field(description="Rerankers, cheapest first.")
+    top_n: int = Field(description="Number of nodes to return.")
+    early_exit_margin: Optional[float] = Field(default=None, description="Score gap that skips later stages.")
+    _stage_runs: Counter = PrivateAttr(default_factory=Counter)
+    _early_exits: int = PrivateAttr(default=0)
+    _queries: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RerankCascade"
+
+    @staticmethod
+    def stage_name(stage: BaseNodePostprocessor) -> str:
+        return stage.class_name()
+
+    def is_decisive(self, nodes: List[NodeWithScore]) -> bool:
+        if self.early_exit_margin is None:
+            return False
+        if len(nodes) <= self.top_n:
+            return True
+        scores = sorted((n.score or 0.0 for n in nodes), reverse=True)
+        return scores[self.top_n - 1] - scores[self.top_n] >= self.early_exit_margin
+
+    def postprocess_batch(self, requests: List[RerankRequest]) -> List[List[NodeWithScore]]:
+        results = [nodes for nodes, _ in requests]
+        active = [i for i, nodes in enumerate(results) if nodes]
+        self._queries += len(requests)
+
+        for stage_index, stage in enumerate(self.stages):
+            if stage_index > 0:
+                decisive = [i for i in active if self.is_decisive(results[i])]
+                if decisive:
+                    self._early_exits += len(decisive)
+                    logger.debug(f"Rerank early exit before {self.stage_name(stage)} for {len(decisive)} request(s)")
+                    active = [i for i in active if i not in decisive]
+            if not active:
+                break
+
+            with timed(RERANK_SECONDS, reranker=self.stage_name(stage)):
+                if hasattr(stage, "postprocess_batch"):
+                    outputs = stage.postprocess_batch([(results[i], requests[i][1]) for i in active])
+                else:
+                    outputs = [
+                        stage.postprocess_nodes(results[i], query_bundle=requests[i][1]) for i in active
+                    ]
+            for i, nodes in zip(active, outputs):
+                results[i] = nodes
+            self._stage_runs[self.stage_name(stage)] += len(active)
+
+        return [nodes[: self.top_n] for nodes in results]
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        return self.postprocess_batch([(nodes, query_bundle)])[0]
+
+    def stats(self) -> dict:
+        return {
+            "queries": self._queries,
+            "early_exits": self._early_exits,
+            "stage_runs": dict(self._stage_runs),
+        }
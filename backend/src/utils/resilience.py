@@ -0,0 +1,254 @@
+"""
+Deadline, retries and circuit breaking of model calls, independent of the
+clients making them (see model_clients.py).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from ollama import ResponseError
+
+from src.utils.logger import get_logger
+from src.utils.metrics import CIRCUIT_STATE, MODEL_CALLS, MODEL_RETRIES
+
+logger = get_logger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class ModelClientConfig:
+    base_url: str = "http://host.docker.internal:11434"
+    connect_timeout: float = 5.0
+    # a blocking generation sends nothing until it is done, so this is also its read timeout
+    llm_deadline: float = 300.0
+    embed_deadline: float = 30.0
+    max_connections: int = 16
+    max_keepalive_connections: int = 8
+    keepalive_expiry: float = 60.0
+    retries: int = 3
+    backoff_base: float = 0.5
+    backoff_cap: float = 8.0
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    # a half open probe that takes longer counts as failed
+    probe_timeout: float = 60.0
+    fallback_model: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, base_url: Optional[str] = None) -> "ModelClientConfig":
+        return cls(
+            base_url=base_url or os.environ.get("OLLAMA_BASE_URL", cls.base_url),
+            connect_timeout=float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", cls.connect_timeout)),
+            llm_deadline=float(os.environ.get("LLM_DEADLINE_SECONDS", cls.llm_deadline)),
+            embed_deadline=float(os.environ.get("EMBED_DEADLINE_SECONDS", cls.embed_deadline)),
+            max_connections=int(os.environ.get("OLLAMA_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(os.environ.get("OLLAMA_MAX_KEEPALIVE", cls.max_keepalive_connections)),
+            retries=int(os.environ.get("MODEL_RETRIES", cls.retries)),
+            failure_threshold=int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", cls.failure_threshold)),
+            reset_timeout=float(os.environ.get("CIRCUIT_RESET_SECONDS", cls.reset_timeout)),
+            probe_timeout=float(os.environ.get("CIRCUIT_PROBE_SECONDS", cls.probe_timeout)),
+            fallback_model=os.environ.get("OLLAMA_FALLBACK_MODEL") or None,
+        )
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_retryable(error: Exception) -> bool:
+    """Failures of the server or the network, as opposed to a bad request."""
+    if isinstance(error, ResponseError):
+        return error.status_code in RETRYABLE_STATUS
+    # ollama reports a refused connection as ConnectionError
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full jitter: uniform in [0, min(cap, base * 2**attempt)], so retries of many requests spread out."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single probe call through (half open):
+    its success closes the circuit, its failure opens it again. A probe that
+    ends without either, or has not ended after `probe_timeout`, no longer
+    blocks the next one.
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, probe_timeout: float = 60.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(endpoint=name).set(0)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit of {self.name} is now {state}")
+        self.state = state
+        CIRCUIT_STATE.labels(endpoint=self.name).set(self.STATES[state])
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state("half_open")
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open":
+                now = time.monotonic()
+                if not self._probing or now - self._probe_started >= self.probe_timeout:
+                    self._probing = True
+                    self._probe_started = now
+                    return True
+            return False
+
+    def abandon(self) -> None:
+        """The call ended without telling whether the model works (cancelled), free the probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_state("closed")
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+
+class ResilientCall:
+    """Deadline, retries with backoff and the circuit breaker of one model endpoint."""
+
+    def __init__(self, endpoint: str, config: ModelClientConfig, deadline: float) -> None:
+        self.endpoint = endpoint
+        self.config = config
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(endpoint, config.failure_threshold, config.reset_timeout, config.probe_timeout)
+
+    def _retry_delay(self, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """Record a failed attempt, the delay before the next one or None to give up."""
+        self.breaker.record_failure()
+        delay = backoff_delay(attempt, self.config.backoff_base, self.config.backoff_cap)
+        if attempt >= self.config.retries or time.monotonic() + delay >= deadline:
+            return None
+        MODEL_RETRIES.labels(endpoint=self.endpoint, reason=type(error).__name__).inc()
+        logger.warning(f"{self.endpoint} failed ({error!r}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def _give_up(self, error: Exception, fallback):
+        if fallback is not None:
+            MODEL_CALLS.labels(endpoint=self.endpoint, outcome="fallback").inc()
+            logger.warning(f"{self.endpoint} unavailable ({error!r}), using the fallback model")
+            return fallback
+        MODEL_CALLS.labels(endpoint=self.endpoint, outcome="error").inc()
+        raise error
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if self.breaker.state == "half_open":
+            remaining = min(remaining, self.config.probe_timeout)
+        return max(remaining, 0.001)
+
+    def _rejected(self, cause: Optional[Exception] = None) -> CircuitOpenError:
+        """`cause` is the failure of an earlier attempt that opened the circuit mid-retry."""
+        MODEL_CALLS.labels(endpoint=self.endpoint, outcome="rejected").inc()
+        if cause is None:
+            return CircuitOpenError(f"Circuit of {self.endpoint} is open")
+        error = CircuitOpenError(f"Circuit of {self.endpoint} is open after {cause!r}")
+        error.__cause__ = cause
+        return error
+
+    def _non_retryable(self, error: Exception) -> None:
+        # the server answered, it is up even though the request was bad
+        self.breaker.record_success()
+        MODEL_CALLS.labels(endpoint=self.endpoint, outcome="error").inc()
+
+    def call(self, fn: Callable[[], Any], fallback: Optional[Callable[[], Any]] = None):
+        """Run `fn` under the policy. A sync attempt is bounded by the client's read timeout."""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        error = None
+        while True:
+            if not self.breaker.allow():
+                error = self._rejected(error)
+                break
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    self._non_retryable(e)
+                    raise
+                error = e
+                delay = self._retry_delay(attempt, e, deadline)
+                if delay is None:
+                    break
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # interrupted, no verdict on the model but a probe must not stay taken
+                self.breaker.abandon()
+                raise
+            self.breaker.record_success()
+            MODEL_CALLS.labels(endpoint=self.endpoint, outcome="ok").inc()
+            return result
+        fallback = self._give_up(error, fallback)
+        return fallback()
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], fallback: Optional[Callable[[], Awaitable[Any]]] = None):
+        """Async `call`, every attempt is also cancelled at the deadline and a probe after `probe_timeout`."""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        error = None
+        while True:
+            if not self.breaker.allow():
+                error = self._rejected(error)
+                break
+            try:
+                result = await asyncio.wait_for(fn(), timeout=self._attempt_timeout(deadline))
+            except Exception as e:
+                if not is_retryable(e):
+                    self._non_retryable(e)
+                    raise
+                error = e
+                delay = self._retry_delay(attempt, e, deadline)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # CancelledError is no Exception, a cancelled probe would otherwise hold the circuit half open
+                self.breaker.abandon()
+                raise
+            self.breaker.record_success()
+            MODEL_CALLS.labels(endpoint=self.endpoint, outcome="ok").inc()
+            return result
+        fallback = self._give_up(error, fallback)
+        return await fallback()
+
+    def stats(self) -> dict:
+        return {"state": self.breaker.state, "consecutive_failures": self.breaker.failures}
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+import numpy as np
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    source_nodes: List[Any] = field(default_factory=list)
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on the query embedding.
+
+    A lookup is a hit when the cosine similarity between the query embedding and a
+    cached query embedding is at least `similarity_threshold`. Entries are evicted
+    LRU once `max_size` is reached and expire after `ttl_seconds`. Every entry is
+    tied to a collection version stamp, when the stamp changes the whole cache is
+    dropped so answers never outlive the data they were generated from.
+    """
+
+    def __init__(self, max_size=512, ttl_seconds=3600, similarity_threshold=0.95) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._matrix = None  # (max_size, dim) normalized embeddings, allocated on first store
+        self._valid = np.zeros(max_size, dtype=bool)
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()  # slot -> entry, LRU order
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version) -> None:
+        if version != self._version:
+            if self._entries:
+                logger.info(f"Collection version changed to {version}, dropping {len(self._entries)} cached answers")
+            self._clear()
+            self._version = version
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._valid[:] = False
+
+    def _evict(self, slot: int) -> None:
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+
+    def lookup(self, embedding, version=None) -> Optional[CachedAnswer]:
+        with self._lock:
+            self._check_version(version)
+            if not self._entries or self._matrix is None:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ self._normalize(embedding)
+            similarities[~self._valid] = -np.inf
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[slot]
+            if time.monotonic() - entry.created_at > self.ttl_seconds:
+                self._evict(slot)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            logger.debug("Semantic cache hit (%.3f) for '%s'", similarities[slot], entry.query)
+            return entry
+
+    def store(self, query: str, embedding, answer: str, source_nodes=None, version=None) -> None:
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+            if len(self._entries) >= self.max_size:
+                oldest_slot = next(iter(self._entries))
+                self._evict(oldest_slot)
+            slot = int(np.argmin(self._valid))
+
+            self._matrix[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = CachedAnswer(query=query, answer=answer, source_nodes=list(source_nodes or []))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "version": self._version,
+        }
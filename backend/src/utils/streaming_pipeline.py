@@ -0,0 +1,176 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    items_in: int = 0
+    items_out: int = 0
+    units: int = 0
+    busy_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, items_out: int, units: int, seconds: float) -> None:
+        with self._lock:
+            self.items_in += 1
+            self.items_out += items_out
+            self.units += units
+            self.busy_seconds += seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "units": self.units,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "units_per_second": round(self.units / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+        }
+
+
+@dataclass
+class Stage:
+    """
+    `fn` maps one input item to an iterable of output items. `units` counts the work
+    in an input item (e.g. number of nodes in a batch) for throughput reporting.
+    """
+
+    name: str
+    fn: Callable[[Any], Iterable[Any]]
+    workers: int = 1
+    units: Callable[[Any], int] = lambda item: 1
+
+
+class StreamingPipeline:
+    """
+    Runs generator stages in worker threads connected by bounded queues, so every
+    stage works concurrently and at most `queue_size` items wait between two
+    stages. Memory therefore stays flat however long the source is. The first error
+    in any stage stops the pipeline and is re-raised from `run`. Time spent pulling
+    items from the source is reported as the `source_name` stage, with
+    `source_units` counting the work in each item.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        queue_size=8,
+        source_name: str = "source",
+        source_units: Callable[[Any], int] = lambda item: 1,
+    ) -> None:
+        self.stages = stages
+        self.queue_size = queue_size
+        self.source_name = source_name
+        self.source_units = source_units
+        self.stats = {source_name: StageStats(source_name, 1)}
+        self.stats.update({stage.name: StageStats(stage.name, stage.workers) for stage in stages})
+
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error: BaseException) -> None:
+        self._errors.append(error)
+        self._stop.set()
+
+    def _feed(self, source: Iterable, out_q: queue.Queue) -> None:
+        stats = self.stats[self.source_name]
+        try:
+            items = iter(source)
+            while True:
+                start = time.perf_counter()
+                item = next(items, _DONE)
+                if item is _DONE:
+                    return
+                stats.record(1, self.source_units(item), time.perf_counter() - start)
+                if not self._put(out_q, item):
+                    return
+        except BaseException as e:
+            logger.exception("Pipeline source failed")
+            self._fail(e)
+        finally:
+            stats.wall_seconds = time.perf_counter() - self._started
+            self._put(out_q, _DONE)
+
+    def _work(self, stage: Stage, in_q: queue.Queue, out_q: Optional[queue.Queue], remaining: list, lock: threading.Lock) -> None:
+        stats = self.stats[stage.name]
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _DONE:
+                    # let sibling workers see the end of input too
+                    self._put(in_q, _DONE)
+                    return
+                start = time.perf_counter()
+                outputs = list(stage.fn(item))
+                stats.record(len(outputs), stage.units(item), time.perf_counter() - start)
+                if out_q is not None:
+                    for output in outputs:
+                        if not self._put(out_q, output):
+                            return
+        except BaseException as e:
+            logger.exception(f"Pipeline stage {stage.name} failed")
+            self._fail(e)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                stats.wall_seconds = time.perf_counter() - self._started
+                if out_q is not None:
+                    self._put(out_q, _DONE)
+
+    def run(self, source: Iterable) -> dict:
+        self._started = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), name="pipeline-source", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            out_q = queues[i + 1] if i + 1 < len(self.stages) else None
+            remaining, lock = [stage.workers], threading.Lock()
+            for n in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], out_q, remaining, lock),
+                    name=f"pipeline-{stage.name}-{n}",
+                    daemon=True,
+                ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        report = {name: stats.as_dict() for name, stats in self.stats.items()}
+        logger.info(f"Streaming pipeline finished in {time.perf_counter() - self._started:.1f}s: {report}")
+        return report
@@ -0,0 +1,125 @@
+"""
+Multi-section answers: which sections a query needs and how they are assembled.
+Ported from the structured mode of the legacy Flask app (app.py); generation
+runs in WildLifeRAG.astructured.
+"""
+import re
+from typing import Dict, List
+
+QUERY_PATTERNS = {
+    qtype: re.compile(pattern)
+    for qtype, pattern in {
+        'latest_news': r'latest|recent|new|updates|news',
+        'historical': r'history|historical|past|evolution|timeline',
+        'statistics': r'statistics|numbers|data|figures|count',
+        'causes_effects': r'causes|effects|impact|influence|affect',
+        'solutions': r'solutions|measures|steps|actions|how to|prevent',
+        'comparison': r'compare|difference|versus|vs|better',
+        'definition': r'what is|define|meaning|explain|description',
+        'location': r'where|location|place|area|region|habitat',
+        'process': r'how does|process|mechanism|way|method',
+        'status': r'status|condition|state|situation|current',
+    }.items()
+}
+
+TASK_TEMPLATES = {
+    'general': {
+        "task": "general_info",
+        "prompt": "Provide a comprehensive overview of '{query}' with specific relevance to India's context."
+    },
+    'latest_news': {
+        "task": "recent_developments",
+        "prompt": "Describe the most recent developments, news, and updates about '{query}' in India."
+    },
+    'historical': {
+        "task": "historical_context",
+        "prompt": "Explain the historical background and evolution of '{query}' in India."
+    },
+    'statistics': {
+        "task": "statistics",
+        "prompt": "Provide key statistics, data, and figures related to '{query}' in India."
+    },
+    'causes_effects': {
+        "task": "impact_analysis",
+        "prompt": "Analyze the causes and effects of '{query}' on India's biodiversity and environment."
+    },
+    'solutions': {
+        "task": "solutions",
+        "prompt": "Outline specific solutions and conservation measures for '{query}' in India."
+    },
+    'status': {
+        "task": "current_status",
+        "prompt": "Describe the current status and conditions related to '{query}' in India."
+    },
+    'summary': {
+        "task": "summary",
+        "prompt": "Provide a clear and concise summary of '{query}' focusing on India."
+    },
+    'recommendations': {
+        "task": "recommendations",
+        "prompt": "Suggest practical recommendations for addressing '{query}' in India."
+    }
+}
+
+SECTION_ORDERS = {
+    'latest_news': ['summary', 'recent_developments', 'current_status', 'recommendations'],
+    'historical': ['summary', 'historical_context', 'current_status', 'recommendations'],
+    'statistics': ['summary', 'statistics', 'impact_analysis', 'recommendations'],
+    'causes_effects': ['summary', 'impact_analysis', 'current_status', 'solutions', 'recommendations'],
+    'solutions': ['summary', 'current_status', 'solutions', 'recommendations'],
+    'definition': ['summary', 'general_info', 'current_status', 'recommendations'],
+    'location': ['summary', 'general_info', 'current_status', 'recommendations'],
+    'process': ['summary', 'general_info', 'current_status', 'recommendations'],
+    'status': ['summary', 'current_status', 'impact_analysis', 'recommendations'],
+    'general': ['summary', 'general_info', 'current_status', 'recommendations']
+}
+
+HEADER_MAP = {
+    'summary': '📋 Summary',
+    'general_info': '📚 Overview',
+    'recent_developments': '🔄 Latest Developments',
+    'historical_context': '📜 Historical Background',
+    'statistics': '📊 Key Statistics',
+    'impact_analysis': '🎯 Impact Analysis',
+    'solutions': '💡 Solutions',
+    'current_status': '📌 Current Status',
+    'recommendations': '✨ Recommendations'
+}
+
+
+def analyze_query_type(query: str) -> List[str]:
+    query_lower = query.lower()
+    return [qtype for qtype, pattern in QUERY_PATTERNS.items() if pattern.search(query_lower)] or ['general']
+
+
+def section_header(task: str) -> str:
+    return HEADER_MAP.get(task, task.replace('_', ' ').title())
+
+
+def structured_sections(query: str, query_types: List[str]) -> List[Dict[str, str]]:
+    """
+    The sections to generate: always a summary and recommendations, plus one per
+    detected query type (and the status for news queries), each task once.
+    """
+    prompts = [TASK_TEMPLATES['summary']]
+    prompts += [TASK_TEMPLATES[qtype] for qtype in query_types if qtype in TASK_TEMPLATES]
+    if 'latest_news' in query_types and 'status' not in query_types:
+        prompts.append(TASK_TEMPLATES['status'])
+    prompts.append(TASK_TEMPLATES['recommendations'])
+
+    sections, seen_tasks = [], set()
+    for p in prompts:
+        if p['task'] not in seen_tasks:
+            seen_tasks.add(p['task'])
+            sections.append({"task": p['task'], "prompt": p['prompt'].format(query=query)})
+    return sections
+
+
+def format_sections(responses: Dict[str, str], query_types: List[str]) -> str:
+    """Join the generated sections in the order of the primary query type, the rest after them."""
+    section_order = SECTION_ORDERS.get(query_types[0] if query_types else 'general', SECTION_ORDERS['general'])
+    ordered = [task for task in section_order if task in responses]
+    ordered += [task for task in responses if task not in section_order]
+    return "\n\n".join(
+        f"{section_header(task)}:\n{responses[task]}" for task in ordered if responses[task]
+    )
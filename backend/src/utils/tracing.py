@@ -0,0 +1,238 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_TRACE_ID_MASK = (1 << 64) - 1
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class TracingConfig:
+    """Trace export settings, every field can be set through the environment."""
+
+    enabled: bool = True
+    endpoint: str = "http://phoenix:6006/v1/traces"
+    project_name: str = "WILDLIFE_RESEARCH"
+    # fraction of requests recorded at all, unrecorded requests cost nothing but cannot be kept on error
+    head_sample_ratio: float = 1.0
+    # fraction of recorded requests exported even when they are fast and succeed
+    tail_sample_ratio: float = 0.05
+    # recorded requests slower than this are always exported
+    slow_seconds: float = 10.0
+    # longer string attributes (prompts, retrieved context) are cut to this many characters
+    max_attribute_length: int = 4096
+    max_queue_size: int = 2048
+    max_export_batch_size: int = 256
+    schedule_delay_millis: int = 2000
+    export_timeout_seconds: float = 10.0
+    # traces waiting for their root span to end, the oldest are dropped beyond this
+    max_pending_traces: int = 1000
+    max_spans_per_trace: int = 512
+
+    @classmethod
+    def from_env(cls) -> "TracingConfig":
+        return cls(
+            enabled=_env_bool("TRACING_ENABLED", cls.enabled),
+            endpoint=os.environ.get("PHOENIX_COLLECTOR_ENDPOINT", cls.endpoint),
+            project_name=os.environ.get("PHOENIX_PROJECT_NAME", cls.project_name),
+            head_sample_ratio=float(os.environ.get("TRACE_HEAD_SAMPLE_RATIO", cls.head_sample_ratio)),
+            tail_sample_ratio=float(os.environ.get("TRACE_TAIL_SAMPLE_RATIO", cls.tail_sample_ratio)),
+            slow_seconds=float(os.environ.get("TRACE_SLOW_SECONDS", cls.slow_seconds)),
+            max_attribute_length=int(os.environ.get("TRACE_MAX_ATTRIBUTE_LENGTH", cls.max_attribute_length)),
+            max_queue_size=int(os.environ.get("TRACE_MAX_QUEUE_SIZE", cls.max_queue_size)),
+        )
+
+
+@dataclass
+class _PendingTrace:
+    spans: List[ReadableSpan] = field(default_factory=list)
+    error: bool = False
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """
+    Holds the finished spans of a trace until its root span ends, then passes the
+    whole trace to `delegate` if it had an error, its root took at least
+    `slow_seconds`, or its trace id falls in the `sample_ratio` fraction (the same
+    deterministic rule as TraceIdRatioBased). Everything else is dropped without
+    being serialized. Pending traces are bounded, the oldest are evicted first.
+    """
+
+    def __init__(
+        self,
+        delegate: SpanProcessor,
+        sample_ratio=0.05,
+        slow_seconds=10.0,
+        max_pending_traces=1000,
+        max_spans_per_trace=512,
+    ) -> None:
+        self.delegate = delegate
+        self.sample_ratio = sample_ratio
+        self.slow_seconds = slow_seconds
+        self.max_pending_traces = max_pending_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self.enabled = True
+
+        self._pending: "OrderedDict[int, _PendingTrace]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.kept = {"error": 0, "slow": 0, "sampled": 0}
+        self.dropped = 0
+        self.evicted = 0
+
+    def is_sampled(self, trace_id: int) -> bool:
+        return (trace_id & _TRACE_ID_MASK) < self.sample_ratio * (1 << 64)
+
+    def on_start(self, span, parent_context=None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not self.enabled:
+            return
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            pending = self._pending.pop(trace_id, None) or _PendingTrace()
+            if len(pending.spans) < self.max_spans_per_trace:
+                pending.spans.append(span)
+            pending.error |= span.status.status_code == StatusCode.ERROR
+            if not is_root:
+                self._pending[trace_id] = pending
+                while len(self._pending) > self.max_pending_traces:
+                    self._pending.popitem(last=False)
+                    self.evicted += 1
+                return
+
+            if pending.error:
+                reason = "error"
+            elif (span.end_time - span.start_time) / 1e9 >= self.slow_seconds:
+                reason = "slow"
+            elif self.is_sampled(trace_id):
+                reason = "sampled"
+            else:
+                self.dropped += 1
+                return
+            self.kept[reason] += 1
+
+        # the batch processor only enqueues, this never waits on the exporter
+        for pending_span in pending.spans:
+            self.delegate.on_end(pending_span)
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"kept": dict(self.kept), "dropped": self.dropped, "evicted": self.evicted, "pending_traces": pending}
+
+
+class Tracing:
+    """
+    Phoenix tracing of LlamaIndex calls with sampled, batched export. Spans go
+    through TailSamplingProcessor into a BatchSpanProcessor whose bounded queue
+    drops spans when the collector cannot keep up, so a slow or missing Phoenix
+    never blocks a request. `set_enabled` (un)instruments LlamaIndex at runtime.
+    """
+
+    def __init__(self, config: Optional[TracingConfig] = None) -> None:
+        self.config = config or TracingConfig.from_env()
+        self.tracer_provider = None
+        self.sampler: Optional[TailSamplingProcessor] = None
+        self._instrumentor = None
+        self._tracer = None
+        self._lock = threading.Lock()
+
+    def setup(self) -> None:
+        from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
+        from openinference.semconv.resource import ResourceAttributes
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+        config = self.config
+        exporter = OTLPSpanExporter(endpoint=config.endpoint, timeout=config.export_timeout_seconds)
+        batch_processor = BatchSpanProcessor(
+            exporter,
+            max_queue_size=config.max_queue_size,
+            max_export_batch_size=config.max_export_batch_size,
+            schedule_delay_millis=config.schedule_delay_millis,
+            export_timeout_millis=int(config.export_timeout_seconds * 1000),
+        )
+        self.sampler = TailSamplingProcessor(
+            batch_processor,
+            sample_ratio=config.tail_sample_ratio,
+            slow_seconds=config.slow_seconds,
+            max_pending_traces=config.max_pending_traces,
+            max_spans_per_trace=config.max_spans_per_trace,
+        )
+        self.tracer_provider = TracerProvider(
+            resource=Resource.create({ResourceAttributes.PROJECT_NAME: config.project_name}),
+            sampler=ParentBased(TraceIdRatioBased(config.head_sample_ratio)),
+            span_limits=SpanLimits(max_span_attribute_length=config.max_attribute_length),
+        )
+        self.tracer_provider.add_span_processor(self.sampler)
+        self._tracer = self.tracer_provider.get_tracer(__name__)
+        self._instrumentor = LlamaIndexInstrumentor()
+        self.set_enabled(config.enabled)
+        logger.info(f"Tracing to {config.endpoint}: {asdict(config)}")
+
+    @property
+    def enabled(self) -> bool:
+        return self._instrumentor is not None and self._instrumentor.is_instrumented_by_opentelemetry
+
+    def set_enabled(self, enabled: bool) -> None:
+        with self._lock:
+            if self._instrumentor is None:
+                self.config.enabled = enabled
+                return
+            if enabled and not self.enabled:
+                self._instrumentor.instrument(tracer_provider=self.tracer_provider)
+            elif not enabled and self.enabled:
+                self._instrumentor.uninstrument()
+            self.sampler.enabled = enabled
+            self.config.enabled = enabled
+        logger.info(f"Tracing {'enabled' if enabled else 'disabled'}")
+
+    def configure(self, tail_sample_ratio=None, slow_seconds=None) -> None:
+        if tail_sample_ratio is not None:
+            self.config.tail_sample_ratio = tail_sample_ratio
+        if slow_seconds is not None:
+            self.config.slow_seconds = slow_seconds
+        if self.sampler is not None:
+            self.sampler.sample_ratio = self.config.tail_sample_ratio
+            self.sampler.slow_seconds = self.config.slow_seconds
+
+    def request_span(self, name: str, **attributes):
+        """Root span grouping the LlamaIndex spans of one request, a no-op while disabled."""
+        if not self.enabled:
+            return nullcontext()
+        return self._tracer.start_as_current_span(name, attributes=attributes)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "config": asdict(self.config),
+            "sampling": self.sampler.stats() if self.sampler else None,
+        }
+
+    def shutdown(self) -> None:
+        if self.tracer_provider is not None:
+            self.tracer_provider.shutdown()
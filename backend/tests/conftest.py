@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# keep the rotating log file of the tested modules out of the working tree
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "wildbot_tests.log"))
@@ -0,0 +1,206 @@
+import asyncio
+
+import pytest
+
+from src.utils import admission
+from src.utils.admission import AdmissionController, AdmissionRejected, PriorityClass
+
+
+def make_controller(max_concurrency=1, max_queue=4, max_queue_seconds=5.0) -> AdmissionController:
+    return AdmissionController(
+        max_concurrency,
+        [
+            PriorityClass("interactive", rank=0, max_queue=max_queue, max_queue_seconds=max_queue_seconds),
+            PriorityClass("batch", rank=1, max_queue=max_queue, max_queue_seconds=max_queue_seconds),
+        ],
+    )
+
+
+def queued(controller: AdmissionController) -> int:
+    return sum(c.queued for c in controller.classes.values())
+
+
+def test_admits_up_to_max_concurrency_then_queues():
+    async def scenario():
+        controller = make_controller(max_concurrency=2)
+        first = await controller.acquire()
+        second = await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.active == 2 and queued(controller) == 1
+
+        controller.release(first)
+        third = await waiter
+        assert controller.active == 2 and queued(controller) == 0
+        controller.release(second)
+        controller.release(third)
+        # releasing twice is a no-op
+        controller.release(third)
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_interactive_before_batch_and_fifo_within_a_class():
+    async def scenario():
+        controller = make_controller()
+        holder = await controller.acquire()
+        order = []
+
+        async def request(name, priority):
+            async with controller.admit(priority):
+                order.append(name)
+
+        tasks = []
+        for name, priority in [("b1", "batch"), ("i1", "interactive"), ("b2", "batch"), ("i2", "interactive")]:
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await asyncio.sleep(0)
+        controller.release(holder)
+        await asyncio.gather(*tasks)
+        return order, controller
+
+    order, controller = asyncio.run(scenario())
+    assert order == ["i1", "i2", "b1", "b2"]
+    assert controller.active == 0 and queued(controller) == 0
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        controller = make_controller(max_queue=1)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        waiter.cancel()
+        return rejected.value, controller
+
+    rejected, controller = asyncio.run(scenario())
+    assert rejected.status_code == 429 and rejected.reason == "queue_full"
+    assert rejected.retry_after >= 1
+    assert queued(controller) == 0
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = make_controller(max_queue_seconds=0.01)
+        holder = await controller.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert queued(controller) == 0
+        # the timed out waiter is skipped, the slot is freed
+        controller.release(holder)
+        assert controller.active == 0
+        return rejected.value
+
+    assert asyncio.run(scenario()).status_code == 503
+
+
+def test_slot_handed_over_as_the_wait_times_out_is_taken(monkeypatch):
+    async def wait_for_then_time_out(future, timeout):
+        # the slot arrives, but the timeout fires in the same loop iteration
+        await future
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        controller = make_controller()
+        holder = await controller.acquire()
+        monkeypatch.setattr(admission.asyncio, "wait_for", wait_for_then_time_out)
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        controller.release(holder)
+        permit = await waiter
+        assert controller.active == 1 and queued(controller) == 0
+        assert controller.rejected["queue_timeout"] == 0
+        controller.release(permit)
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_passes_a_handed_over_slot_on():
+    async def scenario():
+        controller = make_controller()
+        holder = await controller.acquire()
+        cancelled = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        next_waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        # hand the slot to the first waiter and cancel it before it runs
+        controller.release(holder)
+        cancelled.cancel()
+        (outcome,) = await asyncio.gather(cancelled, return_exceptions=True)
+        if not isinstance(outcome, BaseException):
+            # some Python versions let wait_for return a result that arrived with the cancellation
+            controller.release(outcome)
+        permit = await next_waiter
+        assert controller.active == 1 and queued(controller) == 0
+        controller.release(permit)
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_weighted_permit_holds_several_slots():
+    async def scenario():
+        controller = make_controller(max_concurrency=3)
+        # a weight above max_concurrency is capped, it could never be admitted otherwise
+        structured = await controller.acquire(weight=5)
+        assert structured.weight == 3 and controller.active == 3
+        single = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert queued(controller) == 1
+        controller.release(structured)
+        permit = await single
+        assert controller.active == 1
+        controller.release(permit)
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_heavy_waiter_is_not_overtaken_and_never_exceeds_the_limit():
+    async def scenario():
+        controller = make_controller(max_concurrency=2)
+        first = await controller.acquire()
+        order = []
+
+        async def request(name, weight):
+            permit = await controller.acquire(weight=weight)
+            order.append(name)
+            assert controller.active <= controller.max_concurrency
+            return permit
+
+        heavy = asyncio.create_task(request("heavy", 2))
+        await asyncio.sleep(0)
+        light = asyncio.create_task(request("light", 1))
+        await asyncio.sleep(0)
+        # one slot is free, but the heavy request ahead needs two
+        assert order == [] and controller.active == 1
+        controller.release(first)
+        controller.release(await heavy)
+        controller.release(await light)
+        return order, controller
+
+    order, controller = asyncio.run(scenario())
+    assert order == ["heavy", "light"]
+    assert controller.active == 0 and queued(controller) == 0
+
+
+def test_timed_out_heavy_waiter_lets_the_next_one_in():
+    async def scenario():
+        controller = make_controller(max_concurrency=2)
+        controller.classes["interactive"].max_queue_seconds = 0.01
+        holder = await controller.acquire()
+        heavy = asyncio.create_task(controller.acquire("interactive", weight=2))
+        await asyncio.sleep(0)
+        light = asyncio.create_task(controller.acquire("batch"))
+        with pytest.raises(AdmissionRejected):
+            await heavy
+        permit = await light
+        assert controller.active == 2
+        controller.release(holder)
+        controller.release(permit)
+        assert controller.active == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import pytest
+
+from src.utils.chat_sessions import ChatSessionStore, SessionExpired
+
+
+def test_new_session_is_seeded_with_history():
+    store = ChatSessionStore()
+    session = store.get_or_create(None, [{"sender": "user", "text": "Where do tigers live?"}])
+    assert store.get_or_create(session.session_id) is session
+    assert "tigers" in session.relevant_context("tigers habitat")
+
+
+def test_unknown_session_is_not_silently_recreated():
+    store = ChatSessionStore()
+    with pytest.raises(SessionExpired):
+        store.get_or_create("gone", [{"sender": "user", "text": "hello"}])
+    assert store.stats()["sessions"] == 0
+
+
+def test_evicted_session_expires():
+    store = ChatSessionStore(max_sessions=1)
+    first = store.get_or_create()
+    store.get_or_create()
+    with pytest.raises(SessionExpired):
+        store.get_or_create(first.session_id)
+    assert store.stats()["evicted"] == {"lru": 1}
+
+
+def test_new_session_is_only_stored_when_added():
+    store = ChatSessionStore(max_sessions=1)
+    kept = store.get_or_create()
+    # a request rejected by admission control never adds its session
+    pending = store.get_or_new(None, [{"sender": "user", "text": "hello"}])
+    assert store.stats()["sessions"] == 1 and store.get_or_new(kept.session_id) is kept
+    store.add(pending)
+    store.add(pending)
+    assert store.stats()["created"] == 2 and store.stats()["evicted"] == {"lru": 1}
+    assert store.get_or_create(pending.session_id) is pending
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from src.utils.micro_batcher import MicroBatcher
+
+
+def test_concurrent_submits_share_one_call():
+    calls = []
+
+    async def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(double, max_batch_size=16, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert stats == {"batches": 1, "items": 5, "avg_batch_size": 5.0}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    sizes = []
+
+    async def identity(items):
+        sizes.append(len(items))
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(identity, max_batch_size=3, max_wait_ms=20)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+
+    assert asyncio.run(scenario()) == list(range(7))
+    assert sizes == [3, 3, 1]
+
+
+def test_sync_batch_function_runs_in_executor():
+    def upper(items):
+        return [item.upper() for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(upper, max_wait_ms=5)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+    assert asyncio.run(scenario()) == ["A", "B"]
+
+
+def test_failed_batch_fails_every_caller_and_the_batcher_keeps_working():
+    async def flaky(items):
+        if "bad" in items:
+            raise ValueError("model failed")
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(flaky, max_wait_ms=5)
+        outcomes = await asyncio.gather(batcher.submit("bad"), batcher.submit("ok"), return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+        return await batcher.submit("next")
+
+    assert asyncio.run(scenario()) == "next"
+
+
+def test_wrong_result_count_fails_every_caller():
+    async def drops_one(items):
+        return items[:-1]
+
+    async def scenario():
+        batcher = MicroBatcher(drops_one, max_wait_ms=5)
+        submits = asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        return await asyncio.wait_for(submits, 1), batcher.stats()
+
+    outcomes, stats = asyncio.run(scenario())
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert "1 results for 2 items" in str(outcomes[0])
+    assert stats["batches"] == 0
+
+
+def test_cancelled_caller_does_not_affect_the_others():
+    async def slow(items):
+        await asyncio.sleep(0.02)
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(slow, max_wait_ms=5)
+        cancelled = asyncio.create_task(batcher.submit("gone"))
+        kept = asyncio.create_task(batcher.submit("kept"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await kept
+
+    assert asyncio.run(scenario()) == "kept"
+
+
+def test_restarts_on_a_new_event_loop():
+    async def identity(items):
+        return items
+
+    batcher = MicroBatcher(identity, max_wait_ms=1)
+    assert asyncio.run(batcher.submit(1)) == 1
+    assert asyncio.run(batcher.submit(2)) == 2
+    assert batcher.stats()["batches"] == 2
@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+
+from src.utils.persistent_cache import PersistentLRUCache
+
+
+def rows(path, table="cache"):
+    with sqlite3.connect(path) as conn:
+        return {key for (key,) in conn.execute(f"SELECT key FROM {table}")}
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = PersistentLRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    PersistentLRUCache(max_size=10, path=path).put("key", [[1, 2], [0.5, 0.25]])
+    reopened = PersistentLRUCache(max_size=10, path=path)
+    assert reopened.get("key") == [[1, 2], [0.5, 0.25]]
+    assert reopened.stats()["size"] == 1
+
+
+def test_disk_is_trimmed_to_max_size_by_access_time(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = PersistentLRUCache(max_size=3, path=path)
+    for key in "abc":
+        cache.put(key, key)
+    # a memory hit, its access time reaches the disk before the next trim
+    assert cache.get("a") == "a"
+    cache.put("d", "d")
+    assert rows(path) == {"a", "c", "d"}
+    assert cache.stats()["disk_size"] == 3
+    # replacing a key does not grow the file
+    cache.put("d", "d2")
+    assert rows(path) == {"a", "c", "d"}
+
+
+def test_oversized_file_is_trimmed_on_open(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = PersistentLRUCache(max_size=10, path=path)
+    for i in range(10):
+        cache.put(str(i), i)
+    smaller = PersistentLRUCache(max_size=4, path=path)
+    assert rows(path) == {"6", "7", "8", "9"}
+    assert smaller.stats()["disk_size"] == 4
+
+
+def test_old_table_without_access_times_is_migrated(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("INSERT INTO cache VALUES ('old', '1')")
+    cache = PersistentLRUCache(max_size=1, path=path)
+    assert cache.get("old") == 1
+    cache.put("new", 2)
+    assert rows(path) == {"new"}
+
+
+def test_async_access_reads_and_writes_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+
+    async def scenario():
+        cache = PersistentLRUCache(max_size=10, path=path)
+        assert await cache.aget("k") is None
+        await cache.aput("k", {"v": 1})
+        assert await cache.aget("k") == {"v": 1}
+
+    asyncio.run(scenario())
+    assert PersistentLRUCache(max_size=10, path=path).get("k") == {"v": 1}
+
+
+def test_clear_empties_memory_and_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = PersistentLRUCache(max_size=10, path=path)
+    cache.put("a", 1)
+    cache.clear()
+    assert cache.get("a") is None
+    assert rows(path) == set()
@@ -0,0 +1,21 @@
+from src.utils.query_router import GREETING, RAG, QueryRouter
+
+
+def router():
+    return QueryRouter(["tiger", "human-wildlife conflict"])
+
+
+def test_greetings_and_thanks_get_canned_answers():
+    for query in ["Hi there!", "good morning", "how are you doing?", "thanks so much", "what's up bot"]:
+        assert router().route(query).route == GREETING, query
+
+
+def test_follow_ups_made_of_filler_words_go_to_the_rag():
+    # without an embedding check a query with no signal is answered by the RAG
+    for query in ["how much?", "so?", "good", "how are they doing"]:
+        assert router().route(query).route == RAG, query
+
+
+def test_keywords_route_to_rag():
+    assert router().route("How many tigers are left?").reason == "keyword"
+    assert router().route("human wildlife conflict in Kerala").route == RAG
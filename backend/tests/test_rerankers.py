@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from src.utils.rerankers import RerankCascade
+
+
+def scored(*scores):
+    return [NodeWithScore(node=TextNode(text=f"node {i}"), score=s) for i, s in enumerate(scores)]
+
+
+def cascade(margin=0.2):
+    # the margin get_reranker_cascade uses for sigmoid cross-encoder scores
+    return RerankCascade(stages=[], top_n=3, early_exit_margin=margin)
+
+
+def test_clear_gap_in_probability_scores_is_decisive():
+    assert cascade().is_decisive(scored(0.99, 0.97, 0.91, 0.42, 0.08))
+
+
+def test_close_probability_scores_are_not_decisive():
+    assert not cascade().is_decisive(scored(0.99, 0.97, 0.91, 0.85, 0.08))
+
+
+def test_logit_scale_margin_never_exits_on_probability_scores():
+    # the widest gap [0, 1] scores can have is below a logit sized margin
+    assert not cascade(margin=3.0).is_decisive(scored(1.0, 1.0, 1.0, 0.0, 0.0))
+
+
+def test_few_candidates_or_no_margin():
+    assert cascade().is_decisive(scored(0.5, 0.4))
+    assert not cascade(margin=None).is_decisive(scored(0.99, 0.97, 0.91, 0.1))
@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.utils.resilience import CircuitBreaker, CircuitOpenError, ModelClientConfig, ResilientCall
+
+
+def make_call(**overrides) -> ResilientCall:
+    settings = dict(retries=0, backoff_base=0.0, failure_threshold=1, reset_timeout=0.05, probe_timeout=0.1)
+    settings.update(overrides)
+    return ResilientCall("llm:test", ModelClientConfig(**settings), deadline=5.0)
+
+
+def open_circuit(call: ResilientCall) -> None:
+    call.breaker.record_failure()
+    assert call.breaker.state == "open"
+    time.sleep(call.config.reset_timeout)
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.05)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # the probe is still running
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.05)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_stale_probe_is_replaced():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0, probe_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.05)
+    assert breaker.allow()
+
+
+def test_cancelled_probe_frees_the_circuit():
+    call = make_call()
+    open_circuit(call)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.create_task(call.acall(hang))
+        await started.wait()
+        assert call.breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok():
+            return "ok"
+
+        # without releasing the probe this would be rejected with CircuitOpenError
+        return await call.acall(ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert call.breaker.state == "closed"
+
+
+def test_probe_times_out_and_reopens():
+    call = make_call()
+    open_circuit(call)
+
+    async def hang():
+        await asyncio.sleep(60)
+
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(call.acall(hang))
+    # bounded by probe_timeout, not by the 5s deadline
+    assert time.monotonic() - start < 1
+    assert call.breaker.state == "open"
+
+
+def test_retries_transport_errors_then_succeeds():
+    call = make_call(retries=2, failure_threshold=5)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("refused")
+        return "ok"
+
+    assert call.call(flaky) == "ok"
+    assert len(attempts) == 3
+    assert call.breaker.failures == 0
+
+
+def test_open_circuit_uses_fallback_or_rejects():
+    call = make_call()
+    call.breaker.record_failure()
+
+    def unused():
+        raise AssertionError("must not be called while the circuit is open")
+
+    assert call.call(unused, fallback=lambda: "fallback") == "fallback"
+    with pytest.raises(CircuitOpenError):
+        call.call(unused)
+
+
+def test_bad_request_is_not_retried_and_keeps_circuit_closed():
+    call = make_call(retries=3)
+    attempts = []
+
+    def bad():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        call.call(bad)
+    assert len(attempts) == 1
+    assert call.breaker.state == "closed"
+
+
+def test_circuit_opened_mid_retry_keeps_the_upstream_error():
+    call = make_call(retries=3, failure_threshold=2)
+
+    def down():
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(CircuitOpenError) as rejected:
+        call.call(down)
+    assert isinstance(rejected.value.__cause__, httpx.ConnectError)
+    assert "refused" in str(rejected.value)
+    assert call.breaker.state == "open"
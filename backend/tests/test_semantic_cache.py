@@ -0,0 +1,43 @@
+import time
+
+from src.utils.semantic_cache import SemanticCache
+
+
+def test_similar_query_hits_and_dissimilar_misses():
+    cache = SemanticCache(similarity_threshold=0.95)
+    cache.store("where do tigers live", [1.0, 0.0, 0.0], "In forests", version="v1")
+    hit = cache.lookup([0.99, 0.05, 0.0], version="v1")
+    assert hit is not None and hit.answer == "In forests"
+    assert cache.lookup([0.0, 1.0, 0.0], version="v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = SemanticCache(ttl_seconds=0.05)
+    cache.store("q", [1.0, 0.0], "a")
+    assert cache.lookup([1.0, 0.0]) is not None
+    time.sleep(0.06)
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(max_size=2)
+    cache.store("a", [1.0, 0.0, 0.0], "A")
+    cache.store("b", [0.0, 1.0, 0.0], "B")
+    # a is used, b becomes the oldest
+    assert cache.lookup([1.0, 0.0, 0.0]).answer == "A"
+    cache.store("c", [0.0, 0.0, 1.0], "C")
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0]).answer == "A"
+    assert cache.lookup([0.0, 0.0, 1.0]).answer == "C"
+    assert cache.stats()["size"] == 2
+
+
+def test_version_change_drops_every_entry():
+    cache = SemanticCache()
+    cache.store("q", [1.0, 0.0], "old answer", version="v1")
+    assert cache.lookup([1.0, 0.0], version="v2") is None
+    assert cache.stats()["size"] == 0 and cache.stats()["version"] == "v2"
+    cache.store("q", [1.0, 0.0], "new answer", version="v2")
+    assert cache.lookup([1.0, 0.0], version="v2").answer == "new answer"
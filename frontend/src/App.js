@@ -9,6 +9,8 @@ function App() {
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
   const [listening, setListening] = useState(false);
+  // the backend keeps the conversation, later requests only send the new query
+  const [sessionId, setSessionId] = useState(null);
   const recognitionRef = useRef(null);
 
   // Set up speech recognition on mount if supported
@@ -60,17 +62,27 @@ function App() {
     setLoading(true);
     setQuery("");
 
+    const send = (session) => fetch('/api/chat', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ query, sessionId: session, chatHistory: session ? undefined : newMessages })
+    });
+
     try {
-      const res = await fetch('/api/chat', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ query, chatHistory: newMessages })
-      });
+      let res = await send(sessionId);
+      if (res.status === 404 && sessionId) {
+        // the server lost the session (expired or restarted), seed a new one with the full history
+        setSessionId(null);
+        res = await send(null);
+      }
       if (!res.ok) {
         throw new Error(`HTTP error! status: ${res.status}`);
       }
       const data = await res.json();
       console.log("Bot response:", data);
+      if (data.session_id) {
+        setSessionId(data.session_id);
+      }
 
       // Add bot response to state
       setMessages([...newMessages, { text: data.answer, sender: 'bot', research: data.research }]);